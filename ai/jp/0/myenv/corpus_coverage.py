@@ -0,0 +1,187 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_cjk_regex import IPA_MASTER_FILE, MJ_MASTER_FILE
+from jp_subset import DEFAULT_RANGES, JapaneseSubset, parse_ranges, unit_name
+
+# 原稿ディレクトリ全体を走査し、日本語サブセット外の文字を数える。サブセット外のうち、実装したMJ字形が無く
+# 未実装のMJ字形だけが対応する文字は unimplemented-mj として分ける。
+#
+# ファイルを SHARD_SIZE ごとの区間(シャード)に分け、プロセスプールで並列に走査する。各プロセスはファイルを mmap して
+# 担当区間だけを読む。区間の境目は改行の手前に置くので、基底文字とセレクタの組が分かれることはない。
+# 各シャードは {(単位, 理由): [出現数, 初出のバイト位置, 初出の行]} を返し、親プロセスがシャード順に併合する。
+UNIMPLEMENTED_FILE = 'unimplemented_jp_kanji_list.txt'
+DEFAULT_EXTENSIONS = '.txt,.md'
+SHARD_SIZE = 8 * 1024 * 1024
+
+_subset = None
+
+def load_unimplemented(path):
+    """unimplemented_jp_kanji_list.txt から {対応するUCSのコードポイント: [MJ文字図形名]} を作る"""
+    unimplemented = defaultdict(list)
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            next(f)
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                if 1 < len(cols) and cols[1].startswith('U+'):
+                    unimplemented[int(cols[1][2:], 16)].append(cols[0])
+    return dict(unimplemented)
+
+def list_files(paths, extensions):
+    """ファイルはそのまま、ディレクトリは配下の該当拡張子のファイルを名前順に返す"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.endswith(extensions))
+        else:
+            files.append(path)
+    return files
+
+def make_shards(path, shard_size=SHARD_SIZE):
+    """ファイルを改行の手前で区切った (パス, 開始, 終了) に分ける。空のファイルは返さない"""
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    if size <= shard_size:
+        return [(path, 0, size)]
+    shards, start = [], 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while start < size:
+            end = mm.find(b'\n', start + shard_size) if start + shard_size < size else -1
+            end = size if -1 == end else end
+            shards.append((path, start, end))
+            start = end
+    return shards
+
+class ShardReader:
+    """mmap の [start, end) を read(n) で読むファイル風のオブジェクト。読んだ改行の数も数える"""
+    def __init__(self, mm, start, end):
+        self.mm, self.pos, self.end, self.newlines = mm, start, end, 0
+    def read(self, size):
+        data = self.mm[self.pos:min(self.pos + size, self.end)]
+        self.pos += len(data)
+        self.newlines += data.count(b'\n')
+        return data
+    def seekable(self):
+        return False
+
+def init_worker(subset):
+    global _subset
+    _subset = subset
+    _subset.pattern()
+
+def scan_shard(shard):
+    """1シャードを走査し、(パス, 開始, 改行数, {(単位, 理由): [出現数, 相対バイト位置, 相対行]}) を返す"""
+    path, start, end = shard
+    found = {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        reader = ShardReader(mm, start, end)
+        for text, offset, line in _subset.decode(reader):
+            first = {}
+            for key, count in _subset.tally(text, first, found).items():
+                entry = found.get(key)
+                if entry is None:
+                    found[key] = entry = [0, 0, 0]
+                entry[0] += count
+            # バイト位置と行は、このシャードで初めて出た単位についてだけ、位置順に求める
+            pos = 0
+            for key, i in sorted(first.items(), key=lambda f: f[1]):
+                offset += len(text[pos:i].encode('utf-8', 'surrogateescape'))
+                line += text.count('\n', pos, i)
+                pos = i
+                found[key][1:] = offset, line
+    return path, start, reader.newlines, found
+
+def classify(unit, reason, unimplemented):
+    """サブセット外の文字のうち、未実装MJ字形だけが対応するものに併合時に理由を付け直す
+
+    未実装の一覧の文字でも、IPAの一覧にあるもの (実装したMJ字形もあるもの) はサブセット内なので数えない"""
+    if 'not-in-subset' == reason and ord(unit[0]) in unimplemented:
+        return 'unimplemented-mj' if 1 == len(unit) else 'unregistered-sequence'
+    return reason
+
+def merge(results, unimplemented):
+    """シャード順の結果を併合し、{(単位, 理由): [出現数, ファイル数, パス, バイト位置, 行]} を返す"""
+    report, lines, seen = {}, {}, set()
+    for path, start, newlines, found in results:
+        base = lines.get(path, 0)
+        lines[path] = base + newlines
+        for (unit, reason), (count, offset, line) in found.items():
+            key = (unit, classify(unit, reason, unimplemented))
+            entry = report.get(key)
+            if entry is None:
+                report[key] = [count, 1, path, start + offset, base + line]
+            else:
+                entry[0] += count
+                if (key, path) not in seen:
+                    entry[1] += 1
+            seen.add((key, path))
+    return report
+
+def scan_corpus(shards, subset, unimplemented, workers):
+    if workers <= 1:
+        init_worker(subset)
+        return merge(map(scan_shard, shards), unimplemented)
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(subset,)) as pool:
+        # 順序を保って受け取るので、初出はファイル名順・位置順で最初のものになる
+        return merge(pool.map(scan_shard, shards, chunksize=max(1, len(shards) // (workers * 8))), unimplemented)
+
+def write_report(out, report, unimplemented):
+    """出現数の多い順に TSV で書く"""
+    out.write("単位\t文字\t理由\t出現数\tファイル数\t初出ファイル\t初出バイト位置\t初出行\tMJ文字図形名\n")
+    for (unit, reason), (count, files, path, offset, line) in sorted(report.items(), key=lambda kv: (-kv[1][0], kv[0])):
+        char = unit if 'invalid-utf8' != reason else ''
+        mj = ';'.join(unimplemented.get(ord(unit[0]), ())) if 'unimplemented-mj' == reason else ''
+        out.write(f"{unit_name(unit)}\t{char}\t{reason}\t{count}\t{files}\t{path}\t{offset}\t{line}\t{mj}\n")
+
+def main():
+    """メイン処理: 原稿ディレクトリを並列に走査し、文字ごとの出現数と初出位置のレポートを出力する"""
+    parser = argparse.ArgumentParser(description="原稿ディレクトリを並列に走査し、日本語サブセット外の文字と未実装MJ字形の文字を集計します。")
+    parser.add_argument('paths', nargs='+', help='原稿ファイルまたはディレクトリ')
+    parser.add_argument('--ext', default=DEFAULT_EXTENSIONS, help=f'ディレクトリから拾う拡張子 (既定: {DEFAULT_EXTENSIONS})')
+    parser.add_argument('--ipa', default=IPA_MASTER_FILE)
+    parser.add_argument('--mj', default=MJ_MASTER_FILE)
+    parser.add_argument('--unimplemented', default=UNIMPLEMENTED_FILE, help='未実装MJ字形の一覧 (サブセット外の文字の分類に使う。無ければ分類しない)')
+    parser.add_argument('--allow', default='', help="追加で許す範囲 (例: 'U+0391-U+03C9,U+00A9')")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='ワーカープロセス数 (1で並列化しない)')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='1タスクで走査するバイト数の目安')
+    parser.add_argument('--output', help='レポートの出力先 (省略時は標準出力)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ipa):
+        print(f"エラー: {args.ipa} が見つかりません。", file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    subset = JapaneseSubset.load(args.ipa, args.mj, DEFAULT_RANGES + parse_ranges(args.allow))
+    unimplemented = load_unimplemented(args.unimplemented)
+    files = list_files(args.paths, tuple(e.strip() for e in args.ext.split(',') if e.strip()))
+    shards = [s for path in files for s in make_shards(path, args.shard_size)]
+    total_bytes = sum(end - start for _, start, end in shards)
+    print(f"対象: {len(files):,} ファイル / {total_bytes:,} バイト / {len(shards):,} シャード ({(time.perf_counter() - start) * 1000:.0f} ms)", file=sys.stderr)
+
+    start = time.perf_counter()
+    report = scan_corpus(shards, subset, unimplemented, max(1, args.workers))
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            write_report(f, report, unimplemented)
+    else:
+        write_report(sys.stdout, report, unimplemented)
+    counts = defaultdict(int)
+    for (_, reason), entry in report.items():
+        counts[reason] += entry[0]
+    summary = ', '.join(f"{reason} {count:,}" for reason, count in sorted(counts.items())) or 'なし'
+    rate = f" ({total_bytes / elapsed / 1e6:.0f} MB/s)" if elapsed else ''
+    print(f"集計: {len(report):,} 種 ({summary}) / {args.workers} プロセス, {elapsed:.2f} 秒{rate}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import csv
+import hashlib
+import json
+import os
+import struct
+import sys
+
+# docs/*/js のフロントエンド向けに、部首・MJ一覧を小さなバイナリ断片(shard)とJSONマニフェストに変換する。
+#
+# shardの構造 (整数はすべてリトルエンディアン):
+#   b"RBT1" | 行数(u32) | 列ごとに [バイト長(u32) | 列データ]
+# 列データの符号化 (manifest.json の encoding):
+#   varint       : 各値を LEB128 の可変長整数で並べる
+#   zigzag-delta : 前の行との差分を zigzag 変換して varint で並べる
+#   delta-rle    : 前の行との差分(>=0)を (差分, 連続数) の varint の組で並べる
+#   varint-list  : 行ごとに 件数, 値... を varint で並べる
+#   utf8         : 行ごとに バイト長(varint), UTF-8 バイト列 を並べる
+MJ_FILE = 'all_mj_master_ordered.txt'
+RADICAL_FILE = 'radical_master_2026.csv'
+KANGXI_MAPPING_FILE = os.path.join('..', '..', '1', 'kangxi_cjk_supplement_mapping.csv')
+# 生成物なので git では無視する (.gitignore)。ページからは /asset/rbem_tables/manifest.json で読む
+OUTPUT_DIR = os.path.join('..', '..', '..', '..', 'docs', 'asset', 'rbem_tables')
+MAGIC = b'RBT1'
+FORMAT_VERSION = 1
+# MJ一覧はコードポイントの上位ビットごと(4096字単位)に分割し、ページは必要なブロックだけを取得する
+SHARD_BITS = 12
+
+MJ_COLUMNS = [
+    ('cp', 'delta-rle'), ('mj', 'zigzag-delta'), ('status', 'varint'),
+    ('ivs', 'varint'), ('svs', 'varint'),
+    ('radical', 'varint'), ('inner_strokes', 'varint'), ('total_strokes', 'varint'),
+    ('reading', 'utf8'), ('note', 'utf8'),
+]
+# status: 0=実装したUCS, 1=対応するUCSのみ(未実装), 2=UCSなし, 3=実装したIVS/SVSのみ (cp はその基底文字)
+STATUS_IMPLEMENTED, STATUS_CORRESPONDING, STATUS_NONE, STATUS_SEQUENCE = 0, 1, 2, 3
+
+def varint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def encode_column(values, encoding):
+    out = bytearray()
+    if encoding == 'varint':
+        for v in values:
+            varint(v, out)
+    elif encoding == 'zigzag-delta':
+        prev = 0
+        for v in values:
+            d = v - prev
+            varint((d << 1) ^ (d >> 63), out)
+            prev = v
+    elif encoding == 'delta-rle':
+        prev, run_delta, run = 0, None, 0
+        for v in values:
+            d = v - prev
+            prev = v
+            if d == run_delta:
+                run += 1
+                continue
+            if run:
+                varint(run_delta, out)
+                varint(run, out)
+            run_delta, run = d, 1
+        if run:
+            varint(run_delta, out)
+            varint(run, out)
+    elif encoding == 'varint-list':
+        for items in values:
+            varint(len(items), out)
+            for v in items:
+                varint(v, out)
+    elif encoding == 'utf8':
+        for s in values:
+            b = s.encode('utf-8')
+            varint(len(b), out)
+            out += b
+    else:
+        raise ValueError(f"未知の符号化です: {encoding}")
+    return out
+
+def pack_shard(columns, rows):
+    """行(タプル)のリストを列ごとに符号化し、1つのshardバイト列にする"""
+    blob = bytearray(MAGIC)
+    blob += struct.pack('<I', len(rows))
+    for i, (_, encoding) in enumerate(columns):
+        data = encode_column([row[i] for row in rows], encoding)
+        blob += struct.pack('<I', len(data))
+        blob += data
+    return bytes(blob)
+
+def write_shard(out_dir, stem, blob):
+    """内容ハッシュをファイル名に含めて書き出す。内容が変わらなければURLも変わらない"""
+    digest = hashlib.sha1(blob).hexdigest()[:12]
+    name = f"{stem}.{digest}.bin"
+    with open(os.path.join(out_dir, name), 'wb') as f:
+        f.write(blob)
+    return {'file': name, 'bytes': len(blob), 'sha1': digest}
+
+def parse_ucs(value):
+    value = (value or '').strip().split(' ')[0]
+    return int(value[2:], 16) if value.startswith('U+') else None
+
+def parse_selector(value, base):
+    """'3404_E0101' のような異体字シーケンスから、セレクタの base からの番号+1 を返す (無ければ0)"""
+    # 複数登録 ('2B9E4_E0100;535A_E010A') は先頭を代表とする
+    value = (value or '').strip().split(';')[0]
+    if '_' not in value:
+        return None, 0
+    ucs, selector = value.split('_')[:2]
+    return int(ucs, 16), int(selector, 16) - base + 1
+
+def to_int(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else 0
+
+def load_mj_rows(filename):
+    """MJ一覧をコードポイント順の行に変換する"""
+    rows = []
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            ivs_ucs, ivs = parse_selector(row.get('実装したMoji_JohoコレクションIVS'), 0xE0100)
+            svs_ucs, svs = parse_selector(row.get('実装したSVS'), 0xFE00)
+            cp = parse_ucs(row.get('実装したUCS'))
+            status = STATUS_IMPLEMENTED
+            if cp is None and (ivs_ucs or svs_ucs) is not None:
+                cp, status = ivs_ucs or svs_ucs, STATUS_SEQUENCE
+            elif cp is None:
+                cp = parse_ucs(row.get('対応するUCS'))
+                status = STATUS_CORRESPONDING if cp is not None else STATUS_NONE
+            rows.append((
+                cp if cp is not None else 0, int(row['MJ文字図形名'][2:]), status, ivs, svs,
+                to_int(row.get('部首1(参考)')), to_int(row.get('内画数1(参考)')), to_int(row.get('総画数(参考)')),
+                (row.get('読み(参考)') or '').strip(), (row.get('備考') or '').strip(),
+            ))
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return rows
+
+def export_mj(out_dir, filename):
+    shards = {}
+    for row in load_mj_rows(filename):
+        key = 'none' if row[2] == STATUS_NONE else f"{row[0] >> SHARD_BITS:03x}"
+        shards.setdefault(key, []).append(row)
+    entries = []
+    for key, rows in sorted(shards.items()):
+        entry = write_shard(out_dir, f"mj-{key}", pack_shard(MJ_COLUMNS, rows))
+        entry.update({'key': key, 'rows': len(rows)})
+        if key != 'none':
+            entry.update({'cp_min': rows[0][0], 'cp_max': rows[-1][0]})
+        entries.append(entry)
+    return {'columns': [{'name': n, 'encoding': e} for n, e in MJ_COLUMNS], 'shard_bits': SHARD_BITS, 'shards': entries}
+
+def export_radicals(out_dir, filename):
+    columns = [('parent', 'varint'), ('supplements', 'varint-list')]
+    rows = []
+    with open(filename, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in sorted(csv.DictReader(f), key=lambda r: int(r['康熙部首番号'])):
+            parent = parse_ucs(row['常用漢字コード'])
+            supplements = [int(c.strip()[2:], 16) for c in row['CJK部首補助コード'].split(',') if c.strip().startswith('U+')]
+            rows.append((parent or 0, supplements))
+    entry = write_shard(out_dir, 'radical', pack_shard(columns, rows))
+    entry['rows'] = len(rows)
+    # 行番号+1 が康熙部首番号、康熙部首のコードポイントは 0x2F00 + 行番号
+    return {'columns': [{'name': n, 'encoding': e} for n, e in columns], 'kangxi_base': 0x2F00, 'shards': [entry]}
+
+def export_kangxi_mapping(out_dir, filename):
+    columns = [('supplement', 'delta-rle'), ('radical', 'varint')]
+    rows = []
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            rows.append((int(row['cjk_supplement_unicode'][2:], 16), int(row['kangxi_radical_number'])))
+    rows.sort()
+    entry = write_shard(out_dir, 'kangxi-supplement', pack_shard(columns, rows))
+    entry['rows'] = len(rows)
+    return {'columns': [{'name': n, 'encoding': e} for n, e in columns], 'shards': [entry]}
+
+def main():
+    """メイン処理: フロントエンド向けのshardとmanifest.jsonを出力する"""
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else OUTPUT_DIR
+    sources = [('mj', MJ_FILE, export_mj), ('radical', RADICAL_FILE, export_radicals), ('kangxi_supplement', KANGXI_MAPPING_FILE, export_kangxi_mapping)]
+    os.makedirs(out_dir, exist_ok=True)
+    # 古いshardが残らないよう、前回の出力を消してから書き出す
+    for name in os.listdir(out_dir):
+        if name.endswith('.bin') or name == 'manifest.json':
+            os.remove(os.path.join(out_dir, name))
+
+    manifest = {'format': FORMAT_VERSION, 'magic': MAGIC.decode('ascii'), 'tables': {}}
+    for table, filename, export in sources:
+        if not os.path.exists(filename):
+            print(f"警告: {filename} が見つからないため '{table}' を出力しません。", file=sys.stderr)
+            continue
+        manifest['tables'][table] = export(out_dir, filename)
+        total = sum(s['bytes'] for s in manifest['tables'][table]['shards'])
+        print(f"{table}: {os.path.getsize(filename):,} bytes -> {len(manifest['tables'][table]['shards'])} shard / {total:,} bytes")
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"完了！ 出力先: {out_dir}/manifest.json")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+# rbem-fast.js のパイプ省略形で親文字として扱う文字を、MJ実装済み漢字から正規表現の文字クラスとして生成する
+IPA_MASTER_FILE = 'jp_kanji_ipa_master.txt'
+MJ_MASTER_FILE = 'all_mj_master_ordered.txt'
+# 現行の手書きクラス [一-龠〇々〆ヶヵ仝〻〼ヿ] のうち漢字以外の文字(踊り字・略字など)は引き続き含める
+EXTRA_CHARS = '〇々〆ヶヵ仝〻〼ヿ'
+CURRENT_CLASS = '[一-龠〇々〆ヶヵ仝〻〼ヿ]'
+# CJK統合漢字・互換漢字のブロック。区間同士の隙間がすべてこの中にあれば、隙間を埋めても漢字以外には一致しない
+HAN_BLOCKS = [
+    (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF),
+    (0x20000, 0x2A6DF), (0x2A700, 0x2B73F), (0x2B740, 0x2B81F), (0x2B820, 0x2CEAF),
+    (0x2CEB0, 0x2EBEF), (0x2EBF0, 0x2EE5F), (0x2F800, 0x2FA1F), (0x30000, 0x3134F), (0x31350, 0x323AF),
+]
+
+def load_code_points(ipa_file, mj_file):
+    """実装済みUCSと、IVS/SVSの基底文字を集め、(基底文字の集合, セレクタの集合) を返す"""
+    bases, selectors = set(), set()
+    with open(ipa_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            for seq in line.split():
+                parts = seq.replace('U+', '').split('_')
+                bases.add(int(parts[0], 16))
+                selectors.update(int(p, 16) for p in parts[1:])
+    if mj_file and os.path.exists(mj_file):
+        with open(mj_file, 'r', encoding='utf-8') as f:
+            next(f)
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                # 実装したMoji_JohoコレクションIVS, 実装したSVS (例: 3404_E0101;535A_E010A)
+                for value in cols[2:4]:
+                    for seq in value.split(';'):
+                        if '_' in seq:
+                            base, selector = seq.split('_')[:2]
+                            bases.add(int(base, 16))
+                            selectors.add(int(selector, 16))
+    bases.update(ord(c) for c in EXTRA_CHARS)
+    return bases, selectors
+
+def to_ranges(code_points):
+    """ソート済みコードポイントを連続区間 [(開始, 終了)] の最小集合にまとめる"""
+    ranges = []
+    for cp in sorted(code_points):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return [tuple(r) for r in ranges]
+
+def coalesce_han(ranges):
+    """同じ漢字ブロック内で隣り合う区間を1つにまとめ、区間数(=正規表現の大きさと照合コスト)を減らす"""
+    def block_of(cp):
+        for i, (start, end) in enumerate(HAN_BLOCKS):
+            if start <= cp <= end:
+                return i
+        return None
+    merged = []
+    for start, end in ranges:
+        if merged:
+            prev_start, prev_end = merged[-1]
+            block = block_of(prev_end)
+            if block is not None and block == block_of(start):
+                merged[-1] = (prev_start, end)
+                continue
+        merged.append((start, end))
+    return merged
+
+def escape(cp, flavor):
+    if flavor == 'js':
+        return f"\\u{cp:04X}" if cp <= 0xFFFF else f"\\u{{{cp:X}}}"
+    return f"\\u{cp:04X}" if cp <= 0xFFFF else f"\\U{cp:08X}"
+
+def to_class(ranges, flavor):
+    """区間を文字クラスの文字列にする。2字の区間は範囲指定にせず並べた方が短い"""
+    parts = []
+    for start, end in ranges:
+        if start == end:
+            parts.append(escape(start, flavor))
+        elif end == start + 1:
+            parts.append(escape(start, flavor) + escape(end, flavor))
+        else:
+            parts.append(f"{escape(start, flavor)}-{escape(end, flavor)}")
+    return f"[{''.join(parts)}]"
+
+def to_sequence(base_class, selector_class):
+    """異体字セレクタ(IVS/SVS)付きの文字を1字として扱う、親文字列のパターン"""
+    return f"(?:{base_class}{selector_class}?)+" if selector_class != '[]' else f"{base_class}+"
+
+def write_js_module(filename, base_class, selector_class, sequence, stats):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write("// このファイルは ai/jp/0/myenv/generate_cjk_regex.py が生成したものです。手で編集しないでください。\n")
+        f.write(f"// 基底文字 {stats['bases']} 字 / {stats['ranges']} 区間、異体字セレクタ {stats['selectors']} 種\n")
+        f.write("// 補助面(拡張B以降)を含むため、uフラグを付けたRegExpで使ってください。\n")
+        f.write(f"export const CJK_CLASS = '{base_class}';\n")
+        f.write(f"export const VARIATION_SELECTOR_CLASS = '{selector_class}';\n")
+        f.write(f"export const CJK_SEQUENCE = '{sequence}';\n")
+
+def measure(label, pattern, text, repeat=5):
+    """パターンのコンパイル時間と照合時間(repeat回の最良値)を標準エラーに表示する"""
+    start = time.perf_counter()
+    regex = re.compile(pattern)
+    compile_ms = (time.perf_counter() - start) * 1000
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in regex.finditer(text))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label}: コンパイル {compile_ms:.1f} ms / 照合 {best * 1000:.1f} ms ({len(text):,} 字, {count} 件一致)", file=sys.stderr)
+
+def main():
+    """メイン処理: MJ実装済み漢字から文字クラスを生成し、サイズと照合時間を報告する"""
+    parser = argparse.ArgumentParser(description="MJ実装済み漢字からrbem用の文字クラスを生成します。")
+    parser.add_argument('--ipa', default=IPA_MASTER_FILE)
+    parser.add_argument('--mj', default=MJ_MASTER_FILE, help='IVS/SVSの基底文字とセレクタの取得元 (無ければ省略)')
+    parser.add_argument('--flavor', choices=('js', 'python'), default='js')
+    parser.add_argument('--exact', action='store_true', help='漢字ブロック内の隙間を埋めず、MJ実装済みの字だけに一致させる')
+    parser.add_argument('--output', help='生成したJSモジュールの出力先 (省略時は標準出力にパターンを表示)')
+    parser.add_argument('--bench', help='照合時間の計測に使う原稿テキスト (省略時は合成テキスト)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ipa):
+        print(f"エラー: {args.ipa} が見つかりません。", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    bases, selectors = load_code_points(args.ipa, args.mj)
+    exact_ranges, selector_ranges = to_ranges(bases), to_ranges(selectors)
+    base_ranges = exact_ranges if args.exact else coalesce_han(exact_ranges)
+    base_class = to_class(base_ranges, args.flavor)
+    selector_class = to_class(selector_ranges, args.flavor)
+    sequence = to_sequence(base_class, selector_class)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    stats = {'bases': len(bases), 'ranges': len(base_ranges), 'selectors': len(selectors)}
+
+    print(f"生成時間: {elapsed_ms:.1f} ms", file=sys.stderr)
+    print(f"基底文字: {len(bases)} 字 -> 最小 {len(exact_ranges)} 区間 / 出力 {len(base_ranges)} 区間 (文字クラス {len(base_class):,} バイト)", file=sys.stderr)
+    print(f"異体字セレクタ: {len(selectors)} 種 -> {len(selector_ranges)} 区間", file=sys.stderr)
+    print(f"親文字パターン: {len(sequence):,} バイト (現行 {CURRENT_CLASS}+ は {len(CURRENT_CLASS) + 1} 字)", file=sys.stderr)
+    if args.output:
+        write_js_module(args.output, base_class, selector_class, sequence, stats)
+        print(f"出力ファイル: {args.output}", file=sys.stderr)
+    else:
+        print(sequence)
+
+    # 照合時間は Python の re で比較する (JSエンジンでも傾向は同じ)
+    if args.bench:
+        with open(args.bench, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        sample = ''.join(chr(cp) for cp in sorted(bases)[::50])
+        text = (sample + 'ひらがなとカタカナ、ASCII text. ') * 200
+    print("照合時間:", file=sys.stderr)
+    measure("現行クラス", f"{CURRENT_CLASS}+", text)
+    measure("生成クラス", to_sequence(to_class(base_ranges, 'python'), to_class(selector_ranges, 'python')), text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import argparse
+import codecs
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+
+from generate_cjk_regex import IPA_MASTER_FILE, MJ_MASTER_FILE, EXTRA_CHARS, to_ranges, to_class
+
+# 日本語サブセット(MJ実装済み漢字 + かな・句読点など)に含まれない文字を、UTF-8の原稿から探す。
+#
+# 所属判定は 0x0000-0x3FFFF (BMP・SIP・TIP) のビットマップで行い、大量のテキストは
+# ビットマップから生成した「BMPのサブセット外の文字」の正規表現で走査する (1文字ずつの判定を re のC実装に任せる)。
+# re はBMPの文字クラスを表引きで判定するが、補助面は範囲の並びを先頭から調べるため (SIPの漢字は数千区間になる)、
+# 補助面の文字はすべて正規表現に一致させ、ビットマップで確かめる。
+# 異体字セレクタ(SVS: FE00-FE0F, IVS: E0100-E01EF)は直前の基底文字と組にして1字として扱い、
+# MJに登録された組だけを許す。
+
+# 漢字以外に許す範囲 (両端を含む)
+DEFAULT_RANGES = [
+    (0x09, 0x0A), (0x0D, 0x0D),  # タブ・改行
+    (0x20, 0x7E),                # ASCII 印字可能文字
+    (0xA7, 0xA8), (0xB0, 0xB1), (0xB4, 0xB4), (0xB6, 0xB6), (0xD7, 0xD7), (0xF7, 0xF7),  # JIS X 0208 の記号
+    (0x2010, 0x2026), (0x2030, 0x203B),  # ダッシュ・引用符・…・‰・※
+    (0x2190, 0x2193), (0x25A0, 0x25FF), (0x2605, 0x2606), (0x2640, 0x2640), (0x2642, 0x2642), (0x266A, 0x266F),
+    (0x3000, 0x303F),            # CJKの記号及び句読点 (、。「」々〆〇 など)
+    (0x3041, 0x3096), (0x3099, 0x309F),  # ひらがな
+    (0x30A0, 0x30FF),            # カタカナ
+    (0x31F0, 0x31FF),            # カタカナ拡張 (アイヌ語の小書き)
+    (0xFF01, 0xFF9F),            # 全角英数記号・半角カナ
+    (0xFFE0, 0xFFE6),            # 全角の ¢£¬￣¦¥₩
+]
+MAX_CODE_POINT = 0x3FFFF
+CHUNK_SIZE = 512 * 1024  # L2キャッシュに収まる大きさの方が速い
+
+# reason: 'not-in-subset' サブセット外の文字 / 'unregistered-sequence' MJに無い基底文字+セレクタの組
+#         'orphan-selector' 基底文字の無いセレクタ / 'invalid-utf8' UTF-8として不正なバイト
+Violation = namedtuple('Violation', 'offset line unit reason')
+
+SELECTOR_RE = re.compile('[\uFE00-\uFE0F\U000E0100-\U000E01EF]')
+
+def is_selector(cp):
+    return 0xFE00 <= cp <= 0xFE0F or 0xE0100 <= cp <= 0xE01EF
+
+def parse_ranges(text):
+    """'U+0391-U+03C9,U+00A9' のような指定を [(開始, 終了)] にする"""
+    ranges = []
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        start, _, end = part.partition('-')
+        start = int(start.upper().removeprefix('U+'), 16)
+        ranges.append((start, int(end.upper().removeprefix('U+'), 16) if end else start))
+    return ranges
+
+def unit_name(unit):
+    return '_'.join(f'U+{ord(c):04X}' for c in unit)
+
+class JapaneseSubset:
+    """日本語サブセットの所属判定。単独の文字はビットマップ、異体字の組は集合で持つ"""
+    def __init__(self, code_points=(), sequences=(), ranges=DEFAULT_RANGES):
+        self.bitmap = bytearray((MAX_CODE_POINT + 8) // 8)
+        self.sequences = set(sequences)  # 基底文字とセレクタの2文字の文字列
+        for cp in code_points:
+            self.add(cp)
+        for start, end in ranges:
+            for cp in range(start, end + 1):
+                self.add(cp)
+        self._pattern = None
+        self._ascii = None
+    @classmethod
+    def load(cls, ipa_file=IPA_MASTER_FILE, mj_file=MJ_MASTER_FILE, ranges=DEFAULT_RANGES):
+        """jp_kanji_ipa_master.txt (と all_mj_master_ordered.txt の実装したUCS・IVS・SVS) から作る"""
+        code_points, sequences = set(ord(c) for c in EXTRA_CHARS), set()
+        with open(ipa_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                for seq in line.split():
+                    parts = [int(p, 16) for p in seq.replace('U+', '').split('_')]
+                    code_points.add(parts[0])
+                    if 2 == len(parts):
+                        sequences.add(chr(parts[0]) + chr(parts[1]))
+        if mj_file and os.path.exists(mj_file):
+            with open(mj_file, 'r', encoding='utf-8') as f:
+                next(f)
+                for line in f:
+                    cols = line.rstrip('\n').split('\t')
+                    if cols[1].startswith('U+'):
+                        code_points.add(int(cols[1][2:], 16))
+                    # 実装したMoji_JohoコレクションIVS, 実装したSVS (例: 3404_E0101;535A_E010A)
+                    for value in cols[2:4]:
+                        for seq in value.split(';'):
+                            if '_' in seq:
+                                base, selector = seq.split('_')[:2]
+                                sequences.add(chr(int(base, 16)) + chr(int(selector, 16)))
+        return cls(code_points, sequences, ranges)
+    def add(self, cp):
+        if cp <= MAX_CODE_POINT:
+            self.bitmap[cp >> 3] |= 1 << (cp & 7)
+    def discard(self, cp):
+        if cp <= MAX_CODE_POINT:
+            self.bitmap[cp >> 3] &= ~(1 << (cp & 7)) & 0xFF
+            self._pattern = self._ascii = None
+    def __contains__(self, cp):
+        return cp <= MAX_CODE_POINT and bool(self.bitmap[cp >> 3] & (1 << (cp & 7)))
+    def code_points(self):
+        bitmap = self.bitmap
+        return [i * 8 + bit for i, byte in enumerate(bitmap) if byte for bit in range(8) if byte & (1 << bit)]
+    def pattern(self):
+        """BMPのサブセット外の文字、すべての異体字セレクタ、すべての補助面の文字に一致する正規表現"""
+        if self._pattern is None:
+            allowed = to_class(to_ranges(cp for cp in self.code_points() if cp <= 0xFFFF and not is_selector(cp)), 'python')
+            self._pattern = re.compile(f'[^{allowed[1:-1]}]')
+        return self._pattern
+    def scan(self, text):
+        """text 内の違反を (位置, 単位, 理由) で返す。単位は1文字、または基底文字+セレクタの2文字"""
+        # ASCIIだけの文字列 (isascii は O(1)) は、許すバイトを消して何も残らなければ違反なし
+        if text.isascii():
+            if self._ascii is None:
+                self._ascii = bytes(cp for cp in range(128) if cp in self)
+            if not text.encode('ascii').translate(None, self._ascii):
+                return
+        prev = -2
+        for m in self.pattern().finditer(text):
+            i = m.start()
+            c = text[i]
+            cp = ord(c)
+            if 0xFFFF < cp and cp in self:
+                continue
+            if is_selector(cp):
+                if 0 == i or is_selector(ord(text[i - 1])):
+                    yield i, c, 'orphan-selector'
+                elif text[i - 1:i + 1] not in self.sequences:
+                    # 基底文字がサブセット外なら、直前に報告した1字を組に置き換える
+                    yield (i - 1, text[i - 1:i + 1], 'unregistered-sequence' if prev != i - 1 else 'not-in-subset')
+                prev = i
+                continue
+            # 基底文字のすぐ後にセレクタが続く場合は組として上で報告する
+            if i + 1 < len(text) and is_selector(ord(text[i + 1])):
+                prev = i
+                continue
+            yield i, c, 'invalid-utf8' if 0xDC80 <= cp <= 0xDCFF else 'not-in-subset'
+            prev = i
+    def tally(self, text, first=None, seen=()):
+        """text 内の違反を {(単位, 理由): 件数} で数える。scan と同じ結果を、1字ずつの判定も数えるのも re と Counter に任せて求める
+
+        first に dict を渡すと、seen に無い単位について、数えた出現のうち最初のものの位置 (text 内の字の位置) を入れる"""
+        if text.isascii():
+            if self._ascii is None:
+                self._ascii = bytes(cp for cp in range(128) if cp in self)
+            if not text.encode('ascii').translate(None, self._ascii):
+                return Counter()
+        tally = Counter()
+        for c, n in Counter(self.pattern().findall(text)).items():
+            cp = ord(c)
+            if not is_selector(cp) and cp not in self:
+                tally[(c, 'invalid-utf8' if 0xDC80 <= cp <= 0xDCFF else 'not-in-subset')] = n
+        # セレクタ(通常はまれ)の箇所だけ、直前の字と組にして数え直す
+        positions = {} if first is not None else None
+        paired = set()
+        for m in SELECTOR_RE.finditer(text):
+            i = m.start()
+            if 0 == i or is_selector(ord(text[i - 1])):
+                key, pos = (text[i], 'orphan-selector'), i
+            else:
+                base, pair = text[i - 1], text[i - 1:i + 1]
+                if ord(base) not in self:
+                    tally[(base, 'invalid-utf8' if 0xDC80 <= ord(base) <= 0xDCFF else 'not-in-subset')] -= 1
+                    paired.add(i - 1)
+                    if pair in self.sequences:
+                        continue
+                    key = (pair, 'not-in-subset')
+                elif pair not in self.sequences:
+                    key = (pair, 'unregistered-sequence')
+                else:
+                    continue
+                pos = i - 1
+            tally[key] += 1
+            if positions is not None:
+                positions.setdefault(key, pos)
+        tally = +tally
+        if first is not None:
+            for key in tally:
+                if key in seen:
+                    continue
+                if key in positions:
+                    first[key] = positions[key]
+                    continue
+                # 1字の単位は、直後のセレクタと組にして数え直した出現を飛ばす
+                i = text.find(key[0])
+                while i in paired:
+                    i = text.find(key[0], i + 1)
+                first[key] = i
+        return tally
+    def decode(self, stream, chunk_size=CHUNK_SIZE):
+        """UTF-8のバイナリストリームを chunk_size ずつ読み、(文字列, 先頭のバイト位置, 先頭の行番号) を返す
+
+        不正なバイトは surrogateescape で1字ずつの代理文字にする。基底文字とセレクタが
+        チャンクの境目で分かれないよう、チャンクの最後の字は(セレクタでなければ)次のチャンクに回す。"""
+        decoder = codecs.getincrementaldecoder('utf-8')('surrogateescape')
+        carry, start, consumed, line = '', 0, 0, 1
+        while True:
+            data = stream.read(chunk_size)
+            consumed += len(data)
+            text = carry + decoder.decode(data, final=not data)
+            if data and text and not is_selector(ord(text[-1])):
+                text, carry = text[:-1], text[-1]
+            else:
+                carry = ''
+            yield text, start, line
+            line += text.count('\n')
+            # 次のチャンクの先頭 = 読んだバイト数 - デコーダが保留しているバイト数 - 次に回した字のバイト数
+            start = consumed - len(decoder.getstate()[0]) - len(carry.encode('utf-8', 'surrogateescape'))
+            if not data:
+                return
+    def validate(self, stream, chunk_size=CHUNK_SIZE):
+        """UTF-8のバイナリストリームの違反を Violation(バイト位置, 行番号, 単位, 理由) で返す"""
+        for text, offset, line in self.decode(stream, chunk_size):
+            # 違反の手前だけを符号化し直してバイト位置を求める (チャンク全体は符号化しない)
+            pos = 0
+            for i, unit, reason in self.scan(text):
+                offset += len(text[pos:i].encode('utf-8', 'surrogateescape'))
+                line += text.count('\n', pos, i)
+                pos = i
+                yield Violation(offset, line, unit, reason)
+
+def main():
+    """メイン処理: 原稿を検証し、サブセット外の文字を 位置・行・コードポイント・文字・理由 のTSVで表示する"""
+    parser = argparse.ArgumentParser(description="UTF-8の原稿に、日本語サブセット(MJ実装済み漢字・かな・句読点)外の文字が無いか検証します。")
+    parser.add_argument('files', nargs='*', help='原稿ファイル (省略時は標準入力)')
+    parser.add_argument('--ipa', default=IPA_MASTER_FILE)
+    parser.add_argument('--mj', default=MJ_MASTER_FILE, help='IVS/SVSの組の取得元 (無ければ組はすべて違反)')
+    parser.add_argument('--allow', default='', help="追加で許す範囲 (例: 'U+0391-U+03C9,U+00A9')")
+    parser.add_argument('--max', type=int, default=0, help='1ファイルあたりの表示件数の上限 (0で無制限)')
+    parser.add_argument('--quiet', action='store_true', help='違反を表示せず、件数だけを表示する')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ipa):
+        print(f"エラー: {args.ipa} が見つかりません。", file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    subset = JapaneseSubset.load(args.ipa, args.mj, DEFAULT_RANGES + parse_ranges(args.allow))
+    subset.pattern()
+    print(f"サブセット: {len(subset.code_points()):,} 字、異体字の組 {len(subset.sequences):,} 件 ({(time.perf_counter() - start) * 1000:.0f} ms)", file=sys.stderr)
+
+    total, total_bytes, start = 0, 0, time.perf_counter()
+    out = sys.stdout
+    for path in args.files or ['-']:
+        count = 0
+        with (open(path, 'rb') if '-' != path else sys.stdin.buffer) as f:
+            for v in subset.validate(f):
+                count += 1
+                if not args.quiet and (not args.max or count <= args.max):
+                    out.write(f"{path}\t{v.offset}\t{v.line}\t{unit_name(v.unit)}\t{v.unit if 'invalid-utf8' != v.reason else ''}\t{v.reason}\n")
+            total_bytes += f.tell() if f.seekable() else 0
+        total += count
+        if count:
+            print(f"{path}: {count} 件", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    rate = f" ({total_bytes / elapsed / 1e6:.0f} MB/s)" if total_bytes and elapsed else ''
+    print(f"違反: {total} 件 / {total_bytes:,} バイト, {elapsed:.2f} 秒{rate}", file=sys.stderr)
+    sys.exit(1 if total else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import io
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+
+from generate_cjk_regex import MJ_MASTER_FILE
+from jp_subset import is_selector
+
+# integrate_kanji_attributes_v2.py の NewCode (MJ文字図形名順の連番 + オフセット) でテキストを符号化・復号する。
+#
+# 符号化: UCS 1字は str.translate、基底文字+セレクタ(IVS/SVS)の組は辞書で NewCode 1字にする。
+# 復号: NewCode 1字を、その字形の正規形(実装したUCS、無ければ最初のIVS)に戻す。
+# 互換漢字・SVS・IVS など同じ字形を指す表記はすべて同じ NewCode になるので、復号結果は正規形にそろう。
+# ただし UCS 1字に戻すと直後のセレクタと登録済みの組になってしまう NewCode は、IVSの表記に戻す。
+# translate の表は dict ではなくコードポイントで引くリストにする (表に無い字で KeyError を起こさないので約2倍速い)。
+CHARSET_FILE = 'japanese_exclusive_charset_v1.txt'
+DEFAULT_OFFSET = 0xF0000  # 補助私用面A (U+F0000-U+FFFFD) に全字形 (約5.9万) が収まる
+PRIVATE_USE = ((0xE000, 0xF8FF), (0xF0000, 0xFFFFD), (0x100000, 0x10FFFD))
+FUZZ_COUNT = 3000
+CHUNK_SIZE = 256 * 1024   # 文字数
+SELECTORS = '\uFE00-\uFE0F\U000E0100-\U000E01EF'
+SELECTOR_RE = re.compile(f'[{SELECTORS}]')
+PAIR_RE = re.compile(f'[^{SELECTORS}][{SELECTORS}]', re.DOTALL)
+
+# code: NewCode / ucs: 実装したUCS (無ければ None) / sequences: 実装したIVS・SVS の2文字の文字列
+Glyph = namedtuple('Glyph', 'code mj ucs sequences')
+
+def parse_offset(text):
+    """'0xF0000' や '983040' をオフセットにする (integrate_kanji_attributes_v2.py と同じ書式)"""
+    offset = int(text, 16) if text.lower().startswith('0x') else int(text)
+    if offset < 0:
+        raise ValueError(text)
+    return offset
+
+def parse_sequences(*values):
+    """'3404_E0101;535A_E010A' のような列から ['㐄\U000E0101', ...] を作る"""
+    return [''.join(chr(int(p, 16)) for p in seq.split('_')[:2]) for value in values for seq in value.split(';') if '_' in seq]
+
+def load_glyphs(charset_file=CHARSET_FILE, mj_file=MJ_MASTER_FILE, offset=None):
+    """japanese_exclusive_charset_v1.txt の NewCode_Hex を NewCode とする (無ければ all_mj_master_ordered.txt の行番号 + offset)
+
+    NewCode_Hex が私用領域に無い charset (integrate_kanji_attributes_v2.py の既定のオフセット 0 では ASCII と重なる) は
+    ValueError にする。offset を指定した時は NewCode_Hex が行番号 + offset であることを確かめる"""
+    glyphs = []
+    path = charset_file if charset_file and os.path.exists(charset_file) else mj_file
+    with open(path, 'r', encoding='utf-8') as f:
+        header = next(f).rstrip('\n').split('\t')
+        col = {name: header.index(name) for name in header}
+        for i, line in enumerate(f):
+            cols = line.rstrip('\n').split('\t')
+            if 'NewCode_Hex' in col:
+                code = int(cols[col['NewCode_Hex']], 16)
+                if offset is not None and code != offset + i:
+                    raise ValueError(f"{path} の NewCode_Hex (0x{code - i:X} から) が --offset 0x{offset:X} と違います。"
+                                     f"integrate_kanji_attributes_v2.py 0x{offset:X} で作り直してください")
+            else:
+                code = (DEFAULT_OFFSET if offset is None else offset) + i
+            ucs = cols[col['実装したUCS']]
+            glyphs.append(Glyph(code, cols[col['MJ文字図形名']], int(ucs[2:], 16) if ucs.startswith('U+') else None,
+                                parse_sequences(cols[col['実装したMoji_JohoコレクションIVS']], cols[col['実装したSVS']])))
+    if glyphs and 'NewCode_Hex' in col and offset is None:
+        first, last = min(g.code for g in glyphs), max(g.code for g in glyphs)
+        if not any(start <= first and last <= end for start, end in PRIVATE_USE):
+            raise ValueError(f"{path} の NewCode_Hex (0x{first:04X} - 0x{last:04X}) が私用領域にありません。"
+                             f"integrate_kanji_attributes_v2.py 0x{DEFAULT_OFFSET:X} で作り直し、同じ値を --offset に指定してください")
+    return glyphs
+
+class NewCodeCodec:
+    """UCS・UCS+IVS・UCS+SVS と NewCode の相互変換"""
+    def __init__(self, glyphs):
+        first, last = min(g.code for g in glyphs), max(g.code for g in glyphs)
+        if not any(start <= first and last <= end for start, end in PRIVATE_USE):
+            raise ValueError(f"NewCode (0x{first:04X} - 0x{last:04X}) が私用領域に収まりません。オフセットを見直してください (既定: 0x{DEFAULT_OFFSET:X})")
+        self.encode_table = list(range(0x40000))
+        self.decode_table = list(range(last + 1))
+        for g in glyphs:
+            if g.ucs is not None:
+                self.encode_table[g.ucs] = g.code
+        # 組の基底文字は先に translate されるので、変換後の基底文字 + セレクタで引く
+        self.sequences = {}
+        self.before_selector = {}
+        self.unrepresentable = 0
+        for g in glyphs:
+            for seq in g.sequences:
+                self.sequences[seq[0].translate(self.encode_table) + seq[1]] = chr(g.code)
+            if g.sequences:
+                self.before_selector[chr(g.code)] = g.sequences[0]
+            if g.ucs is not None:
+                self.decode_table[g.code] = g.ucs
+            elif g.sequences:
+                self.decode_table[g.code] = g.sequences[0]
+            else:
+                self.unrepresentable += 1  # 実装したUCSもIVSも無い字形は NewCode のまま残す
+        self.glyphs = glyphs
+        # 原文に NewCode の範囲の字があると復号で区別できない
+        self.reserved_re = re.compile(f'[{re.escape(chr(first))}-{re.escape(chr(last))}]')
+        self.code_before_selector_re = re.compile(f'({self.reserved_re.pattern})(?=([{SELECTORS}]))')
+    @classmethod
+    def load(cls, charset_file=CHARSET_FILE, mj_file=MJ_MASTER_FILE, offset=None):
+        return cls(load_glyphs(charset_file, mj_file, offset))
+    def _pair(self, m):
+        return self.sequences.get(m[0], m[0])
+    def encode(self, text):
+        m = self.reserved_re.search(text)
+        if m:
+            raise ValueError(f"NewCodeの範囲の文字 U+{ord(m[0]):04X} が含まれています (位置 {m.start()})")
+        text = text.translate(self.encode_table)
+        # セレクタはまれなので、含む時だけ組を置き換える
+        return PAIR_RE.sub(self._pair, text) if SELECTOR_RE.search(text) else text
+    def _before_selector(self, m):
+        return self.before_selector.get(m[1], m[1]) if m[1] + m[2] in self.sequences else m[1]
+    def decode(self, text):
+        if SELECTOR_RE.search(text):
+            text = self.code_before_selector_re.sub(self._before_selector, text)
+        return text.translate(self.decode_table)
+    def _convert_stream(self, convert, src, dst, chunk_size):
+        """テキストストリームを chunk_size 字ずつ変換する。基底文字とセレクタが分かれないよう、
+        チャンクの最後の字は(セレクタでなければ)次のチャンクに回す。読んだ文字数を返す"""
+        carry, total = '', 0
+        while True:
+            data = src.read(chunk_size)
+            total += len(data)
+            text = carry + data
+            if data and text and not is_selector(ord(text[-1])):
+                text, carry = text[:-1], text[-1]
+            else:
+                carry = ''
+            dst.write(convert(text))
+            if not data:
+                return total
+    def encode_stream(self, src, dst, chunk_size=CHUNK_SIZE):
+        return self._convert_stream(self.encode, src, dst, chunk_size)
+    def decode_stream(self, src, dst, chunk_size=CHUNK_SIZE):
+        return self._convert_stream(self.decode, src, dst, chunk_size)
+    def verify(self):
+        """全字形の全表記について、符号化すると NewCode 1字になり、復号すると正規形になり、
+        NewCode を復号して符号化し直すと元の NewCode に戻ることを確かめ、失敗した (MJ文字図形名, 表記) を返す"""
+        failures = []
+        for g in self.glyphs:
+            code = chr(g.code)
+            canonical = self.decode(code)
+            if canonical == code:
+                continue
+            for form in ([chr(g.ucs)] if g.ucs is not None else []) + g.sequences:
+                if self.encode(form) != code or self.decode(self.encode(form)) != canonical:
+                    failures.append((g.mj, form))
+            if self.encode(canonical) != code:
+                failures.append((g.mj, canonical))
+        return failures
+    def fuzz(self, count=FUZZ_COUNT, seed=0):
+        """字形の各表記・ASCII・かな・絵文字・孤立したセレクタを混ぜた文字列を count 個作り、1-7字ずつのストリーム変換が
+        一括変換と一致し、復号して符号化し直すと元に戻ることを確かめ、失敗した文字列を返す"""
+        rng = random.Random(seed)
+        forms = []
+        for g in rng.sample(self.glyphs, min(200, len(self.glyphs))):
+            forms += ([chr(g.ucs)] if g.ucs is not None else []) + g.sequences
+        forms += list('aあ\n\r、Ω\U0001F600') + ['\uFE00', '\U000E0100', 'あ\U000E0100']
+        failures = []
+        for _ in range(count):
+            text = ''.join(rng.choice(forms) for _ in range(rng.randint(0, 20)))
+            encoded = self.encode(text)
+            decoded = self.decode(encoded)
+            ok = self.encode(decoded) == encoded
+            for chunk_size in (1, 2, 3, 7):
+                for stream, src, expected in ((self.encode_stream, text, encoded), (self.decode_stream, encoded, decoded)):
+                    out = io.StringIO(newline='')
+                    stream(io.StringIO(src, newline=''), out, chunk_size)
+                    ok = ok and out.getvalue() == expected
+            if not ok:
+                failures.append(text)
+        return failures
+    def count_noncanonical(self, text):
+        """復号で正規形に変わる表記の数を、符号化の単位 (1字、または基底文字+セレクタの組) ごとに数える"""
+        counts = Counter(text)
+        if SELECTOR_RE.search(text):
+            for pair, n in Counter(PAIR_RE.findall(text)).items():
+                counts[pair[0]] -= n
+                counts[pair[1]] -= n
+                counts[pair] += n
+        return sum(n for unit, n in counts.items() if n and self.decode(self.encode(unit)) != unit)
+
+class _Sink:
+    """書き込んだ文字数だけを数える出力先 (計測用)"""
+    def __init__(self):
+        self.size = 0
+    def write(self, text):
+        self.size += len(text)
+
+def measure(label, func, size, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label}: {best * 1000:.0f} ms ({size / best / 1e6:.0f} MB/s)", file=sys.stderr)
+    return result
+
+def main():
+    """メイン処理: テキストを NewCode に符号化・復号する。verify は表の往復検査と、原稿での往復・計測を行う"""
+    parser = argparse.ArgumentParser(description="MJ文字図形名順の NewCode でテキストを符号化・復号します。")
+    parser.add_argument('mode', choices=('encode', 'decode', 'verify'))
+    parser.add_argument('input', nargs='?', default='-', help='入力ファイル (省略時は標準入力。verify では往復を試す原稿)')
+    parser.add_argument('-o', '--output', default='-', help='出力ファイル (省略時は標準出力)')
+    parser.add_argument('--charset', default=CHARSET_FILE, help='NewCode_Hex 付きの字形一覧 (無ければ --mj の行番号 + --offset を NewCode にする)')
+    parser.add_argument('--mj', default=MJ_MASTER_FILE)
+    parser.add_argument('--offset', type=parse_offset, help=f'NewCode の開始値 (--charset では NewCode_Hex と照合する。--mj の既定: 0x{DEFAULT_OFFSET:X})')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='ストリーム処理の1回の文字数')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.charset) and not os.path.exists(args.mj):
+        print(f"エラー: {args.charset} も {args.mj} も見つかりません。", file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    try:
+        codec = NewCodeCodec.load(args.charset, args.mj, args.offset)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+    first, last = min(g.code for g in codec.glyphs), max(g.code for g in codec.glyphs)
+    print(f"NewCode: {len(codec.glyphs):,} 字形 (0x{first:04X} - 0x{last:04X}), 異体字の組 {len(codec.sequences):,} 件 ({(time.perf_counter() - start) * 1000:.0f} ms)", file=sys.stderr)
+
+    if 'verify' == args.mode:
+        failures = codec.verify()
+        for mj, form in failures[:20]:
+            print(f"往復失敗: {mj} {'_'.join(f'U+{ord(c):04X}' for c in form)}", file=sys.stderr)
+        print(f"表の往復: 失敗 {len(failures)} 件 (表現できない字形 {codec.unrepresentable} 件は除く)", file=sys.stderr)
+        fuzz_failures = codec.fuzz()
+        for text in fuzz_failures[:20]:
+            print(f"ストリーム不一致: {' '.join(f'U+{ord(c):04X}' for c in text)}", file=sys.stderr)
+        print(f"ストリームの検査: {FUZZ_COUNT} 件中 失敗 {len(fuzz_failures)} 件", file=sys.stderr)
+        failures += fuzz_failures
+        if '-' != args.input:
+            with open(args.input, 'r', encoding='utf-8', errors='surrogateescape', newline='') as f:
+                text = f.read()
+            size = len(text.encode('utf-8', 'surrogateescape'))
+            print(f"原稿: {len(text):,} 字 / {size:,} バイト", file=sys.stderr)
+            encoded = measure("符号化 (一括)", lambda: codec.encode(text), size)
+            decoded = measure("復号 (一括)", lambda: codec.decode(encoded), size)
+            measure("符号化 (ストリーム)", lambda: codec.encode_stream(io.StringIO(text, newline=''), _Sink(), args.chunk_size), size)
+            measure("復号 (ストリーム)", lambda: codec.decode_stream(io.StringIO(encoded, newline=''), _Sink(), args.chunk_size), size)
+            ok = codec.encode(decoded) == encoded
+            print(f"原稿の往復: {'一致' if ok else '不一致'} (正規形でない表記 {codec.count_noncanonical(text):,} 件)", file=sys.stderr)
+            sys.exit(0 if ok and not failures else 1)
+        sys.exit(1 if failures else 0)
+
+    src = open(args.input, 'r', encoding='utf-8', errors='surrogateescape', newline='') if '-' != args.input else sys.stdin
+    dst = open(args.output, 'w', encoding='utf-8', errors='surrogateescape', newline='') if '-' != args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        with src, dst:
+            total = (codec.encode_stream if 'encode' == args.mode else codec.decode_stream)(src, dst, args.chunk_size)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"{args.mode}: {total:,} 字, {elapsed:.2f} 秒" + (f" ({total / elapsed / 1e6:.1f} M字/s)" if elapsed else ''), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
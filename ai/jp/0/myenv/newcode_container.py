@@ -0,0 +1,310 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from generate_cjk_regex import MJ_MASTER_FILE
+from jp_subset import DEFAULT_RANGES, is_selector
+from newcode_codec import CHARSET_FILE, DEFAULT_OFFSET, NewCodeCodec, PAIR_RE, SELECTOR_RE, parse_offset
+
+# 原稿を UTF-8 ではなく NewCode の列として保存するバイナリ形式 (ai/text-binary-protocol/0.md の
+# 「サブセット用コードポイント」「ヘッダとデータのセクション分離」に当たる)。
+#
+# ファイル = ヘッダ | データ (ブロックの並び) | 索引 (各ブロック先頭のバイト位置, uint64 × (ブロック数 + 1))
+#
+# 1文字は「シンボル」1つ。シンボルは 0-127 が ASCII、続いて DEFAULT_RANGES のかな・句読点など、
+# その後に NewCode (シンボル = 基本文字数 + NewCode - offset) を並べた番号で、サロゲート(D800-DFFF)を飛ばして
+# BMP の1字(ユニット)に割り当てる。ユニットの列を固定長なら UTF-16LE (2バイト)、可変長なら UTF-8 (1-3バイトの
+# 前置型の可変長整数) の codec で書くので、符号化・復号は translate と codec だけで済む (1字ずつの Python 処理が無い)。
+# シンボルに無い字はエスケープする: 補助面の字はそのまま (サロゲートペア / 4バイト)、BMP の字は U+100000 + コードポイント。
+# そのため原文に補助私用面B (U+100000-U+10FFFF) と NewCode の範囲の字は書けない。
+#
+# 索引は block_size ユニットごとのバイト位置なので、任意の文字位置へは1ブロックの復号だけで届く。
+MAGIC = b'NCTX'
+FORMAT_VERSION = 1
+WIDTHS = {'varint': (1, 'utf-8'), 'u16': (2, 'utf-16-le')}
+BLOCK_SIZE = 4096  # ユニット数
+CHUNK_SIZE = 256 * 1024
+# magic, 形式の版, 幅, 文字セットの版, offset, NewCode数, 基本文字数, 基本文字表のCRC32, ブロックのユニット数,
+# ユニット数, ブロック数, 索引の位置
+HEADER = struct.Struct('<4sBBHIIHIIQIQ')
+ESCAPE_BASE = 0x100000
+ESCAPE_RE = re.compile('[\U00100000-\U0010FFFF]')
+SLOW_PATH_RE = re.compile('[\U00100000-\U0010FFFF\U000E0100-\U000E01EF]')
+
+def base_chars(ranges=DEFAULT_RANGES):
+    """シンボルの先頭に置く文字 (ASCII 128字 + かな・句読点など)。並びはファイル形式の一部"""
+    chars = list(range(128))
+    chars += [cp for start, end in ranges for cp in range(start, end + 1) if 0x7F < cp]
+    return chars
+
+def unit(symbol):
+    return symbol if symbol < 0xD800 else symbol + 0x800
+
+def is_selector_unit(u):
+    cp = ord(u)
+    return is_selector(cp - ESCAPE_BASE if ESCAPE_BASE <= cp else cp)
+
+class Symbols:
+    """UCS のテキストとユニットの列の相互変換表。NewCodeCodec の字形表から作る"""
+    def __init__(self, codec, ranges=DEFAULT_RANGES):
+        glyphs = codec.glyphs
+        self.codec = codec
+        self.offset = min(g.code for g in glyphs)
+        self.glyph_count = max(g.code for g in glyphs) - self.offset + 1
+        bases = base_chars(ranges)
+        self.base_count = len(bases)
+        self.base_crc = zlib.crc32(array('I', bases).tobytes())
+        if 0xFFFF < unit(self.base_count + self.glyph_count - 1):
+            raise ValueError("シンボルが2バイトに収まりません")
+        glyph_unit = lambda code: unit(self.base_count + code - self.offset)
+        # 符号化: シンボルに無いBMPの字はエスケープ、表より先(0x40000以上)の字はそのまま
+        self.to_unit = [ESCAPE_BASE + cp if cp <= 0xFFFF else cp for cp in range(0x40000)]
+        for i, cp in enumerate(bases):
+            self.to_unit[cp] = unit(i)
+        for g in glyphs:
+            if g.ucs is not None:
+                self.to_unit[g.ucs] = glyph_unit(g.code)
+        self.sequences = {seq: chr(g.code) for g in glyphs for seq in g.sequences}
+        self.to_unit_from_code = {chr(g.code): chr(glyph_unit(g.code)) for g in glyphs}
+        # 復号: ユニットを正規形の文字列へ (セレクタが無い時の1回の translate 用) と、NewCode へ (セレクタがある時用)
+        self.to_text = list(range(0x10000))
+        self.to_code = list(range(0x10000))
+        for i, cp in enumerate(bases):
+            self.to_text[unit(i)] = self.to_code[unit(i)] = cp
+        for g in glyphs:
+            self.to_code[glyph_unit(g.code)] = g.code
+            self.to_text[glyph_unit(g.code)] = codec.decode_table[g.code]
+        last = self.offset + self.glyph_count - 1
+        self.reject_re = re.compile(f'[{re.escape(chr(self.offset))}-{re.escape(chr(last))}\U00100000-\U0010FFFF]')
+    def _pair(self, m):
+        return self.sequences.get(m[0], m[0])
+    def _code_to_unit(self, m):
+        return self.to_unit_from_code[m[0]]
+    def encode(self, text):
+        """UCS のテキストをユニットの列 (str) にする"""
+        m = self.reject_re.search(text)
+        if m:
+            raise ValueError(f"格納できない文字 U+{ord(m[0]):04X} が含まれています")
+        if not SELECTOR_RE.search(text):
+            return text.translate(self.to_unit)
+        # 登録済みの組は先に NewCode 1字にし (translate の表の外なので変わらない)、最後にユニットにする
+        text = PAIR_RE.sub(self._pair, text).translate(self.to_unit)
+        return self.codec.reserved_re.sub(self._code_to_unit, text)
+    def _unescape(self, m):
+        return chr(ord(m[0]) - ESCAPE_BASE)
+    def decode(self, units):
+        """ユニットの列を UCS のテキスト(正規形)に戻す"""
+        if not SLOW_PATH_RE.search(units):
+            return units.translate(self.to_text)
+        # エスケープかIVSがあれば、NewCode にしてから NewCodeCodec で戻す (直後のセレクタと組になる字の扱いのため)
+        return self.codec.decode(ESCAPE_RE.sub(self._unescape, units.translate(self.to_code)))
+
+class ContainerWriter:
+    """テキストを少しずつ write し、close でブロックの索引とヘッダを書く"""
+    def __init__(self, f, symbols, width='u16', block_size=BLOCK_SIZE, charset_version=1):
+        self.f, self.symbols, self.width, self.block_size = f, symbols, width, block_size
+        self.encoding = WIDTHS[width][1]
+        self.charset_version = charset_version
+        self.index = array('Q', [0])
+        self.units, self.carry, self.pending = 0, '', ''
+        f.write(b'\0' * HEADER.size)
+    def write(self, text):
+        # 基底文字とセレクタが分かれないよう、最後の字は(セレクタでなければ)次に回す
+        text = self.carry + text
+        if text and not SELECTOR_RE.match(text[-1]):
+            text, self.carry = text[:-1], text[-1]
+        else:
+            self.carry = ''
+        self._write_units(self.symbols.encode(text))
+    def _write_units(self, units, final=False):
+        units = self.pending + units
+        size, encoding, index, pos = self.block_size, self.encoding, self.index, 0
+        while size <= len(units) - pos or (final and pos < len(units)):
+            block = units[pos:pos + size].encode(encoding)
+            self.f.write(block)
+            index.append(index[-1] + len(block))
+            pos += min(size, len(units) - pos)
+        self.units += pos
+        self.pending = units[pos:]
+    def close(self):
+        self._write_units(self.symbols.encode(self.carry), final=True)
+        self.carry = ''
+        index_pos = HEADER.size + self.index[-1]
+        self.f.write(self.index.tobytes())
+        s = self.symbols
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, FORMAT_VERSION, WIDTHS[self.width][0], self.charset_version, s.offset, s.glyph_count,
+                                 s.base_count, s.base_crc, self.block_size, self.units, len(self.index) - 1, index_pos))
+
+class ContainerReader:
+    """mmap したコンテナを memoryview で切り出して読む。read(start, stop) はユニット位置で指定する"""
+    def __init__(self, path, symbols):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        (magic, version, width, self.charset_version, offset, glyph_count, base_count, base_crc,
+         self.block_size, self.units, blocks, index_pos) = HEADER.unpack_from(self.view)
+        if MAGIC != magic or FORMAT_VERSION != version:
+            raise ValueError(f"{path} は NewCode コンテナ(版 {FORMAT_VERSION})ではありません")
+        if (offset, glyph_count, base_count, base_crc) != (symbols.offset, symbols.glyph_count, symbols.base_count, symbols.base_crc):
+            raise ValueError(f"{path} の文字表 (offset 0x{offset:X}, NewCode {glyph_count} 字) が読み込んだ文字セットと違います")
+        self.width = next(name for name, (w, _) in WIDTHS.items() if w == width)
+        self.encoding = WIDTHS[self.width][1]
+        self.symbols = symbols
+        self.data = self.view[HEADER.size:index_pos]
+        self.index = self.view[index_pos:index_pos + 8 * (blocks + 1)].cast('Q')
+    def close(self):
+        self.index.release()
+        self.data.release()
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def block_units(self, b):
+        """b 番目のブロックをユニットの列で返す"""
+        return str(self.data[self.index[b]:self.index[b + 1]], self.encoding)
+    def read_units(self, start=0, stop=None):
+        stop = self.units if stop is None else min(stop, self.units)
+        if stop <= start:
+            return ''
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        units = str(self.data[self.index[first]:self.index[last + 1]], self.encoding)
+        return units[start - first * self.block_size:stop - first * self.block_size]
+    def read(self, start=0, stop=None):
+        """ユニット位置 [start, stop) のテキストを返す (含むブロックだけを復号する)"""
+        stop = self.units if stop is None else min(stop, self.units)
+        if stop < self.units:
+            # 直後がセレクタなら、それと組にならないよう一緒に復号してから落とす
+            units = self.read_units(start, stop + 1)
+            if units and is_selector_unit(units[-1]):
+                return self.symbols.decode(units)[:-1]
+            units = units[:-1]
+        else:
+            units = self.read_units(start, stop)
+        return self.symbols.decode(units)
+    def iter_text(self, blocks=64):
+        """先頭から blocks ブロックずつ復号したテキストを返す"""
+        step = self.block_size * blocks
+        for start in range(0, self.units, step):
+            yield self.read(start, start + step)
+
+def load_symbols(charset_file=CHARSET_FILE, mj_file=MJ_MASTER_FILE, offset=None):
+    return Symbols(NewCodeCodec.load(charset_file, mj_file, offset))
+
+def pack(src_path, dst_path, symbols, width, block_size, charset_version, chunk_size=CHUNK_SIZE):
+    with open(src_path, 'r', encoding='utf-8', errors='surrogateescape', newline='') as src, open(dst_path, 'wb') as f:
+        writer = ContainerWriter(f, symbols, width, block_size, charset_version)
+        while True:
+            data = src.read(chunk_size)
+            if not data:
+                break
+            writer.write(data)
+        writer.close()
+    return writer
+
+def best_of(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench(path, symbols, block_size):
+    """UTF-8 と各幅のコンテナで、大きさ・全体の復号・任意位置の読み出しを比べる"""
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape', newline='') as f:
+        text = f.read()
+    utf8 = text.encode('utf-8', 'surrogateescape')
+    canonical = symbols.codec.decode(symbols.codec.encode(text))
+    print(f"原稿: {len(text):,} 字", file=sys.stderr)
+    elapsed, _ = best_of(lambda: utf8.decode('utf-8', 'surrogateescape'))
+    middle = len(utf8) // 2
+    # UTF-8 で n 字目を得るには先頭から復号するしかない
+    seek, _ = best_of(lambda: utf8[:middle].decode('utf-8', 'ignore'))
+    print(f"  UTF-8 : {len(utf8):>12,} バイト (100.0%) 復号 {len(utf8) / elapsed / 1e6:5.0f} MB/s, 中央の1字 {seek * 1000:.2f} ms", file=sys.stderr)
+    ok = True
+    for width in WIDTHS:
+        out = f"{path}.{width}.nctx"
+        packed, _ = best_of(lambda: pack(path, out, symbols, width, block_size, 1), 1)
+        size = os.path.getsize(out)
+        with ContainerReader(out, symbols) as reader:
+            elapsed, decoded = best_of(lambda: ''.join(reader.iter_text()))
+            seek, _ = best_of(lambda: reader.read(reader.units // 2, reader.units // 2 + 1), 20)
+            ok &= decoded == canonical
+        print(f"  {width:6}: {size:>12,} バイト ({size / len(utf8) * 100:5.1f}%) 復号 {len(utf8) / elapsed / 1e6:5.0f} MB/s, "
+              f"中央の1字 {seek * 1000:.2f} ms, 書き込み {len(utf8) / packed / 1e6:.0f} MB/s, 往復 {'一致' if decoded == canonical else '不一致'}", file=sys.stderr)
+        os.remove(out)
+    return ok
+
+def main():
+    """メイン処理: テキストを NewCode コンテナに pack / unpack し、info でヘッダを、bench で UTF-8 との比較を表示する"""
+    parser = argparse.ArgumentParser(description="テキストを NewCode の列のバイナリ形式で保存・復元します。")
+    parser.add_argument('mode', choices=('pack', 'unpack', 'info', 'bench'))
+    parser.add_argument('input', help='入力ファイル (pack・bench はテキスト、unpack・info はコンテナ)')
+    parser.add_argument('-o', '--output', default='-', help='出力ファイル (pack では必須、unpack の省略時は標準出力)')
+    parser.add_argument('--width', choices=tuple(WIDTHS), default='u16', help='u16: 2バイト固定長 / varint: 1-3バイトの可変長')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='索引を作る間隔 (ユニット数)')
+    parser.add_argument('--charset-version', type=int, default=1, help='ヘッダに記録する文字セットの版 (japanese_exclusive_charset_v1 なら 1)')
+    parser.add_argument('--charset', default=CHARSET_FILE)
+    parser.add_argument('--mj', default=MJ_MASTER_FILE)
+    parser.add_argument('--offset', type=parse_offset, help=f'NewCode の開始値 (--charset では NewCode_Hex と照合する。--mj の既定: 0x{DEFAULT_OFFSET:X})')
+    parser.add_argument('--start', type=int, default=0, help='unpack で取り出す最初のユニット位置')
+    parser.add_argument('--stop', type=int, help='unpack で取り出す最後のユニット位置 (含まない)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"エラー: {args.input} が見つかりません。", file=sys.stderr)
+        sys.exit(1)
+    try:
+        symbols = load_symbols(args.charset, args.mj, args.offset)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if 'bench' == args.mode:
+        sys.exit(0 if bench(args.input, symbols, args.block_size) else 1)
+    if 'pack' == args.mode:
+        if '-' == args.output:
+            parser.error('pack には -o/--output が必要です')
+        start = time.perf_counter()
+        try:
+            writer = pack(args.input, args.output, symbols, args.width, args.block_size, args.charset_version)
+        except ValueError as e:
+            os.remove(args.output)
+            print(f"エラー: {e}", file=sys.stderr)
+            sys.exit(1)
+        size = os.path.getsize(args.output)
+        print(f"pack: {writer.units:,} 字 -> {size:,} バイト ({args.width}, {len(writer.index) - 1} ブロック), "
+              f"{time.perf_counter() - start:.2f} 秒", file=sys.stderr)
+        return
+    try:
+        reader = ContainerReader(args.input, symbols)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+    with reader:
+        if 'info' == args.mode:
+            print(f"幅: {reader.width}\n文字セットの版: {reader.charset_version}\nオフセット: 0x{symbols.offset:X}\n"
+                  f"文字数: {reader.units:,}\nブロック: {len(reader.index) - 1:,} × {reader.block_size} ユニット\n"
+                  f"データ: {len(reader.data):,} バイト")
+            return
+        dst = open(args.output, 'w', encoding='utf-8', errors='surrogateescape', newline='') if '-' != args.output else sys.stdout
+        with dst:
+            if args.start or args.stop is not None:
+                dst.write(reader.read(args.start, args.stop))
+            else:
+                for text in reader.iter_text():
+                    dst.write(text)
+
+if __name__ == "__main__":
+    main()
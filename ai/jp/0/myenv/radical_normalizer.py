@@ -0,0 +1,212 @@
+import argparse
+import csv
+import hashlib
+import os
+import pickle
+import re
+import sys
+import time
+from collections import Counter
+
+from generate_cjk_regex import to_ranges, to_class
+
+# PDF・OCR由来の原稿に混じる康熙部首 (U+2F00-2FD5) と CJK部首補助 (U+2E80-2EFF) を、意図された統合漢字に置き換える。
+#
+# 対応表は優先度の低い順に EquivalentUnifiedIdeograph.txt、kangxi_cjk_supplement_mapping.csv (部首補助 -> 康熙部首)、
+# radical_master_2026.csv (康熙部首・部首補助 -> 仲介常用漢字) を重ね、部首 -> 部首 の連鎖はたどって統合漢字まで解決する。
+# 表は str.translate 形式 ({コードポイント: 文字}) で、元ファイルのサイズ・更新日時が同じならキャッシュから読む。
+# 置換は表を丸ごと translate せず、正規表現で見つけた箇所だけを置き換える (部首の無い大半のテキストは re の走査だけで済む)。
+# ストリームは UTF-8 のバイト列のまま置き換えるので、復号・符号化もしない。
+RADICAL_FILE = 'radical_master_2026.csv'
+KANGXI_MAPPING_FILE = os.path.join('..', '..', '1', 'kangxi_cjk_supplement_mapping.csv')
+EQUIV_FILE = 'EquivalentUnifiedIdeograph.txt'
+CACHE_DIR = '.ucd_cache'
+CACHE_FORMAT = 1
+SOURCE_RANGES = ((0x2E80, 0x2EFF), (0x2F00, 0x2FDF))
+CHUNK_SIZE = 1024 * 1024
+
+def is_radical(cp):
+    return any(start <= cp <= end for start, end in SOURCE_RANGES)
+
+def parse_ucs(value):
+    value = (value or '').strip()
+    return int(value[2:], 16) if value.startswith('U+') else None
+
+def load_equiv(filename):
+    """EquivalentUnifiedIdeograph.txt から {部首: 統合漢字} を作る (範囲指定 2E8C..2E8D も展開する)"""
+    mapping = {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if ';' not in line:
+                continue
+            src, tgt = [x.strip() for x in line.split(';')]
+            start, _, end = src.partition('..')
+            for cp in range(int(start, 16), int(end or start, 16) + 1):
+                if is_radical(cp):
+                    mapping[cp] = int(tgt, 16)
+    return mapping
+
+def load_kangxi_mapping(filename):
+    """kangxi_cjk_supplement_mapping.csv から {CJK部首補助: 康熙部首} を作る"""
+    mapping = {}
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            src, tgt = parse_ucs(row.get('cjk_supplement_unicode')), parse_ucs(row.get('kangxi_radical_unicode'))
+            if src is not None and tgt is not None:
+                mapping[src] = tgt
+    return mapping
+
+def load_radical_master(filename):
+    """radical_master_2026.csv から {康熙部首・CJK部首補助: 仲介常用漢字} を作る
+
+    CJK部首補助のある行の仲介常用漢字は部首補助の字形 (⾒ の行なら ⻅ に当たる 见) なので、
+    その行の康熙部首には使わない (EquivalentUnifiedIdeograph.txt の 見 を残す)"""
+    mapping = {}
+    with open(filename, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            tgt = parse_ucs(row['常用漢字コード'])
+            if tgt is None:
+                continue
+            supplements = [src for src in map(parse_ucs, row['CJK部首補助コード'].split(',')) if src is not None]
+            for src in supplements or [parse_ucs(row['康熙部首コード'])]:
+                if src is not None:
+                    mapping[src] = tgt
+    return mapping
+
+def build_table(radical_file, kangxi_file, equiv_file):
+    """3つの対応表を重ね、{部首のコードポイント: (統合漢字のコードポイント, 採用した表)} を返す"""
+    table = {}
+    for name, filename, load in (('equiv', equiv_file, load_equiv), ('kangxi', kangxi_file, load_kangxi_mapping),
+                                 ('radical', radical_file, load_radical_master)):
+        if filename and os.path.exists(filename):
+            table.update((src, (tgt, name)) for src, tgt in load(filename).items())
+    # 部首補助 -> 康熙部首 -> 統合漢字 のような連鎖を、行き先が部首でなくなるまでたどる
+    for src in table:
+        tgt, name = table[src]
+        seen = {src}
+        while tgt in table and tgt not in seen:
+            seen.add(tgt)
+            tgt = table[tgt][0]
+        table[src] = (tgt, name)
+    return {src: value for src, value in table.items() if not is_radical(value[0])}
+
+def load_table(radical_file=RADICAL_FILE, kangxi_file=KANGXI_MAPPING_FILE, equiv_file=EQUIV_FILE, cache_dir=CACHE_DIR):
+    """build_table の結果をキャッシュする。元ファイルのパス・サイズ・更新日時が同じなら再構築しない"""
+    stats = []
+    for filename in (radical_file, kangxi_file, equiv_file):
+        if filename and os.path.exists(filename):
+            st = os.stat(filename)
+            stats.append((os.path.abspath(filename), st.st_size, st.st_mtime_ns))
+    key = hashlib.sha1(repr((CACHE_FORMAT, stats)).encode('utf-8')).hexdigest()
+    cache_path = os.path.join(cache_dir, f"radical-{key}.pickle")
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+    table = build_table(radical_file, kangxi_file, equiv_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return table
+
+def byte_pattern(sequences):
+    """3バイトのUTF-8列の集合に一致する bytes の正規表現を、先頭2バイトごとの文字クラスで作る"""
+    groups = {}
+    for seq in sorted(sequences):
+        groups.setdefault(seq[:2], []).append(seq[2])
+    parts = []
+    for prefix, lasts in groups.items():
+        ranges = ''.join(f'\\x{a:02x}' if a == b else f'\\x{a:02x}-\\x{b:02x}' for a, b in to_ranges(lasts))
+        parts.append(''.join(f'\\x{c:02x}' for c in prefix) + f'[{ranges}]')
+    return re.compile('|'.join(parts).encode('ascii'))
+
+class RadicalNormalizer:
+    """部首を統合漢字に置き換える。report=True なら部首ごとの置換数と最初の位置(バイト)を数える"""
+    def __init__(self, table, report=False):
+        self.sources = {src: name for src, (_, name) in table.items()}
+        # str.translate にそのまま渡せる表
+        self.table = {src: chr(tgt) for src, (tgt, _) in table.items()}
+        self.chars = {chr(src): tgt for src, tgt in self.table.items()}
+        self.pattern = re.compile(to_class(to_ranges(self.table), 'python'))
+        # ストリームは UTF-8 のまま置き換える。部首はすべて E2 で始まる3バイトで、E2 は先頭バイトにしか現れない
+        self.byte_chars = {src.encode('utf-8'): tgt.encode('utf-8') for src, tgt in self.chars.items()}
+        self.byte_pattern = byte_pattern(self.byte_chars)
+        self.counts = Counter() if report else None
+        self.first = {}
+        self.position = 0
+    def _replace(self, m):
+        return self.chars[m[0]]
+    def normalize(self, text):
+        """text の部首を置き換えて返す (text.translate(self.table) と同じ結果)"""
+        return self.pattern.sub(self._replace, text)
+    def _replace_bytes(self, m):
+        return self.byte_chars[m[0]]
+    def normalize_bytes(self, data):
+        """UTF-8 の data の部首を置き換えて返す。ストリームの続きとして呼べば、報告の位置は通算になる"""
+        if self.counts is not None:
+            for m in self.byte_pattern.finditer(data):
+                self.counts[m[0]] += 1
+                self.first.setdefault(m[0], self.position + m.start())
+        self.position += len(data)
+        return self.byte_pattern.sub(self._replace_bytes, data)
+    def normalize_stream(self, src, dst, chunk_size=CHUNK_SIZE):
+        """バイナリストリームを chunk_size バイトずつ置き換える。末尾で切れた部首の先頭1-2バイトは次に回す。読んだバイト数を返す"""
+        carry, total = b'', 0
+        while True:
+            chunk = src.read(chunk_size)
+            total += len(chunk)
+            data = carry + chunk
+            keep = (1 if data[-1:] == b'\xe2' else 2 if data[-2:-1] == b'\xe2' else 0) if chunk else 0
+            carry = data[len(data) - keep:] if keep else b''
+            dst.write(self.normalize_bytes(data[:len(data) - keep]))
+            if not chunk:
+                return total
+    def write_report(self, out):
+        out.write("部首\t文字\t統合漢字\t文字\t件数\t最初のバイト位置\t採用した表\n")
+        for seq, count in self.counts.most_common():
+            char, tgt = seq.decode('utf-8'), self.byte_chars[seq].decode('utf-8')
+            out.write(f"U+{ord(char):04X}\t{char}\tU+{ord(tgt):04X}\t{tgt}\t{count}\t{self.first[seq]}\t{self.sources[ord(char)]}\n")
+
+def main():
+    """メイン処理: 原稿の康熙部首・CJK部首補助を統合漢字に置き換える"""
+    parser = argparse.ArgumentParser(description="康熙部首・CJK部首補助を統合漢字に置き換えます。")
+    parser.add_argument('input', nargs='?', default='-', help='入力ファイル (省略時は標準入力)')
+    parser.add_argument('-o', '--output', default='-', help='出力ファイル (省略時は標準出力)')
+    parser.add_argument('--radical', default=RADICAL_FILE)
+    parser.add_argument('--kangxi-mapping', default=KANGXI_MAPPING_FILE)
+    parser.add_argument('--equiv', default=EQUIV_FILE)
+    parser.add_argument('--report', action='store_true', help='部首ごとの置換数と最初の位置を標準エラー出力に表示する')
+    parser.add_argument('--table', action='store_true', help='対応表を表示して終了する')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1回に読むバイト数')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = load_table(args.radical, args.kangxi_mapping, args.equiv)
+    if not table:
+        print(f"エラー: {args.radical}・{args.kangxi_mapping}・{args.equiv} のいずれからも対応表を作れません。", file=sys.stderr)
+        sys.exit(1)
+    normalizer = RadicalNormalizer(table, args.report)
+    sources = ', '.join(f"{name} {count}" for name, count in Counter(name for _, name in table.values()).most_common())
+    print(f"対応表: {len(table)} 字 ({sources}) ({(time.perf_counter() - start) * 1000:.1f} ms)", file=sys.stderr)
+    if args.table:
+        for src, (tgt, name) in sorted(table.items()):
+            print(f"U+{src:04X}\t{chr(src)}\tU+{tgt:04X}\t{chr(tgt)}\t{name}")
+        return
+
+    src = open(args.input, 'rb') if '-' != args.input else sys.stdin.buffer
+    dst = open(args.output, 'wb') if '-' != args.output else sys.stdout.buffer
+    start = time.perf_counter()
+    with src, dst:
+        total = normalizer.normalize_stream(src, dst, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    if args.report:
+        normalizer.write_report(sys.stderr)
+    rate = f" ({total / elapsed / 1e6:.0f} MB/s)" if elapsed else ''
+    print(f"置換: {sum(normalizer.counts.values()) if args.report else '-'} 件 / {total:,} バイト, {elapsed:.2f} 秒{rate}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
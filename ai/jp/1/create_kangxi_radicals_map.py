@@ -1,5 +1,6 @@
 import csv
 import re
+from unihan_zip import open_unihan
 
 def create_kangxi_radicals_map():
     """康熙部首の番号、文字、Unicodeコードのマッピングを作成する"""
@@ -15,52 +16,53 @@ def create_kangxi_radicals_map():
         }
     return radicals
 
-def create_char_to_radical_num_map(filename="Unihan_RadicalStrokeCounts.txt"):
-    """Unihan_RadicalStrokeCounts.txt から漢字と部首番号のマッピングを作成する"""
-    mapping = {}
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("#") or not line.strip():
-                    continue
-                parts = line.strip().split("\t")
-                if len(parts) >= 3 and parts[1] == "kRSUnicode":
-                    ucode_str = parts[0]
-                    code_point = int(ucode_str[2:], 16)
-                    char = chr(code_point)
-                    radical_info = parts[2]
-                    match = re.match(r"(\d+)", radical_info)
-                    if match:
-                        radical_num = int(match.group(1))
-                        mapping[char] = radical_num
-    except FileNotFoundError:
-        print(f"エラー: {filename} が見つかりません。")
-        print("Unihanデータベースからダウンロードしたファイルを、このスクリプトと同じディレクトリに配置してください。")
+# kRSUnicode・kCompatibilityVariant は Unicode 13.0 以降 Unihan_IRGSources.txt にあり、
+# それ以前は Unihan_RadicalStrokeCounts.txt・Unihan_Variants.txt にある。見つかったファイルをすべて読む
+RS_FILES = ("Unihan_IRGSources.txt", "Unihan_RadicalStrokeCounts.txt")
+VARIANT_FILES = ("Unihan_IRGSources.txt", "Unihan_Variants.txt")
+
+def read_unihan_field(filenames, field):
+    """filenames のうち読めたものから field の (コードポイント, 値) を返す。どれも無ければ None"""
+    values, found = [], False
+    for filename in filenames:
+        try:
+            with open_unihan(filename) as f:
+                found = True
+                for line in f:
+                    if line.startswith("#") or not line.strip():
+                        continue
+                    parts = line.strip().split("\t")
+                    if len(parts) >= 3 and parts[1] == field:
+                        values.append((int(parts[0][2:], 16), parts[2]))
+        except FileNotFoundError:
+            continue
+    if not found:
+        print(f"エラー: {' / '.join(filenames)} が見つかりません。")
+        print("Unihanデータベースからダウンロードしたファイル(またはUnihan.zip)を、このスクリプトと同じディレクトリに配置してください。")
         return None
-    return mapping
+    return values
 
-def create_supplement_to_char_map(filename="Unihan_Variants.txt"):
-    """Unihan_Variants.txt からCJK部首補助と対応漢字のマッピングを作成する"""
+def create_char_to_radical_num_map(filenames=RS_FILES):
+    """kRSUnicode から漢字と部首番号のマッピングを作成する"""
+    values = read_unihan_field(filenames, "kRSUnicode")
+    if values is None:
+        return None
     mapping = {}
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("#") or not line.strip():
-                    continue
-                parts = line.strip().split("\t")
-                if len(parts) >= 3 and parts[1] == "kCompatibilityVariant":
-                    supp_ucode_str = parts[0]
-                    supp_code_point = int(supp_ucode_str[2:], 16)
-                    if 0x2E80 <= supp_code_point <= 0x2EFF:
-                        supp_char = chr(supp_code_point)
-                        target_ucode_str = parts[2].split("<")[0]
-                        target_code_point = int(target_ucode_str[2:], 16)
-                        target_char = chr(target_code_point)
-                        mapping[supp_char] = target_char
-    except FileNotFoundError:
-        print(f"エラー: {filename} が見つかりません。")
-        print("Unihanデータベースからダウンロードしたファイルを、このスクリプトと同じディレクトリに配置してください。")
+    for code_point, radical_info in values:
+        match = re.match(r"(\d+)", radical_info)
+        if match:
+            mapping[chr(code_point)] = int(match.group(1))
+    return mapping
+
+def create_supplement_to_char_map(filenames=VARIANT_FILES):
+    """kCompatibilityVariant からCJK部首補助と対応漢字のマッピングを作成する"""
+    values = read_unihan_field(filenames, "kCompatibilityVariant")
+    if values is None:
         return None
+    mapping = {}
+    for code_point, value in values:
+        if 0x2E80 <= code_point <= 0x2EFF:
+            mapping[chr(code_point)] = chr(int(value.split("<")[0][2:], 16))
     return mapping
 
 def main():
@@ -71,13 +73,13 @@ def main():
     kangxi_radicals = create_kangxi_radicals_map()
     print(f"  -> {len(kangxi_radicals)} 件の康熙部首データを生成しました。")
 
-    print("\nステップ2: 漢字と部首番号のマッピングを作成中 (Unihan_RadicalStrokeCounts.txt)...")
+    print("\nステップ2: 漢字と部首番号のマッピングを作成中 (kRSUnicode)...")
     char_to_radical_num = create_char_to_radical_num_map()
     if char_to_radical_num is None:
         return
     print(f"  -> {len(char_to_radical_num)} 件の漢字と部首番号のマッピングを生成しました。")
 
-    print("\nステップ3: CJK部首補助と対応漢字のマッピングを作成中 (Unihan_Variants.txt)...")
+    print("\nステップ3: CJK部首補助と対応漢字のマッピングを作成中 (kCompatibilityVariant)...")
     supplement_to_char = create_supplement_to_char_map()
     if supplement_to_char is None:
         return
@@ -104,7 +106,7 @@ def main():
     if not master_data:
         print("\n[警告] CSVに出力するデータが1件も生成されませんでした。")
         print("以下の点を確認してください:")
-        print("1. `Unihan_RadicalStrokeCounts.txt` と `Unihan_Variants.txt` がスクリプトと同じディレクトリにありますか？")
+        print("1. `Unihan_IRGSources.txt`（Unicode 13.0 より前は `Unihan_RadicalStrokeCounts.txt` と `Unihan_Variants.txt`、または `Unihan.zip`）がスクリプトと同じディレクトリにありますか？")
         print("2. 上記ファイルのサイズが0KBになっていませんか？（正常にダウンロードされているか確認）")
         print("3. ステップ2とステップ3で表示された件数が0になっていませんか？")
         return
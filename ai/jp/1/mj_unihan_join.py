@@ -0,0 +1,169 @@
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from array import array
+from unihan_cache import load_unihan_fields
+
+MJ_MASTER_FILE = os.path.join("..", "0", "myenv", "all_mj_master_ordered.txt")
+OUTPUT_FILE = "mj_unihan_mismatch.txt"
+# kRSUnicode / kTotalStrokes は Unicode 13.0 以降 Unihan_IRGSources.txt に収録されている
+UNIHAN_MEMBERS = ("Unihan_IRGSources.txt", "Unihan_RadicalStrokeCounts.txt", "Unihan_DictionaryLikeData.txt")
+FIELDS = ("kRSUnicode", "kTotalStrokes")
+COL_MJ_ID = 'MJ文字図形名'
+COL_UCS = '実装したUCS'
+COL_RADICAL = '部首1(参考)'
+COL_STROKES = '総画数(参考)'
+RADICAL_REGEX = re.compile(r"(\d+)'*\.")
+# 部首番号(1-214)・総画数(最大でも100未満)の集合をそれぞれ表すビット集合の幅 (部首用と総画数用で別の整数にする)
+SET_BITS = 256
+
+def load_mj_rows(filename):
+    """MJ一覧から (コードポイント, MJ文字図形名, 部首, 総画数) を取り出す。UCS未実装の行は除く"""
+    rows = []
+    with open(filename, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, delimiter="\t"):
+            ucs = (row.get(COL_UCS) or "").strip()
+            if not ucs.startswith("U+"):
+                continue
+            radical = row.get(COL_RADICAL) or ""
+            strokes = row.get(COL_STROKES) or ""
+            for u in ucs.split():
+                rows.append((
+                    int(u[2:], 16), row[COL_MJ_ID],
+                    int(radical) if radical.isdigit() else 0,
+                    int(strokes) if strokes.isdigit() else 0,
+                ))
+    return rows
+
+def to_bitset(numbers):
+    """値の集合を整数のビット集合にする。比較は (bits >> n) & 1 の1回で済む"""
+    bits = 0
+    for n in numbers:
+        if 0 < n < SET_BITS:
+            bits |= 1 << n
+    return bits
+
+def build_unihan_columns(unihan):
+    """Unihanの2フィールドをコードポイント昇順の列(配列)に変換する。値の解析はここで1回だけ行う"""
+    rs, total = unihan["fields"]["kRSUnicode"], unihan["fields"]["kTotalStrokes"]
+    cps = sorted(set(rs) | set(total))
+    # 値の種類は件数よりはるかに少ない(例: "9.3")ため、文字列ごとに1回だけ解析する
+    rad_memo, str_memo = {}, {}
+    for value in set(rs.values()):
+        rad_memo[value] = to_bitset(int(r) for r in RADICAL_REGEX.findall(value))
+    for value in set(total.values()):
+        str_memo[value] = to_bitset(int(s) for s in value.split() if s.isdigit())
+    rad_memo[""] = str_memo[""] = 0
+    radicals = [rad_memo[rs.get(cp, "")] for cp in cps]
+    strokes = [str_memo[total.get(cp, "")] for cp in cps]
+    return array("L", cps), radicals, strokes
+
+def build_mj_columns(rows):
+    """MJ側をコードポイント昇順の列に並べ替える"""
+    rows = sorted(rows)
+    return (
+        array("L", (r[0] for r in rows)), [r[1] for r in rows],
+        array("H", (r[2] for r in rows)), array("H", (r[3] for r in rows)),
+    )
+
+def merge_join(mj_cols, unihan_cols):
+    """ソート済みの2列をコードポイントで突き合わせ(マージ結合)、不一致行を返す"""
+    mj_cps, mj_ids, mj_rad, mj_str = mj_cols
+    u_cps, u_rad, u_str = unihan_cols
+    mismatches = []
+    i = j = 0
+    n, m = len(mj_cps), len(u_cps)
+    while i < n:
+        cp = mj_cps[i]
+        while j < m and u_cps[j] < cp:
+            j += 1
+        if j == m or u_cps[j] != cp:
+            mismatches.append((mj_ids[i], cp, mj_rad[i], None, mj_str[i], None, "UNIHAN_MISSING"))
+        else:
+            rad_ok = not mj_rad[i] or (u_rad[j] >> mj_rad[i]) & 1
+            str_ok = not mj_str[i] or (u_str[j] >> mj_str[i]) & 1
+            if not (rad_ok and str_ok):
+                kind = "BOTH" if not (rad_ok or str_ok) else ("RADICAL" if not rad_ok else "STROKES")
+                mismatches.append((mj_ids[i], cp, mj_rad[i], u_rad[j], mj_str[i], u_str[j], kind))
+        i += 1
+    return mismatches
+
+def naive_join(rows, unihan):
+    """比較用: 1行ごとに辞書を引き、その都度Unihanの値を解析する素朴な実装"""
+    rs, total = unihan["fields"]["kRSUnicode"], unihan["fields"]["kTotalStrokes"]
+    mismatches = []
+    for cp, mj_id, radical, strokes in rows:
+        if cp not in rs and cp not in total:
+            mismatches.append((mj_id, cp, radical, None, strokes, None, "UNIHAN_MISSING"))
+            continue
+        u_rad = [int(r) for r in RADICAL_REGEX.findall(rs.get(cp, ""))]
+        u_str = [int(s) for s in total.get(cp, "").split() if s.isdigit()]
+        rad_ok = not radical or radical in u_rad
+        str_ok = not strokes or strokes in u_str
+        if not (rad_ok and str_ok):
+            kind = "BOTH" if not (rad_ok or str_ok) else ("RADICAL" if not rad_ok else "STROKES")
+            mismatches.append((mj_id, cp, radical, to_bitset(u_rad), strokes, to_bitset(u_str), kind))
+    return sorted(mismatches, key=lambda m: (m[1], m[0]))
+
+def bitset_str(bits):
+    if bits is None:
+        return ""
+    return " ".join(str(n) for n in range(SET_BITS) if (bits >> n) & 1)
+
+def write_report(filename, mismatches):
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write("MJ文字図形名\tUCS\t部首(MJ)\t部首(Unihan)\t総画数(MJ)\t総画数(Unihan)\t種別\n")
+        for mj_id, cp, mj_rad, u_rad, mj_str, u_str, kind in mismatches:
+            f.write(f"{mj_id}\tU+{cp:04X}\t{mj_rad or ''}\t{bitset_str(u_rad)}\t{mj_str or ''}\t{bitset_str(u_str)}\t{kind}\n")
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"  {label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+    return result
+
+def main():
+    """メイン処理: MJの部首・総画数とUnihanの kRSUnicode / kTotalStrokes を一括照合する"""
+    parser = argparse.ArgumentParser(description="MJ文字情報一覧とUnihanの部首・総画数を照合します。")
+    parser.add_argument("unihan", help="Unihan.zip または Unihan_*.txt を置いたディレクトリ")
+    parser.add_argument("--mj", default=MJ_MASTER_FILE, help=f"MJ一覧 (既定: {MJ_MASTER_FILE})")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--bench", action="store_true", help="1行ずつ辞書を引く素朴な実装と処理時間を比較する")
+    args = parser.parse_args()
+
+    for path in (args.unihan, args.mj):
+        if not os.path.exists(path):
+            print(f"エラー: {path} が見つかりません。", file=sys.stderr)
+            sys.exit(1)
+
+    print("ステップ1: データを読み込み中...")
+    rows = load_mj_rows(args.mj)
+    unihan = load_unihan_fields(args.unihan, UNIHAN_MEMBERS, FIELDS)
+    print(f"  -> MJ: {len(rows)} 件 / Unihan: {len(unihan['fields']['kRSUnicode'])} 件 (Unicode {unihan['version'] or '不明'})")
+    if not unihan["fields"]["kRSUnicode"]:
+        print("エラー: kRSUnicode を読み込めませんでした。", file=sys.stderr)
+        sys.exit(1)
+
+    print("\nステップ2: コードポイントで一括照合中...")
+    mj_cols = timed("MJ列の構築", build_mj_columns, rows)
+    unihan_cols = timed("Unihan列の構築", build_unihan_columns, unihan)
+    mismatches = timed("マージ結合", merge_join, mj_cols, unihan_cols)
+    kinds = {}
+    for m in mismatches:
+        kinds[m[-1]] = kinds.get(m[-1], 0) + 1
+    print(f"  -> 不一致: {len(mismatches)} 件 {kinds}")
+
+    if args.bench:
+        print("\nベンチマーク: 素朴な1行ずつの照合")
+        expected = timed("素朴な実装", naive_join, rows, unihan)
+        if expected != mismatches:
+            print("警告: 素朴な実装と結果が一致しません。", file=sys.stderr)
+
+    write_report(args.output, mismatches)
+    print(f"\n処理が完了しました。'{args.output}' が作成されました。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import csv
+import os
+import re
+import sys
+from unihan_cache import load_unihan_fields
+
+# kRSUnicode / kCompatibilityVariant は版によって収録ファイルが異なる
+# (Unicode 13.0 以降は Unihan_IRGSources.txt、それ以前は Unihan_RadicalStrokeCounts.txt 等)
+UNIHAN_MEMBERS = ("Unihan_IRGSources.txt", "Unihan_RadicalStrokeCounts.txt", "Unihan_Variants.txt")
+VARIANT_FIELDS = (
+    "kCompatibilityVariant", "kSemanticVariant", "kSimplifiedVariant",
+    "kSpecializedSemanticVariant", "kSpoofingVariant", "kTraditionalVariant", "kZVariant",
+)
+RS_FIELD = "kRSUnicode"
+EQUIV_FILE = "EquivalentUnifiedIdeograph.txt"
+KANGXI_MAPPING_FILE = "kangxi_cjk_supplement_mapping.csv"
+RADICAL_MASTER_FILE = os.path.join("..", "0", "myenv", "radical_master_2026.csv")
+KANGXI_FIELDS = [
+    "kangxi_radical_number", "kangxi_radical_char", "kangxi_radical_unicode",
+    "cjk_supplement_char", "cjk_supplement_unicode",
+]
+RADICAL_FIELDS = ['康熙部首番号', '康熙部首文字', '康熙部首コード', '仲介常用漢字', '常用漢字コード', 'CJK部首補助', 'CJK部首補助コード']
+
+def u_plus(code_point):
+    return f"U+{code_point:04X}"
+
+def radical_number(rs_value):
+    """kRSUnicode の値 (例: 85.3, 120'.0) から部首番号を取り出す"""
+    match = re.match(r"(\d+)", rs_value or "")
+    return int(match.group(1)) if match else None
+
+def variant_edges(fields):
+    """異体字フィールドを (元コードポイント, フィールド名, 先コードポイント) の集合にする"""
+    edges = set()
+    for field in VARIANT_FIELDS:
+        for code_point, value in fields.get(field, {}).items():
+            for token in value.split():
+                target = token.split("<")[0]
+                if target.startswith("U+"):
+                    edges.add((code_point, field, int(target[2:], 16)))
+    return edges
+
+def load_equiv_map(filename):
+    """EquivalentUnifiedIdeograph.txt から「統合漢字 -> [CJK部首補助]」のマッピングを作成する"""
+    equiv_map = {}
+    if not os.path.exists(filename):
+        return equiv_map
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line or ";" not in line:
+                continue
+            src, tgt = [x.strip() for x in line.split(";")]
+            start, _, end = src.partition("..")
+            target = int(tgt, 16)
+            for code_point in range(int(start, 16), int(end or start, 16) + 1):
+                if 0x2E80 <= code_point <= 0x2EFF:
+                    equiv_map.setdefault(target, []).append(code_point)
+    return equiv_map
+
+def compute_delta(old, new):
+    """2つの版の解析結果からプロパティ単位の差分を求める"""
+    old_rs, new_rs = old["fields"][RS_FIELD], new["fields"][RS_FIELD]
+    old_cps = set().union(*old["fields"].values())
+    new_cps = set().union(*new["fields"].values())
+    old_edges, new_edges = variant_edges(old["fields"]), variant_edges(new["fields"])
+    return {
+        "new_code_points": sorted(new_cps - old_cps),
+        "removed_code_points": sorted(old_cps - new_cps),
+        "changed_rs": {
+            cp: (old_rs.get(cp), new_rs.get(cp))
+            for cp in set(old_rs) | set(new_rs)
+            if old_rs.get(cp) != new_rs.get(cp)
+        },
+        "added_edges": sorted(new_edges - old_edges),
+        "removed_edges": sorted(old_edges - new_edges),
+    }
+
+def read_csv_rows(filename, encoding):
+    with open(filename, "r", encoding=encoding, newline="") as f:
+        return list(csv.DictReader(f))
+
+def write_csv_rows(filename, encoding, fieldnames, rows):
+    with open(filename, "w", encoding=encoding, newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def patch_kangxi_mapping(rows, delta, new):
+    """kangxi_cjk_supplement_mapping.csv の行のうち、差分の影響を受けるCJK部首補助だけを再計算する"""
+    compat = new["fields"]["kCompatibilityVariant"]
+    new_rs = new["fields"][RS_FIELD]
+    affected = set()
+    for src, field, tgt in delta["added_edges"] + delta["removed_edges"]:
+        if field == "kCompatibilityVariant" and 0x2E80 <= src <= 0x2EFF:
+            affected.add(src)
+    changed_targets = set(delta["changed_rs"])
+    for supp, value in compat.items():
+        if 0x2E80 <= supp <= 0x2EFF and int(value.split("<")[0][2:], 16) in changed_targets:
+            affected.add(supp)
+
+    kept = {int(r["cjk_supplement_unicode"][2:], 16): r for r in rows}
+    changes = []
+    for supp in sorted(affected):
+        before = kept.pop(supp, None)
+        after = None
+        value = compat.get(supp)
+        if value:
+            num = radical_number(new_rs.get(int(value.split("<")[0][2:], 16)))
+            if num and 1 <= num <= 214:
+                kangxi = 0x2F00 + num - 1
+                after = {
+                    "kangxi_radical_number": str(num),
+                    "kangxi_radical_char": chr(kangxi),
+                    "kangxi_radical_unicode": u_plus(kangxi),
+                    "cjk_supplement_char": chr(supp),
+                    "cjk_supplement_unicode": u_plus(supp),
+                }
+                kept[supp] = after
+        if before != after:
+            changes.append((supp, before, after))
+    patched = sorted(kept.values(), key=lambda r: (int(r["kangxi_radical_number"]), int(r["cjk_supplement_unicode"][2:], 16)))
+    return patched, changes
+
+def select_parent(candidates, equiv_map):
+    """部首番号ごとの候補から仲介常用漢字を選ぶ (radical_master.py と同じ優先順位)
+
+    候補は CJK統合漢字 (U+4E00-9FFF) と拡張A (U+3400-4DBF) に限り、変形対応表にあるもの、次にコードポイントの小さいものを選ぶ。
+    範囲内に候補が無ければ None (radical_master.py の "N/A")"""
+    ideographs = [c for c in candidates if 0x4E00 <= c <= 0x9FFF or 0x3400 <= c <= 0x4DBF]
+    matches = [c for c in ideographs if c in equiv_map]
+    return min(matches or ideographs) if ideographs else None
+
+def patch_radical_master(rows, delta, new, equiv_map):
+    """radical_master_2026.csv の行のうち、親漢字候補(画数0)に変化があった部首だけを再計算する"""
+    affected = set()
+    for old_value, new_value in delta["changed_rs"].values():
+        for value in (old_value, new_value):
+            if value and value.endswith(".0"):
+                affected.add(radical_number(value))
+    candidates = {}
+    if affected:
+        for cp, value in new["fields"][RS_FIELD].items():
+            if value.endswith(".0"):
+                num = radical_number(value)
+                if num in affected:
+                    candidates.setdefault(num, []).append(cp)
+
+    by_num = {int(r['康熙部首番号']): r for r in rows}
+    changes = []
+    for num in sorted(n for n in affected if n and 1 <= n <= 214):
+        parent = select_parent(candidates.get(num, []), equiv_map)
+        supplements = equiv_map.get(parent, []) if parent is not None else []
+        kangxi = 0x2F00 + num - 1
+        after = {
+            '康熙部首番号': str(num),
+            '康熙部首文字': chr(kangxi),
+            '康熙部首コード': u_plus(kangxi),
+            '仲介常用漢字': chr(parent) if parent is not None else "N/A",
+            '常用漢字コード': u_plus(parent) if parent is not None else "N/A",
+            'CJK部首補助': "".join(chr(c) for c in supplements),
+            'CJK部首補助コード': ",".join(u_plus(c) for c in supplements) or "N/A",
+        }
+        before = by_num.get(num)
+        if before != after:
+            by_num[num] = after
+            changes.append((num, before, after))
+    return [by_num[n] for n in sorted(by_num)], changes
+
+def print_row_change(label, before, after, key_fields):
+    describe = lambda r: "(なし)" if r is None else " ".join(r[k] for k in key_fields)
+    print(f"  {label}: {describe(before)} -> {describe(after)}")
+
+def main():
+    """メイン処理: 2つのUCD版を比較し、派生マッピングCSVを差分だけ更新する"""
+    parser = argparse.ArgumentParser(description="2つのUCD版の差分から部首マッピングCSVを差分更新します。")
+    parser.add_argument("old", help="旧版の Unihan.zip または Unihan_*.txt を置いたディレクトリ")
+    parser.add_argument("new", help="新版の Unihan.zip または Unihan_*.txt を置いたディレクトリ")
+    parser.add_argument("--kangxi-mapping", default=KANGXI_MAPPING_FILE)
+    parser.add_argument("--radical-master", default=RADICAL_MASTER_FILE)
+    parser.add_argument("--equiv", default=None, help=f"新版の {EQUIV_FILE} (既定: 新版ディレクトリ内、無ければ radical_master と同じ場所)")
+    parser.add_argument("--dry-run", action="store_true", help="CSVを書き換えず差分の報告だけを行う")
+    args = parser.parse_args()
+
+    for source in (args.old, args.new):
+        if not os.path.exists(source):
+            print(f"エラー: {source} が見つかりません。", file=sys.stderr)
+            sys.exit(1)
+
+    fields = (RS_FIELD,) + VARIANT_FIELDS
+    print("ステップ1: 両版のUnihanデータを読み込み中 (解析キャッシュを使用)...")
+    old = load_unihan_fields(args.old, UNIHAN_MEMBERS, fields)
+    new = load_unihan_fields(args.new, UNIHAN_MEMBERS, fields)
+    print(f"  -> 旧版: {old['version'] or '不明'} / 新版: {new['version'] or '不明'}")
+    if not new["fields"][RS_FIELD]:
+        print(f"エラー: 新版から {RS_FIELD} を読み込めませんでした。", file=sys.stderr)
+        sys.exit(1)
+
+    print("\nステップ2: プロパティ単位の差分を計算中...")
+    delta = compute_delta(old, new)
+    print(f"  -> 新規コードポイント: {len(delta['new_code_points'])} 件")
+    print(f"  -> 削除されたコードポイント: {len(delta['removed_code_points'])} 件")
+    print(f"  -> {RS_FIELD} の変更: {len(delta['changed_rs'])} 件")
+    print(f"  -> 異体字エッジの追加: {len(delta['added_edges'])} 件 / 削除: {len(delta['removed_edges'])} 件")
+
+    print(f"\nステップ3: '{args.kangxi_mapping}' を差分更新中...")
+    kangxi_rows = read_csv_rows(args.kangxi_mapping, "utf-8")
+    kangxi_rows, kangxi_changes = patch_kangxi_mapping(kangxi_rows, delta, new)
+    for supp, before, after in kangxi_changes:
+        print_row_change(u_plus(supp), before, after, ("kangxi_radical_number", "kangxi_radical_char"))
+    print(f"  -> {len(kangxi_changes)} 行が変更されました。")
+
+    print(f"\nステップ4: '{args.radical_master}' を差分更新中...")
+    equiv_file = args.equiv
+    if equiv_file is None:
+        in_new = os.path.join(args.new, EQUIV_FILE) if os.path.isdir(args.new) else ""
+        equiv_file = in_new if os.path.exists(in_new) else os.path.join(os.path.dirname(args.radical_master), EQUIV_FILE)
+    radical_rows = read_csv_rows(args.radical_master, "utf-8-sig")
+    radical_rows, radical_changes = patch_radical_master(radical_rows, delta, new, load_equiv_map(equiv_file))
+    for num, before, after in radical_changes:
+        print_row_change(f"部首{num}", before, after, ('仲介常用漢字', '常用漢字コード', 'CJK部首補助コード'))
+    print(f"  -> {len(radical_changes)} 行が変更されました。")
+
+    if args.dry_run:
+        print("\n--dry-run のためCSVは更新しませんでした。")
+        return
+    if kangxi_changes:
+        write_csv_rows(args.kangxi_mapping, "utf-8", KANGXI_FIELDS, kangxi_rows)
+    if radical_changes:
+        write_csv_rows(args.radical_master, "utf-8-sig", RADICAL_FIELDS, radical_rows)
+    print("\n処理が完了しました。")
+
+if __name__ == "__main__":
+    main()
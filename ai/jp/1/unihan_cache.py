@@ -0,0 +1,69 @@
+import hashlib
+import os
+import pickle
+import re
+from unihan_zip import open_unihan, open_unihan_member
+
+# 解析結果の保存先。元データのパス・サイズ・更新日時が同じなら再解析しない
+CACHE_DIR = ".ucd_cache"
+CACHE_FORMAT = 1
+VERSION_REGEX = re.compile(r"#\s*Unicode Version\s+(\S+)")
+
+def _source_stat(source, member):
+    """キャッシュキーの材料となる元データの識別情報を返す"""
+    path = source if os.path.isfile(source) else os.path.join(source, member)
+    st = os.stat(path)
+    return (os.path.abspath(path), member, st.st_size, st.st_mtime_ns)
+
+def _open_source(source, member):
+    """source が zip ならそのメンバーを、ディレクトリならその中のファイルを開く"""
+    if os.path.isfile(source):
+        return open_unihan_member(source, member)
+    return open_unihan(os.path.join(source, member), zip_path=None)
+
+def _parse_member(source, member, fields):
+    """1メンバーを解析し (Unicodeバージョン, {フィールド名: {コードポイント: 値}}) を返す"""
+    version = None
+    data = {field: {} for field in fields}
+    with _open_source(source, member) as f:
+        for line in f:
+            if line.startswith("#"):
+                if version is None:
+                    m = VERSION_REGEX.match(line)
+                    if m:
+                        version = m.group(1)
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 3 and parts[1] in data:
+                data[parts[1]][int(parts[0][2:], 16)] = parts[2]
+    return version, data
+
+def load_unihan_fields(source, members, fields, cache_dir=CACHE_DIR):
+    """複数メンバーから指定フィールドを読み込む。解析結果はキャッシュし、元データが同じなら再利用する"""
+    fields = tuple(sorted(fields))
+    result = {"version": None, "fields": {field: {} for field in fields}}
+    for member in members:
+        try:
+            stat = _source_stat(source, member)
+        except FileNotFoundError:
+            continue
+        key = hashlib.sha1(repr((CACHE_FORMAT, stat, fields)).encode("utf-8")).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.pickle")
+        try:
+            with open(cache_path, "rb") as f:
+                version, data = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            try:
+                version, data = _parse_member(source, member, fields)
+            except FileNotFoundError:
+                # zip に該当メンバーが無い(版によって収録ファイルが異なる)
+                continue
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((version, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        result["version"] = result["version"] or version
+        for field, values in data.items():
+            result["fields"][field].update(values)
+    return result
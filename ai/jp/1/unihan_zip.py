@@ -0,0 +1,74 @@
+import io
+import os
+import sys
+import zipfile
+from contextlib import contextmanager
+
+# Unicodeコンソーシアムが配布するUnihanデータベース一式
+# https://www.unicode.org/Public/UCD/latest/ucd/Unihan.zip
+UNIHAN_ZIP = "Unihan.zip"
+# TextIOWrapperの読込単位。展開はこの大きさずつストリームで行われるため、
+# メンバーのサイズ(数十MB)に関係なくメモリ使用量は一定に収まる。
+READ_CHUNK_SIZE = 64 * 1024
+
+@contextmanager
+def open_unihan_member(zip_path, member):
+    """Unihan.zip のメンバーを展開せず、伸長しながら1行ずつ読めるテキストとして開く"""
+    with zipfile.ZipFile(zip_path) as zf:
+        try:
+            zf.getinfo(member)
+        except KeyError:
+            raise FileNotFoundError(f"{zip_path}:{member}") from None
+        # ZipFile.open() は読み出しに合わせて逐次伸長するため、ディスクへは何も書かない
+        with zf.open(member) as raw:
+            buffered = io.BufferedReader(raw, buffer_size=READ_CHUNK_SIZE)
+            with io.TextIOWrapper(buffered, encoding="utf-8") as f:
+                yield f
+
+@contextmanager
+def open_unihan(filename, zip_path=UNIHAN_ZIP):
+    """Unihan_*.txt を開く。展開済みファイルが無ければ Unihan.zip のメンバーをストリームで読む"""
+    if os.path.exists(filename):
+        with open(filename, "r", encoding="utf-8") as f:
+            yield f
+    elif zip_path and os.path.exists(zip_path):
+        with open_unihan_member(zip_path, os.path.basename(filename)) as f:
+            yield f
+    else:
+        raise FileNotFoundError(filename)
+
+def iter_unihan_records(f, fields=None):
+    """Unihan形式の行を1行ずつ解析し (コードポイント, フィールド名, 値) を返す"""
+    for line in f:
+        if line.startswith("#") or not line.strip():
+            continue
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) < 3:
+            continue
+        if fields is not None and parts[1] not in fields:
+            continue
+        yield int(parts[0][2:], 16), parts[1], parts[2]
+
+def list_unihan_members(zip_path=UNIHAN_ZIP):
+    """Unihan.zip に含まれる Unihan_*.txt の一覧と展開後サイズを返す"""
+    with zipfile.ZipFile(zip_path) as zf:
+        return [(i.filename, i.file_size, i.compress_size) for i in zf.infolist() if i.filename.endswith(".txt")]
+
+def main():
+    """メイン処理: Unihan.zip を展開せずに各メンバーのフィールド別件数を数える"""
+    zip_path = sys.argv[1] if len(sys.argv) > 1 else UNIHAN_ZIP
+    if not os.path.exists(zip_path):
+        print(f"エラー: {zip_path} が見つかりません。", file=sys.stderr)
+        sys.exit(1)
+
+    for member, size, compressed in list_unihan_members(zip_path):
+        print(f"{member} (展開後 {size:,} bytes / 圧縮 {compressed:,} bytes)")
+        counts = {}
+        with open_unihan_member(zip_path, member) as f:
+            for _, field, _ in iter_unihan_records(f):
+                counts[field] = counts.get(field, 0) + 1
+        for field, count in sorted(counts.items()):
+            print(f"  {field}: {count} 件")
+
+if __name__ == "__main__":
+    main()
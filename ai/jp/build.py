@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# ai/jp のデータ生成スクリプトを、入力・出力の宣言に従って必要なものだけ実行する。
+#
+# 各ターゲットは スクリプト・入力・出力 を持ち、ある出力を入力に取るターゲットはその生成元の後に実行する。
+# 入力・スクリプトの内容の sha1 が前回の成功時と同じで、出力も前回書いたまま残っていれば実行しない。
+# ファイルの sha1 は (サイズ, 更新日時) と組にして保存するので、変わっていないファイルは読まずに済む。
+# 依存の無いターゲットはプロセスプールで並行に実行する。パスはこのファイルのあるディレクトリからの相対パス。
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(ROOT, '.build_state.json')
+STATE_VERSION = 1
+MYENV = os.path.join('0', 'myenv')
+UCD = '1'
+
+# inputs の要素がタプルならそのうちどれか1つがあればよい (Unihan_*.txt は Unihan.zip からも読める)。args はスクリプトの引数
+Target = namedtuple('Target', 'name cwd script inputs outputs args')
+
+def target(name, cwd, script, inputs, outputs, args=()):
+    path = lambda p: os.path.normpath(os.path.join(cwd, p))
+    return Target(name, cwd, script, [tuple(map(path, i)) if isinstance(i, tuple) else path(i) for i in inputs], list(map(path, outputs)),
+                  list(args))
+
+TARGETS = [
+    target('mj-master', MYENV, 'extract_all_mj_master_list.py', ['mji.00602.xlsx'], ['all_mj_master_ordered.txt']),
+    target('ipa-master', MYENV, 'implemented_kanji.py', ['mji.00602.xlsx'], ['jp_kanji_ipa_master.txt']),
+    target('unimplemented', MYENV, 'unimplemented_kanji.py', ['mji.00602.xlsx'], ['unimplemented_jp_kanji_list.txt']),
+    target('svs', MYENV, 'extract_svs_characters.py', ['mji.00602.xlsx'], ['svs_characters_list.txt']),
+    target('patterns', MYENV, 'categorize_kanji_patterns.py', ['mji.00602.xlsx'], ['pattern_mu_yu_list.txt', 'pattern_mu_mu_list.txt']),
+    # NewCode のオフセットは newcode_codec.py の DEFAULT_OFFSET に合わせる (既定の 0 では ASCII と重なる)
+    target('charset', MYENV, 'integrate_kanji_attributes_v2.py', ['mji.00602.xlsx'], ['japanese_exclusive_charset_v1.txt'], ['0xF0000']),
+    # Unicode 13.0 以降の kRSUnicode・kCompatibilityVariant は Unihan_IRGSources.txt にある。
+    # 旧版の Unihan_RadicalStrokeCounts.txt・Unihan_Variants.txt も読むので、あれば入力に含める
+    target('kangxi-mapping', UCD, 'create_kangxi_radicals_map.py',
+           [('Unihan_IRGSources.txt', 'Unihan.zip'), ('Unihan_IRGSources.txt', 'Unihan_RadicalStrokeCounts.txt', 'Unihan_Variants.txt')],
+           ['kangxi_cjk_supplement_mapping.csv']),
+    # radical_master.py は添字が抜けて動かないので、動く最新版の -11 を使う
+    target('radical-master', MYENV, 'radical_master-11.py', ['Unihan_IRGSources.txt', 'EquivalentUnifiedIdeograph.txt'], ['radical_master_2026.csv']),
+    target('frontend-tables', MYENV, 'export_frontend_tables.py',
+           ['all_mj_master_ordered.txt', 'radical_master_2026.csv', os.path.join('..', '..', UCD, 'kangxi_cjk_supplement_mapping.csv')],
+           [os.path.join('..', '..', '..', '..', 'docs', 'asset', 'rbem_tables', 'manifest.json')]),
+]
+
+class FileHashes:
+    """ファイルの sha1 を (サイズ, 更新日時) と組にして覚えておき、変わったファイルだけを読み直す"""
+    def __init__(self, entries=None):
+        self.entries = entries or {}  # path -> [size, mtime_ns, sha1]
+        self.hashed = 0
+    def digest(self, path):
+        """path の sha1 を返す。無ければ None"""
+        try:
+            st = os.stat(os.path.join(ROOT, path))
+        except FileNotFoundError:
+            return None
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        with open(os.path.join(ROOT, path), 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha1').hexdigest()
+        self.entries[path] = [st.st_size, st.st_mtime_ns, digest]
+        self.hashed += 1
+        return digest
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if STATE_VERSION == data.get('version'):
+            return data['files'], data['targets']
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}, {}
+
+def save_state(files, targets, path=STATE_FILE):
+    """書きかけのファイルを読まれないよう一時ファイルから置き換える"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.build_state.')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'files': files, 'targets': targets}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def resolve_inputs(t, hashes):
+    """{入力パス: sha1} と、見つからない入力 (候補のどれも無いもの) の一覧を返す。スクリプト自身も入力に含める"""
+    found, missing = {}, []
+    for spec in [os.path.join(t.cwd, t.script)] + t.inputs:
+        candidates = spec if isinstance(spec, tuple) else (spec,)
+        digests = {p: hashes.digest(p) for p in candidates}
+        found.update((p, d) for p, d in digests.items() if d is not None)
+        if not any(d is not None for d in digests.values()):
+            missing.append(' または '.join(candidates))
+    return found, missing
+
+def dependencies(targets):
+    """{ターゲット名: 入力を生成するターゲット名の集合} を返す"""
+    producers = {out: t.name for t in targets for out in t.outputs}
+    deps = {}
+    for t in targets:
+        paths = [p for spec in t.inputs for p in (spec if isinstance(spec, tuple) else (spec,))]
+        deps[t.name] = {producers[p] for p in paths if p in producers} - {t.name}
+    return deps
+
+def select(targets, deps, names):
+    """指定したターゲットと、それが依存するターゲットを宣言順で返す"""
+    by_name = {t.name: t for t in targets}
+    wanted, stack = set(), list(names)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(deps[name])
+    return [by_name[n] for n in by_name if n in wanted]
+
+def command(t):
+    return ' '.join([os.path.join(t.cwd, t.script)] + t.args)
+
+def run_script(cwd, script, args):
+    """ワーカープロセスでスクリプトを実行し、(終了コード, 出力, 秒数) を返す"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, script] + args, cwd=os.path.join(ROOT, cwd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, errors='replace')
+    return proc.returncode, proc.stdout, time.perf_counter() - start
+
+class Builder:
+    def __init__(self, targets, deps, state_path=STATE_FILE, force=False, dry_run=False, verbose=False):
+        files, self.state = load_state(state_path)
+        self.hashes = FileHashes(files)
+        self.targets, self.deps, self.state_path = targets, deps, state_path
+        self.force, self.dry_run, self.verbose = force, dry_run, verbose
+        self.status = {}  # ターゲット名 -> 'skipped' / 'ran' / 'failed' / 'missing' / 'blocked'
+    def log(self, message):
+        print(message, file=sys.stderr)
+    def is_up_to_date(self, t, inputs):
+        recorded = self.state.get(t.name)
+        if self.force or recorded is None or recorded['inputs'] != inputs or recorded.get('args', []) != t.args:
+            return False
+        return all(self.hashes.digest(out) == digest for out, digest in recorded['outputs'].items())
+    def check(self, t):
+        """依存が終わったターゲットの実行要否を決める。実行するなら入力の sha1 を返す"""
+        if any(self.status[d] in ('failed', 'blocked') for d in self.deps[t.name]):
+            self.status[t.name] = 'blocked'
+            self.log(f"中止: {t.name} (依存先が失敗)")
+            return None
+        if self.dry_run and any('ran' == self.status[d] for d in self.deps[t.name]):
+            return {}  # 依存先を実行すれば入力が変わりうる
+        inputs, missing = resolve_inputs(t, self.hashes)
+        if missing:
+            # 入力が無ければ前回の出力をそのまま使う (mji.00602.xlsx を置いていない環境など)
+            self.status[t.name] = 'missing'
+            self.log(f"入力なし: {t.name} ({', '.join(missing)})")
+            return None
+        if self.is_up_to_date(t, inputs):
+            self.status[t.name] = 'skipped'
+            if self.verbose:
+                self.log(f"最新: {t.name}")
+            return None
+        return inputs
+    def finish(self, t, inputs, before, result):
+        code, output, elapsed = result
+        outputs = {out: self.hashes.digest(out) for out in t.outputs}
+        # エラーを表示して正常終了するスクリプトもあるので、出力が書かれたかも確かめる
+        stale = [out for out in t.outputs if outputs[out] is None or self.hashes.entries[out][:2] == before.get(out)]
+        if code or stale:
+            self.status[t.name] = 'failed'
+            reason = f"終了コード {code}" if code else f"{', '.join(stale)} が書かれていません"
+            self.log(f"失敗: {t.name} ({reason}, {elapsed:.2f} 秒)")
+            self.log(output.rstrip())
+            self.state.pop(t.name, None)
+            return
+        self.status[t.name] = 'ran'
+        self.state[t.name] = {'inputs': inputs, 'args': t.args, 'outputs': outputs}
+        self.log(f"完了: {t.name} ({elapsed:.2f} 秒)")
+        if self.verbose and output.strip():
+            self.log(output.rstrip())
+    def output_stats(self, t):
+        stats = {}
+        for out in t.outputs:
+            try:
+                st = os.stat(os.path.join(ROOT, out))
+                stats[out] = [st.st_size, st.st_mtime_ns]
+            except FileNotFoundError:
+                pass
+        return stats
+    def build(self, workers):
+        pending = list(self.targets)
+        running = {}  # future -> (ターゲット, 入力の sha1, 実行前の出力の (サイズ, 更新日時))
+        pool = None
+        try:
+            while pending or running:
+                ready = [t for t in pending if all(d in self.status for d in self.deps[t.name])]
+                for t in ready:
+                    pending.remove(t)
+                    inputs = self.check(t)
+                    if inputs is None:
+                        continue
+                    if self.dry_run:
+                        self.status[t.name] = 'ran'
+                        self.log(f"実行予定: {t.name} ({command(t)})")
+                        continue
+                    # 全ターゲットが最新なら、プロセスプールを作らずに終わる
+                    if pool is None:
+                        pool = ProcessPoolExecutor(workers)
+                    self.log(f"実行: {t.name} ({command(t)})")
+                    running[pool.submit(run_script, t.cwd, t.script, t.args)] = (t, inputs, self.output_stats(t))
+                if not running:
+                    if ready:
+                        continue
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    t, inputs, before = running.pop(future)
+                    try:
+                        result = future.result()
+                    except OSError as e:
+                        result = (-1, str(e), 0.0)
+                    self.finish(t, inputs, before, result)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if not self.dry_run:
+                save_state(self.hashes.entries, self.state, self.state_path)
+        return self.status
+
+def main():
+    """メイン処理: 入力が変わったターゲットだけを、依存の順に並行して実行する"""
+    parser = argparse.ArgumentParser(description="ai/jp のデータ生成スクリプトを、入力が変わったものだけ依存順に実行します。")
+    parser.add_argument('targets', nargs='*', help='実行するターゲット (省略時はすべて。依存先も含める)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='同時に実行するスクリプトの数')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='実行するターゲットを表示するだけにする')
+    parser.add_argument('--force', action='store_true', help='最新のターゲットも実行する')
+    parser.add_argument('--list', action='store_true', help='ターゲットと入力・出力・依存先を表示して終了する')
+    parser.add_argument('-v', '--verbose', action='store_true', help='最新のターゲットとスクリプトの出力も表示する')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    deps = dependencies(TARGETS)
+    if args.list:
+        for t in TARGETS:
+            inputs = ', '.join(' | '.join(i) if isinstance(i, tuple) else i for i in t.inputs)
+            print(f"{t.name}: {command(t)}\n  入力: {inputs}\n  出力: {', '.join(t.outputs)}\n  依存: {', '.join(sorted(deps[t.name])) or '-'}")
+        return
+    unknown = [n for n in args.targets if n not in deps]
+    if unknown:
+        print(f"エラー: 不明なターゲット {', '.join(unknown)} (--list で一覧を表示)", file=sys.stderr)
+        sys.exit(1)
+
+    builder = Builder(select(TARGETS, deps, args.targets or deps), deps, force=args.force, dry_run=args.dry_run, verbose=args.verbose)
+    status = builder.build(max(1, args.workers))
+    counts = {}
+    for s in status.values():
+        counts[s] = counts.get(s, 0) + 1
+    labels = (('ran', '実行予定' if args.dry_run else '実行'), ('skipped', '最新'), ('missing', '入力なし'), ('failed', '失敗'), ('blocked', '中止'))
+    summary = ', '.join(f"{label} {counts[s]}" for s, label in labels if s in counts)
+    print(f"ビルド: {summary} / ハッシュ計算 {builder.hashes.hashed} ファイル, {time.perf_counter() - start:.2f} 秒", file=sys.stderr)
+    sys.exit(1 if 'failed' in counts or 'blocked' in counts else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,447 @@
 #!/usr/bin/env python3
+import argparse
+import errno
+import functools
 import sys
 import os
 import re
+import threading
+from collections import deque, namedtuple
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 #DEFAULT_STRUCTURE_FILE = 'structure.def'
 DEFAULT_STRUCTURE_FILE = 'pj-structure.txt'
+# スレッドプールでファイルを作るとき、1スレッドにまとめて渡す件数
+FILE_BATCH_SIZE = 512
+# open(path, 'w') と同じ (無ければ作り、あれば空にする)。ファイルオブジェクトを作らない分だけ軽い
+CREATE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_CLOEXEC', 0)
+# --sync: 既にあるファイルは開きもしない (作成と確認の間に作られたものも O_EXCL で守る)
+SYNC_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_CLOEXEC', 0)
+LEADING_SPACE = re.compile(r'\s+')
+DEFAULT_INDENT = (' ', 4) # デフォルトはスペース4つ
+# 「名前 < テンプレート」で、テンプレートの内容を持つファイルを作る
+TEMPLATE_SEPARATOR = ' < '
+# ioctl(FICLONE): btrfs/XFS などでデータを共有する複製(reflink)を作る
+FICLONE = 0x40049409
+# この方法が使えないことを表す errno (別の方法で複製し直す)
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF, errno.EPERM}
+COPY_MODES = ('auto', 'reflink', 'copy', 'hardlink')
 
-def detect_indent(lines: list[str]) -> str:
-    """テキストからインデント文字列（タブまたはスペース）を自動検出する"""
-    for line in lines:
-        match = re.match(r'^(\s+)', line)
-        if match:
-            indent_str = match.group(1)
-            if '\t' in indent_str:
-                return '\t'
-            if len(indent_str) >= 2:
-                return ' ' * len(indent_str)
-    return '    ' # デフォルトはスペース4つ
-
-def get_indent_level(line: str, indent_str: str) -> int:
-    """行のインデントレベルを計算する"""
-    level = 0
-    while line.startswith(indent_str * (level + 1)):
-        level += 1
-    return level
-
-def create_structure(structure_text: str):
-    """構造定義テキストに基づいてディレクトリとファイルを作成する"""
-    lines = structure_text.strip().split('\n')
-    indent_str = detect_indent(lines)
-    
-    path_stack = ['']
-    last_level = -1
+Entry = namedtuple('Entry', 'kind path line_num template')
 
-    for i, line in enumerate(lines):
-        line_num = i + 1
-        
-        if not line.strip():
-            continue # 空行はスキップ
+class Plan:
+    """作成するディレクトリとファイルの一覧。重複は除き、定義に現れた順を保つ"""
+    def __init__(self):
+        self.dirs = {}   # path -> None
+        self.files = {}  # path -> テンプレート (無ければ None)
+    def add_dir(self, path: str):
+        self.dirs[path] = None
+    def add_file(self, path: str, template: str | None = None):
+        self.files[path] = template
+    def ordered_dirs(self) -> list[str]:
+        """作成するディレクトリ(ファイルの親や途中の階層も含む)を、浅い順に1つずつ返す"""
+        dirs = set()
+        for path in [*self.dirs, *(os.path.dirname(f) for f in self.files)]:
+            while path and path not in dirs:
+                dirs.add(path)
+                path = os.path.dirname(path)
+        return sorted(dirs, key=lambda d: (d.count(os.sep), d))
+
+class StructureError(ValueError):
+    """構造定義の誤り。行番号を持つ"""
+    def __init__(self, line_num: int, message: str):
+        super().__init__(f"エラー (行 {line_num}): {message}")
+        self.line_num = line_num
+
+def detect_indent(line: str) -> tuple[str, int] | None:
+    """行頭の空白からインデント（タブ、またはスペースn個）を検出する。判断できない行は None"""
+    match = LEADING_SPACE.match(line)
+    if match:
+        indent_str = match.group(0)
+        if '\t' in indent_str:
+            return '\t', 1
+        if len(indent_str) >= 2:
+            return ' ', len(indent_str)
+    return None
 
-        level = get_indent_level(line, indent_str)
+def measure_lines(lines: Iterable[str]) -> Iterator[tuple[int, int | None, str]]:
+    """各行を (行番号, 階層, 名前) にする。空行は階層 None
+
+    インデントは最初にインデントされた行から決め、階層は行頭のインデント文字の数を幅で割って1回で求める。
+    先頭の行のインデントと先頭・末尾の空行は、従来どおり定義全体を strip() したものとして無視する。"""
+    indent = None
+    started = False
+    for line_num, line in enumerate(lines, 1):
+        line = line.rstrip('\n')
         name = line.strip()
+        if not started:
+            if not name:
+                continue
+            started = True
+            line = line.lstrip()
+        if indent is None:
+            indent = detect_indent(line)
+        if not name:
+            yield line_num, None, ''
+            continue
+        char, width = indent or DEFAULT_INDENT
+        yield line_num, (len(line) - len(line.lstrip(char))) // width, name
+
+def parse_lines(lines: Iterable[str]) -> Iterator[Entry]:
+    """構造定義を1行ずつ解析し、Entry('dir' または 'file', パス, 行番号, テンプレート) を定義の順に返すジェネレータ
+
+    ディレクトリかどうかは次の1行だけを先読みして決めるため、入力を読み終える前から結果を返す。"""
+    path_stack = ['']  # 各階層までの結合済みのパス (深さに比例する join を行ごとに繰り返さない)
+    last_level = -1
+    rows = measure_lines(lines)
+    current = next(rows, None)
+    while current is not None:
+        following = next(rows, None)
+        line_num, level, name = current
+        current = following
+        if level is None:
+            continue # 空行はスキップ
 
         # インデントが不正（多段飛ばし）な場合はエラー
         if level > last_level + 1:
-            print(f"エラー (行 {line_num}): インデントが不正です。階層を飛ばすことはできません。", file=sys.stderr)
-            sys.exit(1)
+            raise StructureError(line_num, "インデントが不正です。階層を飛ばすことはできません。")
+        del path_stack[level + 1:]
 
-        while len(path_stack) > level + 1:
-            path_stack.pop()
-
-        current_path_parts = path_stack[:level + 1]
-        
-        is_dir = name.endswith('/')
-        if not is_dir and i + 1 < len(lines):
-            next_line = lines[i + 1]
-            if next_line.strip() and get_indent_level(next_line, indent_str) > level:
-                is_dir = True
-        
+        name, _, template = name.partition(TEMPLATE_SEPARATOR)
+        name, template = name.rstrip(), template.strip() or None
+        is_dir = name.endswith('/') or (following is not None and following[1] is not None and following[1] > level)
+        if is_dir and template is not None:
+            raise StructureError(line_num, "ディレクトリにはテンプレートを指定できません。")
         if is_dir:
             name = name.rstrip('/')
-            full_path = os.path.join(*current_path_parts, name)
-            print(f"Creating dir:  {full_path}/")
-            os.makedirs(full_path, exist_ok=True)
-            path_stack.append(name)
+            path = os.path.join(path_stack[-1], name)
+            yield Entry('dir', path, line_num, None)
+            path_stack.append(path)
         else:
-            full_path = os.path.join(*current_path_parts, name)
-            parent_dir = os.path.dirname(full_path)
-            
-            # 親パスが空文字列になるケースをガード
-            if parent_dir:
-                os.makedirs(parent_dir, exist_ok=True)
-                
-            print(f"Creating file: {full_path}")
-            with open(full_path, 'w') as f:
-                pass
-        
+            yield Entry('file', os.path.join(path_stack[-1], name), line_num, template)
         last_level = level
 
+def parse_structure(lines: Iterable[str]) -> Plan:
+    """構造定義を解析し、作成する内容を Plan にまとめる (ファイルシステムには触れない)"""
+    plan = Plan()
+    for entry in parse_lines(lines):
+        if 'dir' == entry.kind:
+            plan.add_dir(entry.path)
+        else:
+            plan.add_file(entry.path, entry.template)
+    return plan
+
+class TemplateCopier:
+    """テンプレートの内容をファイルに複製する
+
+    auto では reflink (データを共有し、書き換えた時に初めて複製される) → copy_file_range (カーネル内でのコピー。
+    NFS などではサーバ側、btrfs/XFS では reflink になる) → read/write の順に試し、使えなかった方法は以後使わない。
+    hardlink はテンプレートと同じ実体を指すため、作ったファイルを編集するとテンプレートも変わる
+    (別のファイルシステムなどでリンクを作れなければ auto と同じ方法で複製する)。"""
+    def __init__(self, root: str = '.', mode: str = 'auto'):
+        self.root = root
+        self.mode = mode
+        self.use_hardlink = 'hardlink' == mode
+        self.use_reflink = fcntl is not None and 'copy' != mode
+        self.use_copy_file_range = hasattr(os, 'copy_file_range') and 'copy' != mode
+        self.counters = dict.fromkeys(('reflink', 'copy_file_range', 'copy', 'hardlink'), 0)
+        self._lock = threading.Lock()
+    def source(self, template: str) -> str:
+        return os.path.join(self.root, template)
+    def check(self, templates: Iterable[str]):
+        """作成を始める前に、テンプレートがすべてあることを確かめる"""
+        for template in set(templates):
+            if not os.path.isfile(self.source(template)):
+                raise FileNotFoundError(errno.ENOENT, "テンプレートが見つかりません", self.source(template))
+    def count(self, method: str):
+        with self._lock:
+            self.counters[method] += 1
+    def copy(self, template: str, path: str, flags: int = CREATE_FLAGS):
+        src = self.source(template)
+        if self.use_hardlink:
+            try:
+                try:
+                    os.link(src, path)
+                except FileExistsError:
+                    if flags & os.O_EXCL:
+                        raise
+                    os.unlink(path)
+                    os.link(src, path)
+                self.count('hardlink')
+                return
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS and errno.EMLINK != e.errno:
+                    raise
+                if errno.EMLINK != e.errno:
+                    self.use_hardlink = False
+        sfd = os.open(src, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+        try:
+            st = os.fstat(sfd)
+            dfd = open_for_create(path, flags)
+            try:
+                os.fchmod(dfd, st.st_mode & 0o7777)
+                self.count(self.copy_data(sfd, dfd, st.st_size))
+            finally:
+                os.close(dfd)
+        finally:
+            os.close(sfd)
+    def copy_data(self, sfd: int, dfd: int, size: int) -> str:
+        """中身を複製し、使った方法の名前を返す"""
+        if self.use_reflink:
+            try:
+                fcntl.ioctl(dfd, FICLONE, sfd)
+                return 'reflink'
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self.use_reflink = False
+        if self.use_copy_file_range:
+            try:
+                offset = 0
+                while offset < size:
+                    n = os.copy_file_range(sfd, dfd, size - offset, offset, offset)
+                    if 0 == n:
+                        break
+                    offset += n
+                return 'copy_file_range'
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self.use_copy_file_range = False
+                os.ftruncate(dfd, 0)
+        os.lseek(sfd, 0, os.SEEK_SET)
+        while chunk := os.read(sfd, 1024 * 1024):
+            os.write(dfd, chunk)
+        return 'copy'
+
+def open_for_create(path: str, flags: int = CREATE_FLAGS) -> int:
+    try:
+        return os.open(path, flags, 0o666)
+    except FileNotFoundError:
+        # 名前に / を含むなど、親ディレクトリが定義に無い場合
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return os.open(path, flags, 0o666)
+
+def create_files(items: list[tuple[str, str | None]], copier: TemplateCopier | None = None, flags: int = CREATE_FLAGS):
+    """(パス, テンプレート) のファイルを作る。テンプレートが無ければ空のファイル。SYNC_FLAGS なら既存のものは飛ばす"""
+    for path, template in items:
+        try:
+            if template is None:
+                os.close(open_for_create(path, flags))
+            else:
+                copier.copy(template, path, flags)
+        except FileExistsError:
+            if not flags & os.O_EXCL:
+                raise
+
+def make_dir(path: str):
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        if not os.path.isdir(path):
+            raise
+    except FileNotFoundError:
+        os.makedirs(path, exist_ok=True)
+
+def file_line(path: str, template: str | None, prefix: str = '') -> str:
+    return f"{prefix}{path}\n" if template is None else f"{prefix}{path}{TEMPLATE_SEPARATOR}{template}\n"
+
+def create_entries(dirs: list[str], files: list[tuple[str, str | None]], workers: int = 0,
+                   copier: TemplateCopier | None = None, flags: int = CREATE_FLAGS):
+    """ディレクトリを並び順に1回ずつ mkdir し、ファイルはまとめて作る"""
+    for path in dirs:
+        make_dir(path)
+    if 1 < workers and FILE_BATCH_SIZE < len(files):
+        batches = [files[i:i + FILE_BATCH_SIZE] for i in range(0, len(files), FILE_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(functools.partial(create_files, copier=copier, flags=flags), batches))
+    else:
+        create_files(files, copier, flags)
+
+def apply_plan(plan: Plan, workers: int = 0, verbose: bool = True, copier: TemplateCopier | None = None):
+    """Plan のとおりに作成する。ディレクトリは浅い順に作る"""
+    copier = copier or TemplateCopier()
+    copier.check(t for t in plan.files.values() if t is not None)
+    dirs = plan.ordered_dirs()
+    files = list(plan.files.items())
+    create_entries(dirs, files, workers, copier)
+    if verbose:
+        sys.stdout.write(''.join([f"Creating dir:  {path}/\n" for path in dirs] + [file_line(path, t, "Creating file: ") for path, t in files]))
+
+def scan_existing(plan_dirs: set[str]) -> dict[str, bool]:
+    """カレントから、定義にあるディレクトリだけを os.scandir で1回ずつ読み、既にあるパス -> ディレクトリか を返す"""
+    existing = {}
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(rel or '.')
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for entry in it:
+                path = os.path.join(rel, entry.name)
+                is_dir = entry.is_dir()
+                existing[path] = is_dir
+                if is_dir and path in plan_dirs:
+                    stack.append(path)
+    return existing
+
+def sync_plan(plan: Plan, workers: int = 0, verbose: bool = True, copier: TemplateCopier | None = None,
+              dry_run: bool = False, report_extra: bool = False) -> dict[str, int]:
+    """既存のツリーに、定義にあって無いものだけを作る。既存のファイルは切り詰めない
+
+    既にあるかどうかは scan_existing の1回の走査で調べ、エントリごとの stat はしない。"""
+    copier = copier or TemplateCopier()
+    dirs = {os.path.normpath(d): d for d in plan.ordered_dirs()}
+    files = {os.path.normpath(f): (f, t) for f, t in plan.files.items()}
+    existing = scan_existing(set(dirs))
+    # 定義と種類が違うもの(ディレクトリのはずがファイルなど)は壊さずに中止する
+    for path in dirs.keys() | files.keys():
+        if path in existing and existing[path] != (path in dirs):
+            raise FileExistsError(errno.EEXIST, "定義と種類が違うものが既にあります", path)
+    missing_dirs = [d for path, d in dirs.items() if path not in existing]
+    missing_files = [item for path, item in files.items() if path not in existing]
+    copier.check(t for _, t in missing_files if t is not None)
+    if dry_run:
+        sys.stdout.write(''.join([f"{path}/\n" for path in missing_dirs] + [file_line(path, t) for path, t in missing_files]))
+    else:
+        create_entries(missing_dirs, missing_files, workers, copier, SYNC_FLAGS)
+        if verbose:
+            sys.stdout.write(''.join([f"Creating dir:  {path}/\n" for path in missing_dirs] + [file_line(path, t, "Creating file: ") for path, t in missing_files]))
+    if report_extra:
+        extras = sorted(path for path in existing if path not in dirs and path not in files)
+        sys.stdout.write(''.join(f"Extra: {path}/\n" if existing[path] else f"Extra: {path}\n" for path in extras))
+    stats = {'existing': len(dirs) + len(files) - len(missing_dirs) - len(missing_files),
+             'created': len(missing_dirs) + len(missing_files), 'extra': sum(1 for p in existing if p not in dirs and p not in files)}
+    print(f"既存 {stats['existing']} 件、{'作成予定' if dry_run else '作成'} {stats['created']} 件、定義に無いもの {stats['extra']} 件", file=sys.stderr)
+    return stats
+
+def print_plan(plan: Plan):
+    """--dry-run: 作成する順にパスを表示する"""
+    dirs = plan.ordered_dirs()
+    sys.stdout.write(''.join([f"{path}/\n" for path in dirs] + [file_line(path, t) for path, t in plan.files.items()]))
+    print(f"ディレクトリ {len(dirs)} 件、ファイル {len(plan.files)} 件 (作成していません)", file=sys.stderr)
+
+def stream_structure(lines: Iterable[str], workers: int = 0, dry_run: bool = False, verbose: bool = True,
+                     copier: TemplateCopier | None = None) -> int:
+    """解析しながら作成する。保持するのは現在のパスの階層と作成待ちのファイル(最大 workers×2 バッチ)だけ
+
+    ディレクトリは定義に現れた時点で作る。ファイルの親は必ずそれより前に現れるため、ファイルは溜めてまとめて作れる。"""
+    copier = copier or TemplateCopier()
+    count = 0
+    batch = []
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=workers) if 1 < workers else None
+    def flush():
+        if pool is None:
+            create_files(batch, copier)
+            return
+        pending.append(pool.submit(create_files, batch, copier))
+        while len(pending) > workers * 2:
+            pending.popleft().result()
+    try:
+        for entry in parse_lines(lines):
+            count += 1
+            is_dir = 'dir' == entry.kind
+            if dry_run:
+                sys.stdout.write(f"{entry.path}/\n" if is_dir else file_line(entry.path, entry.template))
+                continue
+            if verbose:
+                sys.stdout.write(f"Creating dir:  {entry.path}/\n" if is_dir else file_line(entry.path, entry.template, "Creating file: "))
+            if is_dir:
+                make_dir(entry.path)
+            else:
+                batch.append((entry.path, entry.template))
+                if FILE_BATCH_SIZE <= len(batch):
+                    flush()
+                    batch = []
+        if batch:
+            flush()
+        while pending:
+            pending.popleft().result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return count
+
+def create_structure(lines: Iterable[str], workers: int = 0, dry_run: bool = False, verbose: bool = True, stream: bool = False,
+                     copier: TemplateCopier | None = None, sync: bool = False, report_extra: bool = False) -> int:
+    """構造定義に基づいてディレクトリとファイルを作成し、定義の項目数を返す
+
+    既定では先に全体を解析するため、定義に誤りがあれば何も作らずに終了する。
+    stream=True では読みながら作成する (誤りがあればその行の手前まで作られる)。
+    sync=True では既にあるものには触れず、無いものだけを作る。"""
+    if isinstance(lines, str):
+        lines = lines.split('\n')
+    if stream:
+        return stream_structure(lines, workers, dry_run, verbose, copier)
+    plan = parse_structure(lines)
+    if sync:
+        sync_plan(plan, workers, verbose, copier, dry_run, report_extra)
+    elif dry_run:
+        print_plan(plan)
+    else:
+        apply_plan(plan, workers, verbose, copier)
+    return len(plan.dirs) + len(plan.files)
+
 def main():
     """メイン処理: 入力ソースを決定し、構造を生成する"""
-    structure_content = None
+    parser = argparse.ArgumentParser(description='構造定義(インデントで階層を表したパスの一覧)からディレクトリとファイルを作成する')
+    parser.add_argument('file', nargs='?', help=f'構造定義ファイル (省略時は標準入力、それも無ければ {DEFAULT_STRUCTURE_FILE})')
+    parser.add_argument('--dry-run', action='store_true', help='作成せずに、作成するパスを表示する')
+    parser.add_argument('--workers', type=int, default=0, help='ファイルの作成に使うスレッド数 (0: 使わない)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='作成したパスを表示しない')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--stream', action='store_true', help='全体を読み終えるのを待たず、読みながら作成する (巨大な定義をパイプで流す場合)')
+    mode.add_argument('--sync', action='store_true', help='既存のツリーに無いものだけを作る (既存のファイルは切り詰めない)')
+    parser.add_argument('--report-extra', action='store_true', help='--sync で、定義に無いのにディスク上にあるものを表示する')
+    parser.add_argument('--templates', help=f"「名前{TEMPLATE_SEPARATOR}テンプレート」のテンプレートの基準ディレクトリ (省略時は構造定義ファイルのディレクトリ、標準入力ならカレント)")
+    parser.add_argument('--copy', choices=COPY_MODES, default='auto',
+                        help='テンプレートの複製方法 (auto: reflink→copy_file_range→通常のコピー / hardlink: 同じ実体を共有する)')
+    args = parser.parse_args()
+    template_root = '.'
     
     # stdinのチェック
     if not sys.stdin.isatty():
-        structure_content = sys.stdin.read()
-        if sys.argv[1:]:
+        source = sys.stdin
+        if args.file:
             print("警告: stdinを優先し、入力ファイルを無視しました。", file=sys.stderr)
 
     # 引数ファイルのチェック
-    elif len(sys.argv) > 1:
-        filepath = sys.argv[1]
+    elif args.file:
+        filepath = args.file
         if not os.path.exists(filepath):
             print(f"エラー: 入力ファイルが存在しません: {filepath}", file=sys.stderr)
             sys.exit(1)
-        with open(filepath, 'r') as f:
-            structure_content = f.read()
+        source = open(filepath, 'r')
+        template_root = os.path.dirname(filepath) or '.'
             
     # デフォルトファイルのチェック
     else:
         if not os.path.exists(DEFAULT_STRUCTURE_FILE):
             print(f"エラー: デフォルトの構造定義ファイルが見つかりません: {DEFAULT_STRUCTURE_FILE}", file=sys.stderr)
             sys.exit(1)
-        with open(DEFAULT_STRUCTURE_FILE, 'r') as f:
-            structure_content = f.read()
+        source = open(DEFAULT_STRUCTURE_FILE, 'r')
 
-    if structure_content:
-        create_structure(structure_content)
+    copier = TemplateCopier(args.templates or template_root, args.copy)
+    with source:
+        try:
+            count = create_structure(source, args.workers, args.dry_run, not args.quiet, args.stream, copier, args.sync, args.report_extra)
+        except StructureError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        except (FileNotFoundError, FileExistsError) as e:
+            print(f"エラー: {e.strerror}: {e.filename}", file=sys.stderr)
+            sys.exit(1)
+    if any(copier.counters.values()):
+        print(f"テンプレートの複製: {copier.counters}", file=sys.stderr)
+    if count and not args.dry_run:
         print("プロジェクト構造の生成が完了しました。")
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+// ai/jp/0/myenv/export_frontend_tables.py が出力した manifest.json と shard(*.bin) を読む (既定の出力先は /asset/rbem_tables/)。
+// shardは必要になった時点で1つずつ取得し、取得済みのものは再利用する。
+export class PackedTable {
+    static async load(manifestUrl) {
+        const res = await fetch(manifestUrl);
+        if (!res.ok) {throw new Error(`manifestの取得に失敗しました: ${manifestUrl} (${res.status})`)}
+        return new PackedTable(new URL(manifestUrl, location.href), await res.json());
+    }
+    constructor(baseUrl, manifest) {
+        this._baseUrl = baseUrl;
+        this._manifest = manifest;
+        this._shards = new Map(); // file -> Promise<columns>
+    }
+    table(name) {
+        const table = this._manifest.tables[name];
+        if (!table) {throw new Error(`テーブルがありません: ${name}`)}
+        return table;
+    }
+    // コードポイントを含むMJ行をすべて返す(該当shardだけを取得する)
+    async mjRows(cp) {
+        const table = this.table('mj');
+        const key = (cp >> table.shard_bits).toString(16).padStart(3, '0');
+        const shard = table.shards.find(s=>s.key===key);
+        if (!shard) {return []}
+        const cols = await this.shard(table, shard);
+        const rows = [];
+        for (let i=0; i<shard.rows; i++) {
+            if (cols.cp[i]===cp) {rows.push(Object.fromEntries(table.columns.map(c=>[c.name, cols[c.name][i]])))}
+        }
+        return rows;
+    }
+    async rows(name) {
+        const table = this.table(name);
+        const all = [];
+        for (let shard of table.shards) {
+            const cols = await this.shard(table, shard);
+            for (let i=0; i<shard.rows; i++) {all.push(Object.fromEntries(table.columns.map(c=>[c.name, cols[c.name][i]])))}
+        }
+        return all;
+    }
+    shard(table, shard) {
+        if (!this._shards.has(shard.file)) {
+            this._shards.set(shard.file, fetch(new URL(shard.file, this._baseUrl)).then(res=>{
+                if (!res.ok) {throw new Error(`shardの取得に失敗しました: ${shard.file} (${res.status})`)}
+                return res.arrayBuffer();
+            }).then(buf=>ShardDecoder.decode(buf, table.columns, this._manifest.magic)));
+        }
+        return this._shards.get(shard.file);
+    }
+}
+class ShardDecoder {
+    static decode(buf, columns, magic) {
+        const view = new DataView(buf);
+        const bytes = new Uint8Array(buf);
+        if (new TextDecoder().decode(bytes.subarray(0, 4))!==magic) {throw new Error(`shardの形式が違います。`)}
+        const rows = view.getUint32(4, true);
+        const cols = {};
+        let pos = 8;
+        for (let c of columns) {
+            const len = view.getUint32(pos, true);
+            cols[c.name] = this[c.encoding.replace(/-(.)/g, (m,s)=>s.toUpperCase())](bytes.subarray(pos+4, pos+4+len), rows);
+            pos += 4 + len;
+        }
+        return cols;
+    }
+    static *#varints(bytes) {
+        let n = 0, shift = 0;
+        for (let b of bytes) {
+            n += (b & 0x7F) * 2**shift;
+            if (b & 0x80) {shift += 7} else {yield n; n = 0; shift = 0;}
+        }
+    }
+    static varint(bytes, rows) {return [...this.#varints(bytes)]}
+    static zigzagDelta(bytes, rows) {
+        let prev = 0;
+        return [...this.#varints(bytes)].map(z=>prev += (z % 2 ? -(z + 1) / 2 : z / 2));
+    }
+    static deltaRle(bytes, rows) {
+        const values = [], it = this.#varints(bytes);
+        let prev = 0;
+        for (let delta of it) {
+            const run = it.next().value;
+            for (let i=0; i<run; i++) {values.push(prev += delta)}
+        }
+        return values;
+    }
+    static varintList(bytes, rows) {
+        const values = [], it = this.#varints(bytes);
+        for (let count of it) {values.push(Array.from({length:count}, ()=>it.next().value))}
+        return values;
+    }
+    static utf8(bytes, rows) {
+        const values = [], decoder = new TextDecoder();
+        let pos = 0;
+        for (let i=0; i<rows; i++) {
+            let len = 0, shift = 0, b;
+            do {b = bytes[pos++]; len += (b & 0x7F) * 2**shift; shift += 7;} while (b & 0x80);
+            values.push(decoder.decode(bytes.subarray(pos, pos+len)));
+            pos += len;
+        }
+        return values;
+    }
+}
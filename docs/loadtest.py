@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from module_graph import page_graph
+
+# run_server.py に並行してリクエストを送り、スループットと応答時間を測る
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+def make_connection(base, timeout):
+    if 'https' == base.scheme:
+        # ローカルの自己署名証明書を使うため検証しない
+        context = ssl._create_unverified_context()
+        return http.client.HTTPSConnection(base.hostname, base.port or 443, timeout=timeout, context=context)
+    return http.client.HTTPConnection(base.hostname, base.port or 80, timeout=timeout)
+
+def run(base_url, paths, requests, concurrency, timeout=30):
+    """paths を順に繰り返し、合計 requests 件を concurrency 本の並行接続で取得する"""
+    base = urlsplit(base_url)
+    latencies, errors, sizes = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            try:
+                conn = make_connection(base, timeout)
+                conn.request('GET', path)
+                res = conn.getresponse()
+                body = res.read()
+                conn.close()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if res.status >= 400:
+                        errors.append(f'{res.status} {path}')
+                    latencies.append(elapsed)
+                    sizes.append(len(body))
+            except (OSError, http.client.HTTPException) as e:
+                with lock:
+                    errors.append(f'{type(e).__name__} {path}')
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'url': base_url, 'mode': 'paths', 'requests': requests, 'concurrency': concurrency,
+        'completed': len(latencies), 'errors': len(errors), 'error_samples': errors[:10],
+        'seconds': round(wall, 3), 'requests_per_sec': round(len(latencies) / wall, 1) if wall else 0.0,
+        'bytes': sum(sizes),
+        'latency_ms': {p: round(percentile(latencies, int(p[1:])) * 1000, 2) for p in ('p50', 'p90', 'p99')},
+    }
+
+def replay_pages(base_url, levels, pages, clients, connections=6, reuse=True, preload=False, timeout=30):
+    """ページの依存グラフを段ごとに再現して読み込む
+
+    clients 人のブラウザが、それぞれ connections 本の接続で1段ずつ並行取得する (段の取得が終わるまで次の段は分からない)。
+    reuse=True では接続を持続させてページをまたいで使い回し、False ではリクエストごとに接続を張り直す。
+    preload=True では index.html の Link ヘッダにあるファイルを、ブラウザと同じく次の段でまとめて取得する。"""
+    base = urlsplit(base_url)
+    latencies, page_times, errors, sizes = [], [], [], []
+    lock = threading.Lock()
+    counter = iter(range(pages))
+    headers = {'Accept-Encoding': 'gzip, br'}
+
+    def fetch(conns, slot, path):
+        for attempt in (0, 1):
+            conn = conns[slot] if reuse and conns[slot] is not None else make_connection(base, timeout)
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers if reuse else dict(headers, Connection='close'))
+                res = conn.getresponse()
+                body = res.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                conns[slot] = None
+                # 持続接続がサーバ側で閉じられていた場合は1度だけ張り直す
+                if reuse and 0 == attempt and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+                    continue
+                with lock:
+                    errors.append(f'{type(e).__name__} {path}')
+                return None
+            elapsed = time.perf_counter() - start
+            if reuse and not res.will_close:
+                conns[slot] = conn
+            else:
+                conn.close()
+                conns[slot] = None
+            with lock:
+                if res.status >= 400:
+                    errors.append(f'{res.status} {path}')
+                latencies.append(elapsed)
+                sizes.append(len(body))
+            return res.getheader('Link')
+
+    def waves(link):
+        """Link で先読みを指示されたファイルを1段目に繰り上げた読み込み順"""
+        hinted = re.findall(r'<([^>]+)>', link or '') if preload else []
+        if not hinted:
+            return levels[1:]
+        first = levels[1] + [url for url in hinted if url not in levels[1]]
+        rest = [[url for url in level if url not in hinted] for level in levels[2:]]
+        return [first] + [level for level in rest if level]
+
+    def client():
+        conns = [None] * connections
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    break
+                start = time.perf_counter()
+                link = fetch(conns, 0, levels[0][0])
+                for level in waves(link):
+                    # 1本の接続に同時に2つのリクエストを流さないよう、接続ごとに担当分を順に取得する
+                    list(pool.map(lambda slot: [fetch(conns, slot, path) for path in level[slot::connections]], range(min(connections, len(level)))))
+                with lock:
+                    page_times.append(time.perf_counter() - start)
+        for conn in conns:
+            if conn is not None:
+                conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    page_times.sort()
+    return {
+        'url': base_url, 'mode': 'page', 'requests': len(latencies) + len(errors), 'concurrency': clients,
+        'connections': connections, 'reuse': reuse, 'preload': preload, 'pages': pages,
+        'completed': len(latencies), 'errors': len(errors), 'error_samples': errors[:10],
+        'seconds': round(wall, 3), 'requests_per_sec': round(len(latencies) / wall, 1) if wall else 0.0,
+        'pages_per_sec': round(len(page_times) / wall, 1) if wall else 0.0,
+        'bytes': sum(sizes),
+        'latency_ms': {p: round(percentile(latencies, int(p[1:])) * 1000, 2) for p in ('p50', 'p90', 'p99')},
+        'page_ms': {p: round(percentile(page_times, int(p[1:])) * 1000, 2) for p in ('p50', 'p90', 'p99')},
+        'graph': {'levels': [len(level) for level in levels], 'files': sum(len(level) for level in levels)},
+    }
+
+def response_size(res, body):
+    """ステータス行・ヘッダ・本文を合わせたおおよその受信バイト数"""
+    return len(body) + sum(len(k) + len(v) + 4 for k, v in res.getheaders()) + 17
+
+def reload_cost(base_url, paths, timeout=30):
+    """ブラウザの初回表示と再読込(ウォームキャッシュ)で、送るリクエスト数と受信バイト数を比べる"""
+    base = urlsplit(base_url)
+    cache = {}
+    cold = {'requests': 0, 'bytes': 0}
+    for path in paths:
+        conn = make_connection(base, timeout)
+        conn.request('GET', path, headers={'Accept-Encoding': 'gzip, br'})
+        res = conn.getresponse()
+        body = res.read()
+        conn.close()
+        cold['requests'] += 1
+        cold['bytes'] += response_size(res, body)
+        cache[path] = (res.getheader('ETag'), res.getheader('Last-Modified'), res.getheader('Cache-Control') or '')
+    warm = {'requests': 0, 'bytes': 0, 'not_modified': 0, 'fresh': 0}
+    for path in paths:
+        etag, last_modified, cache_control = cache[path]
+        if 'immutable' in cache_control:
+            # immutable な応答はブラウザが再読込でも問い合わせない
+            warm['fresh'] += 1
+            continue
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if etag:
+            headers['If-None-Match'] = etag
+        elif last_modified:
+            headers['If-Modified-Since'] = last_modified
+        conn = make_connection(base, timeout)
+        conn.request('GET', path, headers=headers)
+        res = conn.getresponse()
+        body = res.read()
+        conn.close()
+        warm['requests'] += 1
+        warm['bytes'] += response_size(res, body)
+        warm['not_modified'] += 304 == res.status
+    return {'url': base_url, 'paths': len(paths), 'cold': cold, 'warm': warm}
+
+def handshake_rate(base_url, connections, concurrency, resume=False, timeout=30):
+    """TLS接続を張ってはすぐ閉じ、1秒あたりのハンドシェイク数を測る
+
+    resume=True ではスレッドごとに前回のセッションを渡し、短縮ハンドシェイク(セッション再開)を試みる。
+    TLS1.3のセッションチケットはハンドシェイク後に届くため、各接続でHEADを1回送って応答を読む。"""
+    base = urlsplit(base_url)
+    host, port = base.hostname, base.port or 443
+    context = ssl._create_unverified_context()
+    request = f'HEAD / HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode('ascii')
+    latencies, errors, reused = [], [], [0]
+    lock = threading.Lock()
+    counter = iter(range(connections))
+
+    def worker():
+        session = None
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                with socket.create_connection((host, port), timeout=timeout) as sock:
+                    with context.wrap_socket(sock, server_hostname=host, session=session if resume else None) as tls:
+                        handshake = time.perf_counter() - start
+                        tls.sendall(request)
+                        while tls.recv(65536):
+                            pass
+                        with lock:
+                            latencies.append(handshake)
+                            reused[0] += tls.session_reused
+                        session = tls.session
+            except (OSError, ssl.SSLError) as e:
+                with lock:
+                    errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'url': base_url, 'connections': connections, 'concurrency': concurrency, 'resume': resume,
+        'completed': len(latencies), 'errors': len(errors), 'session_reused': reused[0],
+        'seconds': round(wall, 3), 'handshakes_per_sec': round(len(latencies) / wall, 1) if wall else 0.0,
+        'handshake_ms': {p: round(percentile(latencies, int(p[1:])) * 1000, 2) for p in ('p50', 'p90', 'p99')},
+    }
+
+def print_summary(result):
+    lat = result['latency_ms']
+    print(f"{result['url']} 並行数 {result['concurrency']}: {result['completed']}/{result['requests']} 件成功, エラー {result['errors']} 件")
+    print(f"  {result['requests_per_sec']} req/s, p50 {lat['p50']} ms, p90 {lat['p90']} ms, p99 {lat['p99']} ms, {result['bytes']:,} bytes")
+    if 'page' == result.get('mode'):
+        page = result['page_ms']
+        print(f"  {result['pages_per_sec']} pages/s ({result['graph']['files']} files, {len(result['graph']['levels'])} 段), p50 {page['p50']} ms, p90 {page['p90']} ms, p99 {page['p99']} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='run_server.py の負荷試験')
+    parser.add_argument('paths', nargs='*', default=['/index.html'], help='取得するパス (繰り返し使う)')
+    parser.add_argument('--url', default='https://localhost:8000')
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力する')
+    parser.add_argument('--reload', action='store_true', help='負荷試験の代わりに、初回表示と再読込の転送量を比べる')
+    parser.add_argument('--page', help='docs/NN のページ(index.html と import で辿れるモジュール)を段ごとに読み込む。-n はページ数、-c はブラウザ数')
+    parser.add_argument('--root', default=os.path.dirname(os.path.abspath(__file__)), help='--page で走査する docs のルート')
+    parser.add_argument('--connections', type=int, default=6, help='--page で1ブラウザあたりの並行接続数')
+    parser.add_argument('--no-reuse', action='store_true', help='--page でリクエストごとに接続を張り直す')
+    parser.add_argument('--entry', action='append', default=[], help='--page で根に加えるエントリモジュール (例: 26/js/jaml/inline/rbem/fast/src/main.js、複数指定可)')
+    parser.add_argument('--scan', action='store_true', help='--page で docs/NN/js のテスト以外の全モジュールを根に加える')
+    parser.add_argument('--preload', action='store_true', help="--page で index.html の Link ヘッダに従って先読みする")
+    parser.add_argument('--handshakes', action='store_true', help='負荷試験の代わりに、TLSハンドシェイク/秒を測る (-n 接続数)')
+    parser.add_argument('--resume', action='store_true', help='--handshakes でセッション再開を使う')
+    args = parser.parse_args()
+
+    if args.handshakes:
+        result = handshake_rate(args.url, args.requests, args.concurrency, args.resume)
+        if args.json:
+            json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        else:
+            lat = result['handshake_ms']
+            print(f"{result['url']} 並行数 {result['concurrency']}: {result['completed']}/{result['connections']} 接続, 再開 {result['session_reused']}, エラー {result['errors']} 件")
+            print(f"  {result['handshakes_per_sec']} handshakes/s, p50 {lat['p50']} ms, p90 {lat['p90']} ms, p99 {lat['p99']} ms")
+        return
+    if args.reload:
+        result = reload_cost(args.url, args.paths)
+        cold, warm = result['cold'], result['warm']
+        print(f"初回: {cold['requests']} リクエスト / {cold['bytes']:,} bytes")
+        print(f"再読込: {warm['requests']} リクエスト (304: {warm['not_modified']}, 問い合わせ不要: {warm['fresh']}) / {warm['bytes']:,} bytes")
+        return
+    if args.page:
+        try:
+            graph = page_graph(args.root, args.page, entries=args.entry, scan=args.scan)
+        except FileNotFoundError as e:
+            print(f"エラー: エントリモジュール {e} が見つかりません。", file=sys.stderr)
+            sys.exit(1)
+        # index.html だけではモジュールを読み込まないページが多い。import の段が無ければ再現の意味が薄いので知らせる
+        if len(graph['levels']) < 3:
+            print(f"警告: {graph['page']} の依存グラフに import の段がありません ({graph['modules']} モジュール)。"
+                  "--entry でエントリモジュールを指定するか、--scan を付けてください。", file=sys.stderr)
+        result = replay_pages(args.url, graph['levels'], args.requests, args.concurrency, args.connections, not args.no_reuse, args.preload)
+    else:
+        result = run(args.url, args.paths, args.requests, args.concurrency)
+    if args.json:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_summary(result)
+    if result['errors']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+import argparse
+import html.parser
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+# docs/NN/index.html が読み込むモジュールから import 文を静的に辿り、ページが読み込むモジュールの依存グラフを求める
+
+# import ... from '...' / export ... from '...' / import '...' / import('...')
+IMPORT_RE = re.compile(r'''(?<![\w$.])(?:import|export)\s*(?:[\w$*{}\s,]+?\s*from\s*)?(['"])([^'"\n]+)\1|(?<![\w$.])import\(\s*(['"])([^'"\n]+)\3\s*\)''')
+
+def strip_comments(source):
+    """コメントを空白に置き換える。文字列・テンプレートリテラルの中の // や /* は残す"""
+    out, i, n = [], 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '\'"`':
+            j = i + 1
+            while j < n and source[j] != c:
+                j += 2 if '\\' == source[j] else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            out.append('\n' * source.count('\n', i, n if j < 0 else j))
+            i = n if j < 0 else j + 2
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+def scan_imports(source):
+    """モジュールが読み込む指定子(specifier)を出現順に返す"""
+    specs = []
+    for m in IMPORT_RE.finditer(strip_comments(source)):
+        spec = m.group(2) or m.group(4)
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+def resolve(spec, importer, root):
+    """指定子をdocsルートからの相対パスにする。bun:test や vanjs-core のような裸の指定子は None"""
+    if spec.startswith('/'):
+        path = os.path.normpath(os.path.join(root, spec.lstrip('/')))
+    elif spec.startswith(('./', '../')):
+        path = os.path.normpath(os.path.join(os.path.dirname(importer), spec))
+    else:
+        return None
+    return path if os.path.isfile(path) else None
+
+def read_imports(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return scan_imports(f.read())
+
+class ScanCache:
+    """ファイルごとの走査結果を (サイズ, 更新日時) と組にして保持する。変わったファイルだけを読み直す
+
+    path を指定すると JSON に保存し、次回の起動でも使う。"""
+    VERSION = 1
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}  # path -> [size, mtime_ns, [spec]]
+        self.dirty = False
+        self.counters = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if self.VERSION == data.get('version'):
+                    self.entries = data['entries']
+            except (OSError, ValueError, KeyError):
+                pass
+    def imports(self, path):
+        st = os.stat(path)
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                self.counters['hits'] += 1
+                return entry[2]
+        specs = read_imports(path)
+        with self._lock:
+            self.entries[path] = [st.st_size, st.st_mtime_ns, specs]
+            self.counters['misses'] += 1
+            self.dirty = True
+        return specs
+    def save(self):
+        """変更があれば書き出す。書きかけのファイルを読まれないよう一時ファイルから置き換える"""
+        with self._lock:
+            if not self.path or not self.dirty:
+                return
+            data = json.dumps({'version': self.VERSION, 'entries': self.entries}, ensure_ascii=False)
+            self.dirty = False
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix='.module_graph.')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self.entries))
+
+class ModuleGraph:
+    """モジュール(ファイルパス)ごとの依存先と、解決できなかった指定子を保持する"""
+    def __init__(self, root, cache=None):
+        self.root = root
+        self.cache = cache
+        self.deps = {}        # path -> [path]
+        self.unresolved = {}  # path -> [spec]
+    def scan(self, path):
+        return self.cache.imports(path) if self.cache is not None else read_imports(path)
+    def add(self, path):
+        """path から辿れるモジュールをすべてグラフに加える"""
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            if path in self.deps:
+                continue
+            deps, unresolved = [], []
+            for spec in self.scan(path):
+                target = resolve(spec, path, self.root)
+                if target is None:
+                    unresolved.append(spec)
+                else:
+                    deps.append(target)
+                    stack.append(target)
+            self.deps[path], self.unresolved[path] = deps, unresolved
+    def roots(self):
+        imported = {d for deps in self.deps.values() for d in deps}
+        return sorted(p for p in self.deps if p not in imported)
+    def levels(self, roots=None):
+        """ブラウザが見つける順の段(0段目=根、n段目=n-1段目が import するもの)。同じモジュールは最初の段にだけ置く"""
+        level = sorted(roots if roots is not None else self.roots())
+        seen, levels = set(level), []
+        while level:
+            levels.append(level)
+            nxt = []
+            for path in level:
+                for dep in self.deps.get(path, []):
+                    if dep not in seen:
+                        seen.add(dep)
+                        nxt.append(dep)
+            level = sorted(nxt)
+        return levels
+    def url(self, path):
+        return '/' + os.path.relpath(path, self.root).replace(os.sep, '/')
+
+class PageAssets(html.parser.HTMLParser):
+    """index.html の <script src> と <link href>、インラインの <script type="module"> の本文を集める"""
+    def __init__(self):
+        super().__init__()
+        self.scripts, self.links, self.inline = [], [], []
+        self._inline = None
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if 'script' == tag and attrs.get('src'):
+            self.scripts.append((attrs['src'], 'module' == attrs.get('type')))
+        elif 'script' == tag and 'module' == attrs.get('type'):
+            self._inline = []
+        elif 'link' == tag and attrs.get('href') and attrs.get('rel') in ('stylesheet', 'modulepreload', 'icon'):
+            self.links.append((attrs['href'], attrs['rel']))
+    def handle_data(self, data):
+        if self._inline is not None:
+            self._inline.append(data)
+    def handle_endtag(self, tag):
+        if 'script' == tag and self._inline is not None:
+            self.inline.append(''.join(self._inline))
+            self._inline = None
+
+# 先読みの種類 (Link ヘッダの as=)。アイコンは描画に必要ないため先読みしない
+PRELOAD_AS = {'.css': 'style', '.woff2': 'font', '.woff': 'font', '.png': 'image', '.jpg': 'image', '.jpeg': 'image',
+              '.gif': 'image', '.svg': 'image', '.webp': 'image'}
+
+def is_test(path):
+    parts = path.split(os.sep)
+    return 'test' in parts or path.endswith(('.test.js', '.spec.js'))
+
+def resolve_entry(entry, root):
+    """--entry のパス (カレントディレクトリまたはdocsルートからの相対パス) を解決する。無ければ None"""
+    for path in (entry, os.path.join(root, entry.lstrip('/'))):
+        if os.path.isfile(path):
+            # グラフのパスは resolve と同じく root からの形にそろえる
+            return os.path.normpath(os.path.join(root, os.path.relpath(os.path.abspath(path), os.path.abspath(root))))
+    return None
+
+def page_graph(root, version, cache=None, entries=(), scan=False):
+    """docs/NN のページの読み込み順を段ごとのURLで返す
+
+    0段目: index.html、1段目: index.html が参照するスクリプト・CSSと、<script type="module" src> および
+    インラインの <script type="module"> が import するモジュール (ページが読み込まないモジュールは含めない)、
+    2段目以降: import で辿れるモジュール。preload は index.html 以外の先読みできるファイル、
+    files は結果が依存するファイル (どれかが変われば結果も変わる)
+
+    負荷試験用に、entries (エントリモジュールのパス) や scan=True (docs/NN/js のテスト以外の全モジュール) を
+    根に加えられる。index.html がモジュールを読み込まないページでも import の段を再現するため"""
+    page_dir = os.path.join(root, str(version))
+    index = os.path.join(page_dir, 'index.html')
+    graph = ModuleGraph(root, cache)
+    assets, modules, kinds, inline_unresolved = [], [], {}, []
+    if os.path.isfile(index):
+        parser = PageAssets()
+        with open(index, 'r', encoding='utf-8') as f:
+            parser.feed(f.read())
+        for ref, is_module in parser.scripts:
+            path = resolve(ref if ref.startswith(('/', './', '../')) else './' + ref, index, root)
+            if path is not None:
+                (modules if is_module else assets).append(path)
+                if not is_module:
+                    kinds[path] = 'script'
+        for ref, rel in parser.links:
+            path = resolve(ref if ref.startswith(('/', './', '../')) else './' + ref, index, root)
+            if path is not None:
+                assets.append(path)
+                if 'icon' == rel:
+                    kinds[path] = None
+        for source in parser.inline:
+            for spec in scan_imports(source):
+                path = resolve(spec, index, root)
+                if path is None:
+                    inline_unresolved.append(spec)
+                elif path not in modules:
+                    modules.append(path)
+    for entry in entries:
+        path = resolve_entry(entry, root)
+        if path is None:
+            raise FileNotFoundError(entry)
+        if path not in modules:
+            modules.append(path)
+    if scan:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(page_dir, 'js')):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if name.endswith(('.js', '.mjs')) and not is_test(path) and path not in modules:
+                    modules.append(path)
+    for path in modules:
+        graph.add(path)
+    roots = [p for p in graph.roots() if p in modules or p in assets]
+    levels = graph.levels(roots)
+    first = sorted(set(assets) | set(levels[0] if levels else []))
+    levels = [[graph.url(index)]] + [[graph.url(p) for p in first]] + [[graph.url(p) for p in level] for level in levels[1:]]
+    unresolved = sorted({spec for specs in graph.unresolved.values() for spec in specs} | set(inline_unresolved))
+    preload = []
+    for path in first + [p for level in graph.levels(roots)[1:] for p in level]:
+        kind = kinds[path] if path in kinds else 'module' if path in graph.deps else PRELOAD_AS.get(os.path.splitext(path)[1].lower())
+        if kind is not None:
+            preload.append({'url': graph.url(path), 'as': kind})
+    return {'page': graph.url(index), 'levels': levels, 'modules': len(graph.deps), 'unresolved': unresolved,
+            'preload': preload, 'files': sorted(set(graph.deps) | set(assets) | {index})}
+
+def link_header(entry):
+    """Link ヘッダ(103 Early Hints にも使う)の値。ES モジュールは modulepreload で依存先ごと取得させる"""
+    if 'module' == entry['as']:
+        return f"<{entry['url']}>; rel=modulepreload"
+    crossorigin = '; crossorigin' if 'font' == entry['as'] else ''
+    return f"<{entry['url']}>; rel=preload; as={entry['as']}{crossorigin}"
+
+def link_tag(entry):
+    """index.html の <head> に書く場合の <link> 要素"""
+    if 'module' == entry['as']:
+        return f'<link rel="modulepreload" href="{entry["url"]}">'
+    crossorigin = ' crossorigin' if 'font' == entry['as'] else ''
+    return f'<link rel="preload" href="{entry["url"]}" as="{entry["as"]}"{crossorigin}>'
+
+class PreloadManifest:
+    """run_server.py 用。ページ(docs/NN/index.html)ごとの Link ヘッダを返す
+
+    結果はページ単位で持ち、依存するファイルの (サイズ, 更新日時) が変わったときだけ計算し直す。
+    その確認も CHECK_INTERVAL 秒に1回だけ行い、間のリクエストには前回の結果をそのまま返す。
+    計算し直す際も、変わっていないファイルの import は ScanCache から取り出す。"""
+    CHECK_INTERVAL = 1.0
+    def __init__(self, root, cache_path=None):
+        self.root = root
+        self.cache = ScanCache(cache_path)
+        self._pages = {}  # version -> [署名, 依存するファイル, [Link ヘッダの値], 確認した時刻]
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'rebuilds': 0}
+    def signature(self, files):
+        # ページが読み込むモジュールが変わるのは、index.html かいずれかのモジュールが書き換わったとき
+        sig = []
+        for path in files:
+            try:
+                st = os.stat(path)
+                sig.append((path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                sig.append((path, None, None))
+        return tuple(sig)
+    def links(self, version):
+        version = str(version)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._pages.get(version)
+            if cached is not None and now - cached[3] < self.CHECK_INTERVAL:
+                self.counters['hits'] += 1
+                return cached[2]
+        if cached is not None and cached[0] == self.signature(cached[1]):
+            with self._lock:
+                cached[3] = now
+                self.counters['hits'] += 1
+            return cached[2]
+        graph = page_graph(self.root, version, cache=self.cache)
+        links = [link_header(entry) for entry in graph['preload']]
+        with self._lock:
+            self._pages[version] = [self.signature(graph['files']), graph['files'], links, now]
+            self.counters['rebuilds'] += 1
+        self.cache.save()
+        return links
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, pages=len(self._pages), scan=self.cache.stats())
+
+def main():
+    parser = argparse.ArgumentParser(description='docs/NN/index.html が読み込むモジュールの import を走査して依存グラフを表示する')
+    parser.add_argument('version', help='docs のバージョン番号 (例: 26)')
+    parser.add_argument('--root', default=os.path.dirname(os.path.abspath(__file__)), help='docs のルート')
+    parser.add_argument('--format', choices=('json', 'html', 'link'), default='json',
+                        help='json: 依存グラフ / html: <link rel="modulepreload"> 要素 / link: 103 Early Hints の Link ヘッダ')
+    parser.add_argument('--cache', default='.module_graph_cache.json', help="走査結果の保存先 ('none'で保存しない)")
+    parser.add_argument('--entry', action='append', default=[], help='根に加えるエントリモジュール (複数指定可)')
+    parser.add_argument('--scan', action='store_true', help='docs/NN/js のテスト以外の全モジュールを根に加える')
+    args = parser.parse_args()
+    cache = ScanCache(None if 'none' == args.cache else args.cache)
+    try:
+        graph = page_graph(args.root, args.version, cache=cache, entries=args.entry, scan=args.scan)
+    except FileNotFoundError as e:
+        print(f"エラー: エントリモジュール {e} が見つかりません。", file=sys.stderr)
+        sys.exit(1)
+    cache.save()
+    if 'html' == args.format:
+        print('\n'.join(link_tag(entry) for entry in graph['preload']))
+    elif 'link' == args.format:
+        print('\n'.join(f'Link: {link_header(entry)}' for entry in graph['preload']))
+    else:
+        del graph['files']
+        json.dump(graph, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    print(f"走査: {cache.stats()}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
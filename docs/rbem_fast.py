@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# js/rbem-fast.js (RbEmFast.parse) の Python 移植。run_server.py が .txt 原稿をサーバ側でHTMLにするために使う。
+# 出力は JS 版と1文字違わず一致させる (python3 rbem_fast.py --check で rbem-fast.test.js の全入力を比較する)。
+
+# JS の \s と String.prototype.trim() が対象にする空白 (Python の \s / str.strip() とは範囲が違う)
+JS_WHITESPACE = r'\t\n\v\f\r \u00A0\u1680\u2000-\u200A\u2028\u2029\u202F\u205F\u3000\uFEFF'
+INVALID_CHARS = r'\u0000-\u0008\u000E-\u001F\u0085\u200B\u2060\u00AD\u000E\u000F'
+INVALID_CHARS_REGEX = re.compile(f'[{INVALID_CHARS}]')
+# JS の $ は (mフラグ無しでは) 末尾の改行の前には一致しないため \Z を使う
+IS_ONLY_WHITESPACE = re.compile(f'^(?:[{JS_WHITESPACE}]|[{INVALID_CHARS}])+\\Z')
+JS_TRIM = re.compile(f'^[{JS_WHITESPACE}]+|[{JS_WHITESPACE}]+\\Z')
+ALLOWED_SCHEMES = {'slashes': ['https', 'http'], 'colons': ['mailto', 'tel']}
+META_CHARS = re.compile('[《》｜]')
+EM_REGEX = re.compile('《《([^》]*?)》》')
+REGEX = re.compile('|'.join([
+    '(《《[^》]*?》》)《([^》]*)》',                  # 1. 強調＋ルビ
+    '(｜)((?:《《[^》]*?》》|[^《])*?)《([^》]*)》',  # 2. パイプ付与形
+    '([一-龠〇々〆ヶヵ仝〻〼ヿ]+)《(?!《)([^》]*)》',  # 3. パイプ省略形
+    '《《([^》]*?)》》',                              # 4. 強調のみ
+]))
+# rbem-fast.js の最後の動作する版 (docs/22 以降は作業途中のため構文エラーになる)
+REFERENCE_JS = os.path.join('21', 'js', 'rbem-fast.js')
+REFERENCE_TEST = os.path.join('21', 'js', 'rbem-fast.test.js')
+
+class RbEmFastError(Exception):
+    """JS 版が例外を投げる入力 (undefined の参照や new Error())。結果を一致させるためこちらも例外にする"""
+
+def js_trim(text):
+    return JS_TRIM.sub('', text)
+
+def is_valid_url(text):
+    for section in ('slashes', 'colons'):
+        if any(text.startswith(f"{scheme}:{'//' if section == 'slashes' else ''}") for scheme in ALLOWED_SCHEMES[section]):
+            return True
+    return False
+
+def js_or(*values):
+    """JS の a || b || c。空文字も偽として扱い、すべて偽なら最後の値(None=undefined)を返す"""
+    for value in values:
+        if value:
+            return value
+    return values[-1]
+
+def em_html(m):
+    em_content = m.group(1)
+    if '\n' in em_content or META_CHARS.search(em_content):
+        raise RbEmFastError('invalid emphasis in base')
+    return f'<em class="bouten">{em_content}</em>'
+
+def replace(m):
+    (em_base, em_ruby, pipe, pipe_base, pipe_ruby, short_base, short_ruby, emphasis) = m.groups()
+    match = m.group(0)
+    # --- 4. 強調のみ ---
+    if emphasis is not None:
+        if '\n' in emphasis or META_CHARS.search(emphasis):
+            return match
+        if js_trim(emphasis) == '' or IS_ONLY_WHITESPACE.search(emphasis) or INVALID_CHARS_REGEX.search(emphasis):
+            return match
+        return f'<em class="bouten">{emphasis}</em>'
+
+    # --- 1, 2, 3. ルビを持つパターン ---
+    base = js_or(em_base, pipe_base, short_base)
+    ruby_content = js_or(em_ruby, pipe_ruby, short_ruby)
+    # --- 無効な構文のチェック ---
+    # JS 版は空の親文字・ルビを undefined として .includes() を呼び例外になる (|| の短絡評価の順序も合わせる)
+    if base is None:
+        raise RbEmFastError("Cannot read properties of undefined (reading 'includes')")
+    if '\n' in base:
+        return match
+    if ruby_content is None:
+        raise RbEmFastError("Cannot read properties of undefined (reading 'includes')")
+    if '\n' in ruby_content:
+        return match
+    if INVALID_CHARS_REGEX.search(base) or INVALID_CHARS_REGEX.search(ruby_content):
+        return match
+    if META_CHARS.search(EM_REGEX.sub('', base)):
+        return match
+    if re.search('[《》]', ruby_content):
+        return match
+    if ruby_content.count('|') >= 3:
+        return match
+
+    temp_parts = re.split(r'\||｜', ruby_content)
+    urls = [p for p in temp_parts if is_valid_url(p)]
+    if len(urls) > 1:
+        return match
+    url = urls[0] if urls else None
+    ruby_parts = [p for p in temp_parts if not is_valid_url(p)]
+    if len(ruby_parts) > 2:
+        return match
+
+    is_valid_down_ruby = (len(ruby_parts) == 2 and ruby_parts[0] == '' and js_trim(ruby_parts[1]) != ''
+                          and not IS_ONLY_WHITESPACE.search(ruby_parts[1]))
+    if not is_valid_down_ruby:
+        if any(p == '' or IS_ONLY_WHITESPACE.search(p) for p in ruby_parts):
+            return match
+
+    # --- 有効な構文のHTML変換 ---
+    parsed_base = EM_REGEX.sub(em_html, base)
+    ruby_html = ''
+    actual_ruby_texts = [p for p in ruby_parts if js_trim(p) != '']
+    if is_valid_down_ruby:
+        ruby_html = f'<ruby class="under">{parsed_base}<rt>{ruby_parts[1]}</rt></ruby>'
+    elif len(actual_ruby_texts) == 2:
+        ruby_html = f'<ruby class="under"><ruby class="over">{parsed_base}<rt>{actual_ruby_texts[0]}</rt></ruby><rt aria-hidden="true">{actual_ruby_texts[1]}</rt></ruby>'
+    elif len(actual_ruby_texts) == 1:
+        ruby_html = f'<ruby class="over">{parsed_base}<rt>{actual_ruby_texts[0]}</rt></ruby>'
+
+    result = ruby_html or parsed_base
+    if url:
+        result = f'<a href="{url}" target="_blank" rel="noopener noreferrer">{result}</a>'
+    return result
+
+class RbEmFast:
+    @staticmethod
+    def parse(text):
+        if not isinstance(text, str) or len(text) == 0:
+            return ''
+        processed = (text
+            .replace('\\\\', '%%BS%%')
+            .replace('\\《', '%%L%%')
+            .replace('\\》', '%%R%%')
+            .replace('\\｜', '%%P%%'))
+        processed = REGEX.sub(replace, processed)
+        return (processed
+            .replace('%%L%%', '《')
+            .replace('%%R%%', '》')
+            .replace('%%P%%', '｜')
+            .replace('%%BS%%', '\\'))
+
+# --check で使う bun:test の代用品。テストを実行して RbEmFast.parse の入出力をすべて記録する
+HARNESS_SHIM = '''
+export const describe = (name, fn) => fn();
+describe.skip = describe;
+export const test = (name, fn) => { try { fn(); } catch (e) {} };
+test.skip = test;
+export const expect = () => ({ toBe() {} });
+'''
+HARNESS_RECORDER = '''
+import { RbEmFast as Reference } from './reference.js';
+export const cases = [];
+export class RbEmFast {
+    static parse(text) {
+        try {
+            const output = Reference.parse(text);
+            cases.push({input: text, output});
+            return output;
+        } catch (e) {
+            cases.push({input: text, error: String(e)});
+            throw e;
+        }
+    }
+}
+'''
+HARNESS_MAIN = '''
+import { cases } from './rbem-fast.js';
+await import('./test.js');
+process.stdout.write(JSON.stringify(cases));
+'''
+
+def js_cases(js_file, test_file, node='node'):
+    """rbem-fast.test.js を node で実行し、JS 版の (入力, 出力 or 例外) を集める"""
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(js_file, os.path.join(tmp, 'reference.js'))
+        with open(test_file, 'r', encoding='utf-8') as f:
+            test = f.read().replace("'bun:test'", "'./bun-test.js'")
+        files = {'test.js': test, 'bun-test.js': HARNESS_SHIM, 'rbem-fast.js': HARNESS_RECORDER,
+                 'main.js': HARNESS_MAIN, 'package.json': '{"type": "module"}'}
+        for name, content in files.items():
+            with open(os.path.join(tmp, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+        out = subprocess.run([node, os.path.join(tmp, 'main.js')], check=True, capture_output=True, text=True, encoding='utf-8')
+    return json.loads(out.stdout)
+
+def check(js_file=REFERENCE_JS, test_file=REFERENCE_TEST):
+    """JS 版と出力が一致しない入力の数を返す"""
+    cases = js_cases(js_file, test_file)
+    failures = 0
+    for case in cases:
+        try:
+            actual = {'output': RbEmFast.parse(case['input'])}
+        except RbEmFastError as e:
+            actual = {'error': str(e)}
+        if ('error' in case) != ('error' in actual) or actual.get('output') != case.get('output'):
+            failures += 1
+            print(f"不一致: {case['input']!r}\n  JS: {case}\n  PY: {actual}", file=sys.stderr)
+    print(f"{len(cases)} 件中 {len(cases) - failures} 件一致 ({sum('error' in c for c in cases)} 件は両方とも例外)")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='ルビ・傍点記法(《》｜)をHTMLに変換する (rbem-fast.js と同じ結果)')
+    parser.add_argument('file', nargs='?', help='原稿ファイル (省略時は標準入力)')
+    parser.add_argument('--check', action='store_true', help='rbem-fast.test.js の全入力で JS 版と出力を比較する (node が必要)')
+    parser.add_argument('--js', default=REFERENCE_JS)
+    parser.add_argument('--test', default=REFERENCE_TEST)
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(1 if check(args.js, args.test) else 0)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = sys.stdin.read()
+    sys.stdout.write(RbEmFast.parse(text))
+
+if __name__ == '__main__':
+    main()
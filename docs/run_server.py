@@ -1,25 +1,1097 @@
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http import HTTPStatus
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import ctypes
+import ctypes.util
+import datetime
+import email.utils
+import gzip
+import hashlib
+import io
+import json
+import re
+import selectors
+import socket
 import ssl
 import socketserver
+import struct
+import threading
 import os
+from urllib.parse import parse_qs, urlsplit
+from rbem_fast import RbEmFast, RbEmFastError
+from module_graph import PreloadManifest
+import queue
+import sys
+import time
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # https://qiita.com/00b012deb7c8/items/6d4e93ac10de24cf7c79
 # https://qiita.com/relu/items/3461753e3886072349c7
 
+# 圧縮して配信する種類。画像などもともと圧縮済みの形式は対象外
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+COMPRESS_MIN_SIZE = 256
+# 本文を送るときの1回あたりのバイト数
+CHUNK_SIZE = 64 * 1024
+
+class PrecompressedStore:
+    """ファイルの圧縮版(gzip/br)を、元ファイルの版(サイズ・更新日時)ごとに1度だけ作ってディスクに保持する"""
+    SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+    @staticmethod
+    def encodings():
+        return ('br', 'gzip') if brotli else ('gzip',)
+    def variant(self, path, st, encoding):
+        """圧縮版のパスを返す。まだ無ければ作る"""
+        key = hashlib.sha1(f'{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}'.encode('utf-8')).hexdigest()
+        variant = os.path.join(self.directory, key + self.SUFFIXES[encoding])
+        if not os.path.exists(variant):
+            with open(path, 'rb') as f:
+                data = f.read()
+            data = brotli.compress(data) if 'br' == encoding else gzip.compress(data, compresslevel=9, mtime=0)
+            tmp = f'{variant}.{os.getpid()}.{id(data)}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, variant)
+        return variant
+
+# パスごとの Cache-Control。上から順に最初に一致したものを使う
+CACHE_RULES = [
+    # ページ本体は毎回再検証する(ETagが同じなら304で本文を送らない)
+    (re.compile(r'(^|/)(index\.html?)?$|\.html?$'), 'no-cache'),
+    # docs/NN/ は版ごとに凍結したデモ、lib/名前/x.y.z/ は版付きのライブラリなので変更されない
+    (re.compile(r'^/\d+/|^/lib/[^/]+/\d+\.\d+\.\d+/'), 'public, max-age=31536000, immutable'),
+]
+DEFAULT_CACHE_CONTROL = 'no-cache'
+
+def cache_control_for(url_path):
+    for pattern, value in CACHE_RULES:
+        if pattern.search(url_path):
+            return value
+    return DEFAULT_CACHE_CONTROL
+
+class ETagStore:
+    """ファイル内容のハッシュから強いETagを作る。ハッシュはファイルの版(サイズ・更新日時)ごとに1度だけ計算する"""
+    SUFFIXES = {None: '', 'gzip': '-gz', 'br': '-br'}
+    def __init__(self):
+        self._digests = {}
+    def etag(self, path, st, encoding=None):
+        key = (path, st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()[:20]
+            self._digests[key] = digest
+        return self.format(digest, encoding)
+    def format(self, digest, encoding=None):
+        # 圧縮版は内容が異なるため、符号化ごとに別のETagにする
+        return f'"{digest}{self.SUFFIXES[encoding]}"'
+
+class InotifyWatcher:
+    """inotify でディレクトリを監視し、変更されたファイルのパスを callback に渡す (Linux のみ)"""
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x002, 0x004, 0x008
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x040, 0x080, 0x100, 0x200
+    IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED = 0x400, 0x800, 0x4000, 0x8000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    EVENT = struct.Struct('iIII')
+    def __init__(self, callback, overflow):
+        self._callback, self._overflow = callback, overflow
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs, self._wds = {}, {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name='inotify', daemon=True).start()
+    @classmethod
+    def create(cls, callback, overflow):
+        """使えない環境では None を返す (呼び出し側は更新日時の確認で代用する)"""
+        try:
+            return cls(callback, overflow)
+        except (OSError, AttributeError, TypeError):
+            return None
+    def watch(self, directory):
+        with self._lock:
+            if directory in self._wds:
+                return True
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                return False
+            self._dirs[wd], self._wds[directory] = directory, wd
+            return True
+    def _run(self):
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except OSError:
+                return
+            pos = 0
+            while pos < len(buf):
+                wd, mask, _, length = self.EVENT.unpack_from(buf, pos)
+                name = buf[pos + self.EVENT.size:pos + self.EVENT.size + length].rstrip(b'\0')
+                pos += self.EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    self._overflow()
+                    continue
+                with self._lock:
+                    directory = self._dirs.get(wd)
+                    if mask & self.IN_IGNORED and directory is not None:
+                        del self._dirs[wd], self._wds[directory]
+                if directory is None:
+                    continue
+                if name:
+                    self._callback(os.path.join(directory, os.fsdecode(name)))
+                else:
+                    # ディレクトリ自体が消えた・移動した
+                    self._callback(directory, prefix=True)
+
+class CachedFile:
+    """キャッシュ済みファイルの本文・stat・ETag・圧縮版"""
+    __slots__ = ('st', 'body', 'digest', 'variants')
+    def __init__(self, st, body):
+        self.st, self.body = st, body
+        self.digest = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {}
+    @property
+    def nbytes(self):
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+class FileCache:
+    """ファイル本文とメタ情報をメモリに保持するLRUキャッシュ。合計バイト数が上限を超えたら古いものから捨てる
+
+    inotify が使えればファイルの変更通知で無効化し、ヒット時には stat もしない。
+    使えなければヒットのたびに (サイズ, 更新日時) を比べて無効化する。
+    """
+    def __init__(self, max_bytes, max_file_bytes, use_inotify=True):
+        self.max_bytes, self.max_file_bytes = max_bytes, max_file_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'invalidations': 0}
+        self._watcher = InotifyWatcher.create(self.invalidate, self.clear) if use_inotify else None
+    @property
+    def invalidation(self):
+        return 'inotify' if self._watcher else 'mtime'
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+        if entry is not None and self._watcher is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is None or (st.st_size, st.st_mtime_ns) != (entry.st.st_size, entry.st.st_mtime_ns):
+                self.invalidate(path)
+                with self._lock:
+                    self.counters['stale'] += 1
+                entry = None
+        with self._lock:
+            self.counters['hits' if entry is not None else 'misses'] += 1
+        return entry
+    def load(self, path, st):
+        """ファイルを読み込んでキャッシュする。大きすぎるファイルは None (呼び出し側がディスクから配信する)"""
+        if st.st_size > self.max_file_bytes:
+            return None
+        # 監視を先に始めることで、読み込み中の変更も通知で拾える
+        if self._watcher is not None and not self._watcher.watch(os.path.dirname(path)):
+            return None
+        with open(path, 'rb') as f:
+            body = f.read()
+        if len(body) != st.st_size:
+            return None
+        entry = CachedFile(st, body)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[path] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+        return entry
+    def add_variant(self, path, entry, encoding, data):
+        with self._lock:
+            if encoding in entry.variants:
+                return
+            entry.variants[encoding] = data
+            if self._entries.get(path) is entry:
+                self._bytes += len(data)
+                self._evict()
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.counters['evictions'] += 1
+    def invalidate(self, path, prefix=False):
+        with self._lock:
+            if prefix:
+                paths = [p for p in self._entries if p.startswith(path + os.sep)]
+            else:
+                paths = [path] if path in self._entries else []
+            for p in paths:
+                self._bytes -= self._entries.pop(p).nbytes
+                self.counters['invalidations'] += 1
+    def clear(self):
+        with self._lock:
+            self.counters['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                        hit_ratio=round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+                        invalidation=self.invalidation)
+
+class RenderCache:
+    """.txt 原稿をルビ・傍点のHTMLに変換した結果を、原稿の内容ハッシュごとに保持するLRUキャッシュ
+
+    原稿が変わればハッシュも変わるため、古い結果が返ることはない (古い結果はLRUで捨てられる)。"""
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> {符号化: バイト列}
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'errors': 0}
+    def render(self, digest, body, encoding=None):
+        """変換結果(encodingで圧縮したもの)を返す。rbem-fast.js が例外になる原稿は RbEmFastError"""
+        with self._lock:
+            variants = self._entries.get(digest)
+            if variants is not None:
+                self._entries.move_to_end(digest)
+            self.counters['hits' if variants is not None else 'misses'] += 1
+        if variants is None:
+            try:
+                variants = {None: RbEmFast.parse(body.decode('utf-8')).encode('utf-8')}
+            except (UnicodeDecodeError, RbEmFastError):
+                with self._lock:
+                    self.counters['errors'] += 1
+                raise RbEmFastError('cannot render manuscript')
+            with self._lock:
+                self._entries[digest] = variants
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        data = variants.get(encoding)
+        if data is None:
+            data = brotli.compress(variants[None]) if 'br' == encoding else gzip.compress(variants[None], compresslevel=6, mtime=0)
+            variants[encoding] = data
+        return data
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=sum(len(v) for e in self._entries.values() for v in e.values()))
+
+def etag_matches(header, etag):
+    """If-None-Match の弱い比較 (W/ の有無は区別しない)"""
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+def parse_range(header, size):
+    """Range: bytes=開始-終了 を (開始, 終了) にする。複数範囲や書式違いは None (全体を返す)
+
+    満たせない範囲は 開始 >= size の組で返す。"""
+    unit, _, spec = header.partition('=')
+    first, sep, last = spec.strip().partition('-')
+    if unit.strip().lower() != 'bytes' or ',' in spec or not sep:
+        return None
+    first, last = first.strip(), last.strip()
+    if not first:
+        # bytes=-N は末尾Nバイト
+        if not last.isdigit():
+            return None
+        n = int(last)
+        return (max(0, size - n), size - 1) if n else (size, size - 1)
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start, end = int(first), int(last) if last else size - 1
+    if start >= size:
+        return size, size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+def if_range_matches(header, etag, st):
+    """If-Range が現在の版と一致するか。ETagは強い比較、日付は秒単位で完全一致のときだけ"""
+    header = header.strip()
+    if header.startswith(('"', 'W/')):
+        return header == etag
+    try:
+        date = email.utils.parsedate_to_datetime(header)
+    except (TypeError, IndexError, OverflowError, ValueError):
+        return False
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp()) == int(st.st_mtime)
+
+# サーバの統計を返すパス
+STATS_PREFIX = '/__stats__/'
+# 先読みの Link ヘッダを付けるページ (docs/NN/index.html)
+PAGE_RE = re.compile(r'^/(\d+)/(?:index\.html)?$')
+
+def parse_accept_encoding(header):
+    """Accept-Encoding を {符号化名: q値} にする"""
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+# 1リクエスト分の計測値 (秒)。handshake は接続の最初のリクエストにだけ付く
+RequestRecord = namedtuple('RequestRecord', 'client date requestline path status bytes cache handshake parse read send total')
+PHASES = ('handshake', 'parse', 'read', 'send', 'total')
+# ヒストグラムの上限値 (秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def prefix_of(path):
+    """集計単位のパス接頭辞 (/26/js/a.js -> /26/、/index.html -> /)"""
+    path = (path or '').split('?', 1)[0]
+    head, sep, _ = path.lstrip('/').partition('/')
+    return f'/{head}/' if sep else '/'
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum, self.count = 0.0, 0
+    def observe(self, seconds):
+        i = 0
+        while i < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+    def quantile(self, q):
+        """バケットの上限値で近似した分位点 (秒)。最後の上限値を超えるバケットに入る場合は None (JSON の null)"""
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+        return 0.0
+    def quantile_ms(self, q):
+        seconds = self.quantile(q)
+        return None if seconds is None else seconds * 1000
+    def to_dict(self):
+        return {'count': self.count, 'sum_ms': round(self.sum * 1000, 3),
+                'p50_ms': self.quantile_ms(0.5), 'p90_ms': self.quantile_ms(0.9), 'p99_ms': self.quantile_ms(0.99),
+                'buckets_ms': dict(zip([str(b * 1000) for b in LATENCY_BUCKETS] + ['+Inf'], self.counts))}
+
+class RequestMetrics:
+    """パス接頭辞ごとに、処理段階別の応答時間ヒストグラムと、ステータス・バイト数・キャッシュ結果の件数を集計する"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (prefix, phase) -> Histogram
+        self._requests = {}    # (prefix, status) -> 件数
+        self._bytes = {}       # prefix -> バイト数
+        self._cache = {}       # 結果 -> 件数
+        self.handshake_errors = 0
+    def observe(self, record):
+        prefix = prefix_of(record.path)
+        with self._lock:
+            for phase in PHASES:
+                seconds = getattr(record, phase)
+                if seconds is not None:
+                    self._histograms.setdefault((prefix, phase), Histogram()).observe(seconds)
+            key = (prefix, record.status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._bytes[prefix] = self._bytes.get(prefix, 0) + record.bytes
+            self._cache[record.cache] = self._cache.get(record.cache, 0) + 1
+    def handshake_failed(self):
+        with self._lock:
+            self.handshake_errors += 1
+    def snapshot(self):
+        with self._lock:
+            prefixes = {}
+            for (prefix, phase), h in sorted(self._histograms.items()):
+                prefixes.setdefault(prefix, {'requests': {}, 'bytes': self._bytes.get(prefix, 0), 'latency': {}})['latency'][phase] = h.to_dict()
+            for (prefix, status), n in sorted(self._requests.items()):
+                prefixes[prefix]['requests'][str(status)] = n
+            return {'prefixes': prefixes, 'cache': dict(self._cache), 'tls_handshake_errors': self.handshake_errors}
+    def prometheus(self, file_cache=None):
+        """Prometheus のテキスト形式"""
+        lines = ['# HELP devserver_request_duration_seconds Request latency by path prefix and phase.',
+                 '# TYPE devserver_request_duration_seconds histogram']
+        with self._lock:
+            for (prefix, phase), h in sorted(self._histograms.items()):
+                labels = f'prefix="{prefix}",phase="{phase}"'
+                cumulative = 0
+                for le, n in zip([repr(b) for b in LATENCY_BUCKETS] + ['+Inf'], h.counts):
+                    cumulative += n
+                    lines.append(f'devserver_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'devserver_request_duration_seconds_sum{{{labels}}} {h.sum:.6f}')
+                lines.append(f'devserver_request_duration_seconds_count{{{labels}}} {h.count}')
+            lines += ['# TYPE devserver_requests_total counter']
+            lines += [f'devserver_requests_total{{prefix="{p}",status="{s}"}} {n}' for (p, s), n in sorted(self._requests.items())]
+            lines += ['# TYPE devserver_response_bytes_total counter']
+            lines += [f'devserver_response_bytes_total{{prefix="{p}"}} {n}' for p, n in sorted(self._bytes.items())]
+            lines += ['# TYPE devserver_cache_lookups_total counter']
+            lines += [f'devserver_cache_lookups_total{{outcome="{k}"}} {n}' for k, n in sorted(self._cache.items())]
+            lines += ['# TYPE devserver_tls_handshake_errors_total counter', f'devserver_tls_handshake_errors_total {self.handshake_errors}']
+        if file_cache is not None:
+            stats = file_cache.stats()
+            lines += ['# TYPE devserver_file_cache_bytes gauge', f"devserver_file_cache_bytes {stats['bytes']}",
+                      '# TYPE devserver_file_cache_entries gauge', f"devserver_file_cache_entries {stats['entries']}"]
+        return '\n'.join(lines) + '\n'
+
+class AccessLog:
+    """アクセスログの書き出しとメトリクスの集計を専用スレッドでまとめて行う。ワーカーはキューに積むだけ"""
+    def __init__(self, stream, metrics, batch_size=256, interval=0.5):
+        self.stream, self.metrics = stream, metrics
+        self.batch_size, self.interval = batch_size, interval
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='access-log', daemon=True)
+        self._thread.start()
+    def submit(self, item):
+        """RequestRecord か、そのまま出力する1行の文字列を積む"""
+        self._queue.put(item)
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+    @staticmethod
+    def format(r):
+        timings = ' '.join(f'{phase}={getattr(r, phase) * 1000:.2f}' for phase in PHASES if getattr(r, phase) is not None)
+        return f'{r.client} - - [{r.date}] "{r.requestline}" {r.status} {r.bytes} {r.cache} {timings}ms\n'
+    def _run(self):
+        while True:
+            try:
+                items = [self._queue.get(timeout=self.interval)]
+            except queue.Empty:
+                continue
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for item in items:
+                if item is None:
+                    continue
+                if isinstance(item, RequestRecord):
+                    self.metrics.observe(item)
+                    item = self.format(item)
+                lines.append(item)
+            if self.stream is not None and lines:
+                try:
+                    self.stream.write(''.join(lines))
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    pass
+            if None in items:
+                return
+
 class CORSRequestHandler (SimpleHTTPRequestHandler):
+    # 持続接続でモジュールごとの接続(TLSハンドシェイク)を省く。Content-Length は全応答で送る
+    protocol_version = 'HTTP/1.1'
+    # ヘッダと本文を別々に送るため、Nagleと遅延ACKが重なると持続接続で応答ごとに約40ms待たされる
+    disable_nagle_algorithm = True
+    _range = None
+
+    def setup(self):
+        # 待機中の持続接続がワーカーを占有し続けないよう、一定時間で切断する
+        self.timeout = getattr(self.server, 'keep_alive_timeout', None)
+        super().setup()
+
     def end_headers (self):
         self.send_header('Access-Control-Allow-Origin', '*')
         SimpleHTTPRequestHandler.end_headers(self)
 
-httpd = socketserver.TCPServer(('localhost', 8000), CORSRequestHandler )
+    parked = False
 
-context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-context.load_cert_chain(certfile='cert.pem', keyfile='key.pem')
+    def handle(self):
+        """持続接続で次のリクエストがまだ届いていなければ、接続を待機させてワーカーを手放す (PooledTLSServer のみ)"""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if hasattr(self.server, 'park') and not self.has_pending_input():
+                self.parked = True
+                return
+            self.handle_one_request()
+
+    def has_pending_input(self):
+        """読み込み済み(バッファ内)か、すぐに読める次のリクエストがあるか"""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return False
+        except OSError:
+            # 切断などは次の handle_one_request で扱う
+            return True
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def resume(self):
+        """待機中の接続に次のリクエストが届いたとき、ワーカーから呼ばれる"""
+        self.parked = False
+        try:
+            self.handle()
+        finally:
+            if not self.parked:
+                self.finish()
+
+    def close_idle(self):
+        self.parked = False
+        self.finish()
+
+    def finish(self):
+        # 待機中は rfile/wfile を閉じない
+        if not self.parked:
+            super().finish()
+
+    def handle_one_request(self):
+        self._timing = None
+        super().handle_one_request()
+        if self._timing is not None:
+            self.submit_record()
+
+    def parse_request(self):
+        # 持続接続で次のリクエストを待つ時間は含めず、リクエスト行を受け取った時点から計る
+        self._timing = {'start': time.perf_counter(), 'read': None, 'send': None}
+        self._status, self._bytes, self._cache = '-', 0, '-'
+        ok = super().parse_request()
+        self._timing['parse'] = time.perf_counter() - self._timing['start']
+        return ok
+
+    def do_GET(self):
+        start = time.perf_counter()
+        f = self.send_head()
+        self._timing['read'] = time.perf_counter() - start
+        if f:
+            try:
+                start = time.perf_counter()
+                self.copyfile(f, self.wfile)
+                self._timing['send'] = time.perf_counter() - start
+            finally:
+                f.close()
+
+    def do_HEAD(self):
+        start = time.perf_counter()
+        f = self.send_head()
+        self._timing['read'] = time.perf_counter() - start
+        if f:
+            f.close()
+
+    def send_header(self, keyword, value):
+        if 'content-length' == keyword.lower():
+            self._bytes = int(value)
+        super().send_header(keyword, value)
+
+    def submit_record(self):
+        """計測値をアクセスログに積む。TLSハンドシェイクの時間は接続の最初のリクエストに付ける"""
+        log = getattr(self.server, 'access_log', None)
+        if log is None:
+            return
+        handshake = getattr(self.connection, 'handshake_seconds', None)
+        if handshake is not None:
+            self.connection.handshake_seconds = None
+        t = self._timing
+        log.submit(RequestRecord(self.address_string(), self.log_date_time_string(), self.requestline,
+                                 getattr(self, 'path', ''), self._status, self._bytes if 'HEAD' != self.command else 0,
+                                 self._cache, handshake, t.get('parse'), t['read'], t['send'], time.perf_counter() - t['start']))
+
+    def log_request(self, code='-', size='-'):
+        # 1行の出力はリクエストの処理後に submit_record でまとめて行う
+        self._status = code.value if isinstance(code, HTTPStatus) else code
+        if getattr(self.server, 'access_log', None) is None:
+            super().log_request(code, size)
+
+    def log_message(self, format, *args):
+        log = getattr(self.server, 'access_log', None)
+        if log is None:
+            return super().log_message(format, *args)
+        log.submit(f'{self.address_string()} - - [{self.log_date_time_string()}] {format % args}\n')
+
+    def resolve_file(self):
+        """配信するファイルのパスを返す。リダイレクト・一覧・404など既定の処理に任せる場合はNone"""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self.path.split('?', 1)[0].endswith('/'):
+                return None
+            for index in "index.html", "index.htm":
+                index = os.path.join(path, index)
+                if os.path.isfile(index):
+                    return index
+            return None
+        if path.endswith('/') or not os.path.isfile(path):
+            return None
+        return path
+
+    def choose_encoding(self, ctype, st):
+        """クライアントが受け付ける圧縮形式のうち、使えるものを1つ選ぶ"""
+        store = getattr(self.server, 'compressor', None)
+        if store is None or st.st_size < COMPRESS_MIN_SIZE or not ctype.startswith(COMPRESSIBLE_TYPES):
+            return None
+        accepted = parse_accept_encoding(self.headers.get('Accept-Encoding'))
+        for encoding in store.encodings():
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def is_not_modified(self, st):
+        """If-Modified-Since と更新日時を比べる (SimpleHTTPRequestHandler と同じ判定)"""
+        if "If-Modified-Since" not in self.headers or "If-None-Match" in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        last_modif = datetime.datetime.fromtimestamp(st.st_mtime, datetime.timezone.utc).replace(microsecond=0)
+        return last_modif <= ims
+
+    def send_validators(self, etag, st, encoding):
+        """200/304 の双方で送るキャッシュ関連ヘッダ"""
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control_for(self.path.split('?', 1)[0]))
+        if getattr(self.server, 'compressor', None) is not None:
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+
+    def send_stats(self):
+        """/__stats__/ 以下でサーバの統計をJSONで返す"""
+        name = self.path.split('?', 1)[0][len(STATS_PREFIX):]
+        cache = getattr(self.server, 'file_cache', None)
+        metrics = getattr(self.server, 'metrics', None)
+        stats = {
+            'cache': lambda: cache.stats() if cache else None,
+            'requests': lambda: metrics.snapshot() if metrics else None,
+            'render': lambda: self.server.renders.stats() if getattr(self.server, 'renders', None) else None,
+            'tls': lambda: self.server.ssl_context.session_stats() if getattr(self.server, 'ssl_context', None) else None,
+            'preload': lambda: self.server.preload.stats() if getattr(self.server, 'preload', None) else None,
+        }
+        if 'metrics' == name and metrics is not None:
+            body, ctype = metrics.prometheus(cache).encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        elif name in stats:
+            body, ctype = json.dumps(stats[name](), ensure_ascii=False).encode('utf-8'), 'application/json'
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND, "Unknown stats")
+            return None
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def open_body(self, path, st, encoding, entry):
+        """本文を (ファイルオブジェクト, バイト数) で返す。キャッシュにあればメモリから返す"""
+        if entry is None:
+            f = open(self.server.compressor.variant(path, st, encoding) if encoding else path, 'rb')
+            return f, os.fstat(f.fileno()).st_size
+        data = entry.body
+        if encoding:
+            data = entry.variants.get(encoding)
+            if data is None:
+                with open(self.server.compressor.variant(path, st, encoding), 'rb') as f:
+                    data = f.read()
+                self.server.file_cache.add_variant(path, entry, encoding, data)
+        return io.BytesIO(data), len(data)
+
+    def copyfile(self, source, outputfile):
+        """本文(Range指定時はその範囲)を CHUNK_SIZE ずつ送る"""
+        start, length = self._range or (0, None)
+        if isinstance(source, io.BytesIO):
+            view = memoryview(source.getvalue())[start:None if length is None else start + length]
+            for pos in range(0, len(view), CHUNK_SIZE):
+                outputfile.write(view[pos:pos + CHUNK_SIZE])
+            return
+        if not isinstance(self.connection, ssl.SSLSocket):
+            # 平文の接続ならカーネル内でコピーする
+            outputfile.flush()
+            self.connection.sendfile(source, start, length)
+            return
+        source.seek(start)
+        buf = memoryview(bytearray(CHUNK_SIZE))
+        while length is None or length > 0:
+            n = source.readinto(buf if length is None else buf[:min(CHUNK_SIZE, length)])
+            if not n:
+                break
+            outputfile.write(buf[:n])
+            if length is not None:
+                length -= n
+
+    def preload_links(self):
+        """docs/NN/index.html なら、ページが読み込むCSS・モジュールを先読みさせる Link ヘッダの値を返す"""
+        preload = getattr(self.server, 'preload', None)
+        m = PAGE_RE.match(urlsplit(self.path).path)
+        if preload is None or m is None:
+            return None
+        try:
+            return ', '.join(preload.links(m.group(1))) or None
+        except OSError:
+            return None
+
+    def send_early_hints(self, links):
+        """本文を用意する前に 103 Early Hints で Link を送り、ブラウザにモジュールの取得を始めさせる"""
+        if self.request_version < 'HTTP/1.1':
+            return
+        self.send_response_only(HTTPStatus.EARLY_HINTS)
+        self.send_header('Link', links)
+        self.end_headers()
+
+    def render_requested(self, path):
+        """.txt 原稿に ?render=rbem が付いていれば、サーバ側でHTMLに変換して返す"""
+        renders = getattr(self.server, 'renders', None)
+        return renders is not None and path.endswith('.txt') and ['rbem'] == parse_qs(urlsplit(self.path).query).get('render')
+
+    def send_rendered(self, path):
+        """原稿を rbem-fast.js と同じHTMLに変換して返す。変換結果は原稿の内容ハッシュでキャッシュする"""
+        cache = getattr(self.server, 'file_cache', None)
+        try:
+            entry = cache.get(path) if cache is not None else None
+            self._cache = 'hit' if entry is not None else 'bypass'
+            if entry is None:
+                st = os.stat(path)
+                entry = cache.load(path, st) if cache is not None else None
+                self._cache = 'miss' if entry is not None else 'bypass'
+            if entry is not None:
+                st, body, digest = entry.st, entry.body, entry.digest
+            else:
+                with open(path, 'rb') as f:
+                    body = f.read()
+                digest = hashlib.sha1(body).hexdigest()[:20]
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        encoding = self.choose_encoding('text/html', st)
+        etag = self.server.etags.format(f'{digest}-rbem', encoding)
+        inm = self.headers.get("If-None-Match")
+        if inm is not None and etag_matches(inm, etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validators(etag, st, encoding)
+            self.end_headers()
+            return None
+        try:
+            data = self.server.renders.render(digest, body, encoding)
+        except RbEmFastError:
+            self.send_error(HTTPStatus.UNPROCESSABLE_ENTITY, "Cannot render manuscript")
+            return None
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_validators(etag, st, encoding)
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def send_head(self):
+        self._range = None
+        if self.path.startswith(STATS_PREFIX):
+            return self.send_stats()
+        path = self.resolve_file()
+        if path is None:
+            return super().send_head()
+        if self.render_requested(path):
+            return self.send_rendered(path)
+        links = self.preload_links()
+        if links and getattr(self.server, 'early_hints', False):
+            self.send_early_hints(links)
+        ctype = self.guess_type(path)
+        cache = getattr(self.server, 'file_cache', None)
+        try:
+            entry = cache.get(path) if cache is not None else None
+            self._cache = 'hit' if entry is not None else 'bypass'
+            st = entry.st if entry is not None else os.stat(path)
+            if entry is None and cache is not None:
+                entry = cache.load(path, st)
+                self._cache = 'miss' if entry is not None else 'bypass'
+            range_header = self.headers.get("Range")
+            # 範囲は元ファイルのバイト位置で指定されるため、Range付きの要求には圧縮しない版を返す
+            encoding = None if range_header else self.choose_encoding(ctype, st)
+            etag = self.server.etags.format(entry.digest, encoding) if entry is not None else self.server.etags.etag(path, st, encoding)
+            inm = self.headers.get("If-None-Match")
+            if (inm is not None and etag_matches(inm, etag)) or self.is_not_modified(st):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_validators(etag, st, encoding)
+                self.end_headers()
+                return None
+            f, length = self.open_body(path, st, encoding, entry)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        byte_range = None
+        if range_header and ("If-Range" not in self.headers or if_range_matches(self.headers["If-Range"], etag, st)):
+            byte_range = parse_range(range_header, length)
+        try:
+            if byte_range is not None and byte_range[0] >= length:
+                f.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{length}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            if byte_range is not None:
+                start, end = byte_range
+                self._range = (start, end - start + 1)
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{length}")
+                length = end - start + 1
+            else:
+                self.send_response(HTTPStatus.OK)
+            self.send_header("Content-type", ctype)
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            if links:
+                self.send_header("Link", links)
+            self.send_validators(etag, st, encoding)
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
+
+class TLSMixIn:
+    """受け付けた接続ごとにTLSで包む。ハンドシェイクは受付ループではなく処理側(ワーカー)で行う"""
+    ssl_context = None
+    def get_request(self):
+        sock, addr = super().get_request()
+        if self.ssl_context is None:
+            return sock, addr
+        return self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), addr
+    def finish_request(self, request, client_address):
+        if self.ssl_context is not None:
+            request.settimeout(self.handshake_timeout)
+            start = time.perf_counter()
+            try:
+                request.do_handshake()
+            except (ssl.SSLError, OSError):
+                # 証明書を拒否したブラウザや途中で切断したクライアント。他の接続には影響させない
+                if getattr(self, 'metrics', None) is not None:
+                    self.metrics.handshake_failed()
+                return
+            request.handshake_seconds = time.perf_counter() - start
+            request.settimeout(None)
+        return self.RequestHandlerClass(request, client_address, self)
+
+class SingleTLSServer (TLSMixIn, socketserver.TCPServer):
+    """従来どおり1接続ずつ順番に処理するサーバ (比較用)"""
+    handshake_timeout = 10
+
+class PooledTLSServer (TLSMixIn, socketserver.TCPServer):
+    """固定数のワーカースレッドで接続を並行処理するサーバ
+
+    持続接続が次のリクエストを待つ間はワーカーを占有させず、1本の待機スレッドが selector でまとめて見張る。
+    ブラウザは1ホストに6本ほど接続を張るため、そうしないとワーカー数を超えた接続が待機時間切れまで待たされる。"""
+    handshake_timeout = 10
+    keep_alive_timeout = 5
+    # TCPServer の既定(5)では、接続が集中すると溢れたSYNが再送(1秒後)まで待たされる
+    request_queue_size = 128
+    daemon_threads = True
+    def __init__(self, server_address, RequestHandlerClass, workers=8):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        self._parking = queue.SimpleQueue()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._wakeup_sender = socket.socketpair()
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        super().__init__(server_address, RequestHandlerClass)
+        threading.Thread(target=self._idle_loop, name='keep-alive', daemon=True).start()
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request_worker, request, client_address)
+    def _process_request_worker(self, request, client_address):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            if handler is not None and handler.parked:
+                self.park(handler)
+            else:
+                self.shutdown_request(request)
+    def _resume_worker(self, handler):
+        try:
+            handler.resume()
+        except Exception:
+            handler.parked = False
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            if handler.parked:
+                self.park(handler)
+            else:
+                self.shutdown_request(handler.request)
+    def park(self, handler):
+        """次のリクエストを待つ接続を待機スレッドに渡す"""
+        self._parking.put(handler)
+        try:
+            self._wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+    def _idle_loop(self):
+        deadlines = {}
+        while True:
+            try:
+                events = self._selector.select(timeout=1.0)
+            except (OSError, ValueError):
+                return
+            now = time.monotonic()
+            for key, _ in events:
+                if key.fileobj is self._wakeup:
+                    try:
+                        if not self._wakeup.recv(4096):
+                            return
+                    except OSError:
+                        return
+                    while True:
+                        try:
+                            handler = self._parking.get_nowait()
+                        except queue.Empty:
+                            break
+                        self._selector.register(handler.connection, selectors.EVENT_READ, handler)
+                        deadlines[handler] = now + (self.keep_alive_timeout or float('inf'))
+                else:
+                    # 次のリクエストが届いた(または切断された)接続をワーカーに戻す
+                    self._selector.unregister(key.fileobj)
+                    del deadlines[key.data]
+                    self._pool.submit(self._resume_worker, key.data)
+            for handler, deadline in list(deadlines.items()):
+                if deadline < now:
+                    self._selector.unregister(handler.connection)
+                    del deadlines[handler]
+                    handler.close_idle()
+                    self.shutdown_request(handler.request)
+    def server_close(self):
+        super().server_close()
+        self._wakeup_sender.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+def make_ssl_context(certfile, keyfile, tickets=2):
+    """サーバ全体で使い回すTLSコンテキスト。再接続時のハンドシェイクを省略できるよう調整する"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+    # TLS1.2 では ECDHE + AEAD だけを使う (ECDSA/RSA どちらの証明書でも可)
+    context.set_ciphers('ECDHE+AESGCM:ECDHE+CHACHA20')
+    # 鍵交換のグループは既定 (X25519 が先頭) のままにする。set_ecdh_curve は OpenSSL 3 では TLS1.3 のグループも
+    # P-256 だけに絞るため、X25519 を先に送るブラウザに HelloRetryRequest の往復が1回増える
+    # セッションチケット(TLS1.3/1.2)とサーバ側セッションキャッシュで、再接続したブラウザは短縮ハンドシェイクで済む
+    if tickets:
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
+
+def make_server(args):
+    """コマンドライン引数に応じたサーバを生成する"""
+    socketserver.TCPServer.allow_reuse_address = True
+    if 'single' == args.mode:
+        httpd = SingleTLSServer((args.host, args.port), CORSRequestHandler)
+    else:
+        httpd = PooledTLSServer((args.host, args.port), CORSRequestHandler, workers=args.workers)
+    if not args.no_tls:
+        httpd.ssl_context = make_ssl_context(args.cert, args.key, args.tls_tickets)
+    httpd.compressor = None if args.no_compress else PrecompressedStore(args.compress_cache)
+    httpd.etags = ETagStore()
+    httpd.keep_alive_timeout = args.keep_alive_timeout or None
+    httpd.metrics = RequestMetrics()
+    httpd.renders = None if args.no_render else RenderCache(args.render_cache)
+    stream = None if 'none' == args.access_log else sys.stderr if '-' == args.access_log else open(args.access_log, 'a', encoding='utf-8')
+    httpd.access_log = AccessLog(stream, httpd.metrics)
+    httpd.preload = None if args.no_preload else PreloadManifest(os.getcwd(), None if 'none' == args.preload_cache else args.preload_cache)
+    httpd.early_hints = args.early_hints
+    httpd.file_cache = None if 0 == args.cache_size else FileCache(args.cache_size * 1024 * 1024, args.cache_max_file * 1024, use_inotify=not args.no_inotify)
+    return httpd
+
+def compression_report(root, store):
+    """配信ツリー全体で、圧縮により転送量がどれだけ減るかを表示する"""
+    handler = CORSRequestHandler.__new__(CORSRequestHandler)
+    totals = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            if st.st_size < COMPRESS_MIN_SIZE or not handler.guess_type(path).startswith(COMPRESSIBLE_TYPES):
+                continue
+            ext = os.path.splitext(name)[1] or name
+            row = totals.setdefault(ext, [0, 0] + [0] * len(store.encodings()))
+            row[0] += 1
+            row[1] += st.st_size
+            for i, encoding in enumerate(store.encodings()):
+                row[2 + i] += os.path.getsize(store.variant(path, st, encoding))
+    header = ' '.join(f'{e:>12}' for e in store.encodings())
+    print(f"{'拡張子':<8}{'件数':>6}{'元サイズ':>12} {header}")
+    grand = [0] * (2 + len(store.encodings()))
+    for ext, row in sorted(totals.items(), key=lambda kv: -kv[1][1]):
+        grand = [a + b for a, b in zip(grand, row)]
+        print(f"{ext:<10}{row[0]:>6}{row[1]:>14,} " + ' '.join(f'{v:>12,}' for v in row[2:]))
+    saved = ' '.join(f'{e}: -{100 - v * 100 / grand[1]:.1f}%' for e, v in zip(store.encodings(), grand[2:])) if grand[1] else ''
+    print(f"{'合計':<8}{grand[0]:>6}{grand[1]:>14,} " + ' '.join(f'{v:>12,}' for v in grand[2:]) + f"  ({saved})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='docs/ をHTTPSで配信するローカル開発サーバ')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mode', choices=('pool', 'single'), default='pool', help='pool: ワーカースレッドで並行処理 / single: 従来の1接続ずつの処理')
+    parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4), help='poolモードのワーカースレッド数')
+    parser.add_argument('--cert', default='cert.pem')
+    parser.add_argument('--key', default='key.pem')
+    parser.add_argument('--no-tls', action='store_true', help='TLSを使わずHTTPで配信する')
+    parser.add_argument('--tls-tickets', type=int, default=2, help='TLS1.3で1回のハンドシェイクごとに発行するセッションチケット数 (0でチケットを使わない)')
+    parser.add_argument('--no-compress', action='store_true', help='gzip/brotliによる圧縮配信をしない')
+    parser.add_argument('--compress-cache', default='.compress_cache', help='圧縮版ファイルの保存先')
+    parser.add_argument('--keep-alive-timeout', type=float, default=5, help='持続接続を待機させておく秒数 (0で無制限)')
+    parser.add_argument('--access-log', default='-', help="アクセスログの出力先 ('-'で標準エラー、'none'で出力しない。集計は常に行う)")
+    parser.add_argument('--cache-size', type=int, default=64, help='ファイル本文をメモリに保持する上限 (MB, 0で無効)')
+    parser.add_argument('--cache-max-file', type=int, default=1024, help='メモリに保持するファイル1つの上限 (KB)')
+    parser.add_argument('--no-inotify', action='store_true', help='inotifyを使わず、毎回更新日時を確認してキャッシュを無効化する')
+    parser.add_argument('--no-render', action='store_true', help='.txt?render=rbem によるサーバ側のルビ・傍点変換をしない')
+    parser.add_argument('--render-cache', type=int, default=64, help='変換結果を保持する原稿数')
+    parser.add_argument('--no-preload', action='store_true', help='docs/NN/index.html にモジュール先読みの Link ヘッダを付けない')
+    parser.add_argument('--preload-cache', default='.module_graph_cache.json', help="import の走査結果の保存先 ('none'で保存しない)")
+    parser.add_argument('--early-hints', action='store_true', help='Link ヘッダを 103 Early Hints でも先に送る (1xx を解釈できないクライアントがあるため既定は無効)')
+    parser.add_argument('--compression-report', action='store_true', help='配信ツリーの圧縮による転送量の削減を表示して終了する')
+    return parser.parse_args(argv)
 
-httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compression_report:
+        compression_report('.', PrecompressedStore(args.compress_cache))
+        return
+    httpd = make_server(args)
+    scheme = 'http' if args.no_tls else 'https'
+    workers = f' ({args.workers} workers)' if 'pool' == args.mode else ''
+    print(f"Serving {scheme.upper()} on {scheme}://{args.host}:{args.port}{workers}")
+    if httpd.file_cache is not None:
+        print(f"File cache: {args.cache_size} MB ({httpd.file_cache.invalidation})")
+    print(f"Stats: {STATS_PREFIX}requests (JSON), {STATS_PREFIX}metrics (Prometheus), {STATS_PREFIX}cache, {STATS_PREFIX}render, {STATS_PREFIX}tls, {STATS_PREFIX}preload")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        httpd.access_log.close()
+        if httpd.file_cache is not None:
+            print(f"File cache: {httpd.file_cache.stats()}")
 
-print("Serving HTTPS on https://localhost:8000")
-httpd.serve_forever()
+if __name__ == '__main__':
+    main()
 
 '''
 import ssl